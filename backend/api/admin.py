@@ -33,6 +33,30 @@ class ServiceAdmin(admin.ModelAdmin):
 class AppointmentAdmin(admin.ModelAdmin):
     form = AppointmentAdminForm
 
-    list_display = ('user', 'appointment_date', 'appointment_time', 'is_cancelled', 'is_rescheduled')
+    list_display = ('user', 'appointment_date', 'appointment_time', 'end_time', 'total_price', 'is_cancelled', 'is_rescheduled')
+    list_select_related = ('user',)
+    readonly_fields = ('total_price', 'total_duration', 'end_time', 'payment')
     list_filter = ('appointment_date', 'is_cancelled')
-    search_fields = ('user__full_name', 'user__email')
\ No newline at end of file
+    ordering = ('-appointment_date', '-appointment_time')
+    search_fields = ('user__full_name', 'user__email')
+
+@admin.register(api_models.OutboxEmail)
+class OutboxEmailAdmin(admin.ModelAdmin):
+    list_display = ('subject', 'to', 'status', 'attempts', 'next_attempt_at', 'sent_at')
+    list_filter = ('status',)
+    search_fields = ('to', 'subject')
+    readonly_fields = ('created_at', 'sent_at', 'claim_token')
+
+@admin.register(api_models.VerifiedPayment)
+class VerifiedPaymentAdmin(admin.ModelAdmin):
+    list_display = ('reference', 'provider', 'status', 'verified_at')
+    list_filter = ('provider', 'status')
+    search_fields = ('reference',)
+    readonly_fields = ('provider', 'reference', 'status', 'payload', 'verified_at')
+
+@admin.register(api_models.WebhookEvent)
+class WebhookEventAdmin(admin.ModelAdmin):
+    list_display = ('event_id', 'provider', 'event_type', 'status', 'received_at', 'processed_at')
+    list_filter = ('provider', 'status', 'event_type')
+    search_fields = ('event_id',)
+    readonly_fields = ('provider', 'event_id', 'event_type', 'payload', 'received_at', 'processed_at', 'claim_token', 'last_error')
@@ -0,0 +1,146 @@
+"""
+Async variants of the payment and login endpoints, for running under ASGI (backend/asgi.py).
+
+While the gateway round-trip or the password hash is in flight the event
+loop serves other requests, instead of a worker thread blocking on it.
+Responses match the sync views in views.py.
+"""
+import json
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.contrib import auth
+from django.http import JsonResponse
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework.exceptions import AuthenticationFailed
+
+from . import models as api_models
+from . import passwords
+from .authentication import ClaimsJWTAuthentication
+from .payments import paystack, stripe_checkout, verification
+from .payments.client import GatewayError
+
+FRONTEND_URL = "https://fe819b7542bd.ngrok-free.app"
+
+
+def jwt_required(handler):
+    """Authenticate the bearer token like the DRF views do; the user lookup runs off the event loop."""
+    @wraps(handler)
+    async def wrapper(self, request, *args, **kwargs):
+        try:
+            result = await sync_to_async(ClaimsJWTAuthentication().authenticate)(request)
+        except AuthenticationFailed as e:
+            return JsonResponse(e.detail if isinstance(e.detail, dict) else {'detail': e.detail}, status=401)
+        if result is None:
+            return JsonResponse({'detail': 'Authentication credentials were not provided.'}, status=401)
+        request.user, request.auth = result
+        return await handler(self, request, *args, **kwargs)
+    return wrapper
+
+
+def request_data(request):
+    if request.content_type == 'application/json':
+        try:
+            return json.loads(request.body or b'{}')
+        except ValueError:
+            return {}
+    return request.POST
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class AsyncLoginView(View):
+    query_budget = 3
+
+    async def post(self, request):
+        data = request_data(request)
+        email = data.get('email')
+        password = data.get('password')
+        if not email or not password:
+            return JsonResponse({'detail': 'Email and password required'}, status=400)
+
+        user = await auth.aauthenticate(request, email=email, password=password)
+        refusal = passwords.refusal(user)
+        if refusal:
+            return JsonResponse({'detail': refusal}, status=401)
+
+        tokens = await sync_to_async(user.tokens)()
+        return JsonResponse({'email': user.email, 'full_name': user.full_name, 'tokens': tokens})
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class AsyncInitializePaystackView(View):
+    query_budget = 1
+
+    @jwt_required
+    async def post(self, request):
+        data = request_data(request)
+        email = data.get('email')
+        amount = data.get('amount')  # Naira
+        if not email or not amount:
+            return JsonResponse({"error": "Email and amount required"}, status=400)
+
+        try:
+            response = await paystack.ainitialize_transaction(email, amount, f"{FRONTEND_URL}/verify-payment/")
+        except ValueError:
+            return JsonResponse({"error": "Amount must be a number"}, status=400)
+        except GatewayError:
+            return JsonResponse({"error": "Payment provider unavailable, please try again"}, status=503)
+        res_data = response.json()
+
+        if response.status_code == 200:
+            return JsonResponse(res_data['data'])
+        return JsonResponse(res_data, status=400)
+
+
+class AsyncVerifyPaymentView(View):
+    query_budget = 7
+
+    @jwt_required
+    async def get(self, request):
+        reference = request.GET.get('reference')
+        if not reference:
+            return JsonResponse({"error": "No reference provided"}, status=400)
+
+        try:
+            payment = await verification.averify_paystack(reference)
+        except GatewayError:
+            return JsonResponse({"error": "Payment provider unavailable, please try again"}, status=503)
+
+        if payment.status == api_models.VerifiedPayment.STATUS_SUCCESS:
+            return JsonResponse({"status": "success", "data": payment.payload})
+        return JsonResponse({"status": "failed", "data": payment.payload}, status=400)
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class AsyncInitializeStripePaymentView(View):
+    query_budget = 1
+
+    @jwt_required
+    async def post(self, request):
+        amount = request_data(request).get("amount")
+        if not amount:
+            return JsonResponse({"error": "Amount is required."}, status=400)
+
+        try:
+            checkout_session = await stripe_checkout.acreate_checkout_session(request.user, amount, FRONTEND_URL)
+            return JsonResponse({"checkout_url": checkout_session.url})
+        except Exception as e:
+            return JsonResponse({"error": str(e)}, status=500)
+
+
+class AsyncVerifyStripePaymentView(View):
+    query_budget = 7
+
+    @jwt_required
+    async def get(self, request):
+        session_id = request.GET.get('session_id')
+
+        try:
+            payment = await verification.averify_stripe(session_id)
+            if payment.status == api_models.VerifiedPayment.STATUS_SUCCESS:
+                return JsonResponse({'status': 'success', 'session_id': payment.reference})
+            return JsonResponse({'status': 'failed'}, status=400)
+        except Exception as e:
+            return JsonResponse({'status': 'error', 'message': str(e)}, status=500)
@@ -0,0 +1,80 @@
+"""
+JWT authentication without a ``User`` query per request.
+
+``User.tokens()`` already signs ``email``, ``full_name`` and ``is_staff``
+into every token, so the user can be rebuilt from the verified claims.
+Tokens without those claims (minted elsewhere) fall back to the normal
+database lookup.
+
+Claims are only as fresh as the token (``ACCESS_TOKEN_LIFETIME``). With
+``AUTH_USER_STATE_CHECK`` on, ``is_active`` and ``is_staff`` are also read
+from a short-lived cache entry that every save of the user refreshes, so a
+deactivated account is locked out right away; a cache miss costs one small
+query.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from . import models as api_models
+
+USER_CLAIMS = ('email', 'full_name', 'is_staff')
+
+
+def user_state_key(user_id):
+    return f'auth:user-state:{user_id}'
+
+
+def user_state(user_id):
+    """``(is_active, is_staff)`` for a user, from the cache when possible; None if the user is gone."""
+    key = user_state_key(user_id)
+    state = cache.get(key)
+    if state is None:
+        row = api_models.User.objects.filter(pk=user_id).values_list('is_active', 'is_staff').first()
+        if row is None:
+            return None
+        state = tuple(row)
+        # add, not set: a save that lands meanwhile has already stored the newer state
+        cache.add(key, state, settings.AUTH_USER_STATE_TTL)
+    return state
+
+
+def remember_user_state(user):
+    cache.set(user_state_key(user.pk), (user.is_active, user.is_staff), settings.AUTH_USER_STATE_TTL)
+
+
+def forget_user_state(user_id):
+    cache.delete(user_state_key(user_id))
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    """``JWTAuthentication`` that builds ``request.user`` as a ``ClaimsUser`` from the token."""
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+        if any(claim not in validated_token for claim in USER_CLAIMS):
+            return super().get_user(validated_token)
+
+        is_staff = bool(validated_token['is_staff'])
+        if settings.AUTH_USER_STATE_CHECK:
+            state = user_state(user_id)
+            if state is None:
+                raise AuthenticationFailed(_("User not found"), code="user_not_found")
+            is_active, is_staff = state
+            if not is_active:
+                raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+        user = api_models.ClaimsUser(
+            pk=user_id, email=validated_token['email'], full_name=validated_token['full_name'],
+            is_staff=is_staff, is_active=True,
+        )
+        # it stands for an existing row: related lookups and FK assignment treat it as saved
+        user._state.adding = False
+        user._state.db = 'default'
+        return user
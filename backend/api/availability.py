@@ -0,0 +1,157 @@
+from bisect import bisect_right
+from collections import defaultdict
+from datetime import time, timedelta
+
+from django.conf import settings
+from django.db.models import Sum
+
+from . import models as api_models
+
+
+def to_minutes(value):
+    """Minutes since midnight for a ``time`` or an ``HH:MM`` string."""
+    if isinstance(value, str):
+        value = time.fromisoformat(value)
+    return value.hour * 60 + value.minute
+
+
+def end_minutes(value):
+    """Like ``to_minutes`` but rounds a partial trailing minute up, so the interval covers it."""
+    if value is None:
+        return 0
+    return to_minutes(value) + (1 if value.second or value.microsecond else 0)
+
+
+def format_minutes(minutes):
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+def duration_minutes(duration):
+    if not duration:
+        return 0
+    return -(-int(duration.total_seconds()) // 60)  # round partial minutes up
+
+
+def services_duration(service_ids):
+    """Combined duration in minutes of the requested services; ValueError if one is listed twice."""
+    if not service_ids:
+        return 0
+    if len(set(service_ids)) != len(service_ids):
+        # an appointment holds each service once (see AppointmentSerializer.validate_services)
+        raise ValueError("Each service can be requested once")
+    total = api_models.Service.objects.filter(id__in=service_ids).aggregate(total=Sum('duration'))['total']
+    return duration_minutes(total)
+
+
+class DayAvailability:
+    """
+    Occupancy of a single day held as sorted, merged, non-overlapping
+    ``[start, end)`` intervals in minutes since midnight.
+
+    Building is O(n log n); ``is_free`` is a single bisect, O(log n).
+    """
+
+    def __init__(self, intervals=(), opening=None, closing=None):
+        self.opening = to_minutes(opening or settings.SALON_OPENING_TIME)
+        self.closing = to_minutes(closing or settings.SALON_CLOSING_TIME)
+        self._starts = []
+        self._ends = []
+        self.booked = []
+        for start, end in sorted(i for i in intervals if i[1] > i[0]):
+            if self._ends and start <= self._ends[-1]:
+                self._ends[-1] = max(self._ends[-1], end)
+            else:
+                self._starts.append(start)
+                self._ends.append(end)
+
+    @classmethod
+    def for_date(cls, date, exclude=None, **kwargs):
+        """Load the occupancy for ``date`` with a single query."""
+        queryset = api_models.Appointment.objects.active_on(date)
+        if exclude is not None:
+            queryset = queryset.exclude(pk=exclude)
+        rows = queryset.values_list('appointment_time', 'end_time')
+        intervals = []
+        booked = []
+        for start_time, end_time in rows:
+            intervals.append((to_minutes(start_time), end_minutes(end_time)))
+            booked.append(str(start_time))
+        day = cls(intervals, **kwargs)
+        day.booked = booked
+        return day
+
+    @classmethod
+    def for_range(cls, start, end, **kwargs):
+        """Occupancy of each day from ``start`` to ``end`` inclusive, keyed by date, from a single query."""
+        intervals = defaultdict(list)
+        rows = api_models.Appointment.objects.filter(
+            appointment_date__range=(start, end), is_cancelled=False,
+        ).values_list('appointment_date', 'appointment_time', 'end_time')
+        for day, start_time, end_time in rows:
+            intervals[day].append((to_minutes(start_time), end_minutes(end_time)))
+        days = (start + timedelta(days=offset) for offset in range((end - start).days + 1))
+        return {day: cls(intervals[day], **kwargs) for day in days}
+
+    def __len__(self):
+        return len(self._starts)
+
+    def is_free(self, start, duration):
+        """True if ``[start, start + duration)`` is inside opening hours and unoccupied."""
+        end = start + duration
+        if start < self.opening or end > self.closing:
+            return False
+        return self.is_unoccupied(start, end)
+
+    def is_unoccupied(self, start, end):
+        """True if ``[start, end)`` touches no booking, opening hours aside."""
+        i = bisect_right(self._starts, start)
+        if i and self._ends[i - 1] > start:
+            return False
+        if i < len(self._starts) and self._starts[i] < end:
+            return False
+        return True
+
+    def add(self, start, end):
+        """Mark ``[start, end)`` as occupied, keeping the intervals merged."""
+        if end <= start:
+            return
+        i = bisect_right(self._starts, start)
+        if i and self._ends[i - 1] >= start:
+            i -= 1
+            start = self._starts[i]
+        j = i
+        while j < len(self._starts) and self._starts[j] <= end:
+            end = max(end, self._ends[j])
+            j += 1
+        self._starts[i:j] = [start]
+        self._ends[i:j] = [end]
+
+    def busy_windows(self):
+        return list(zip(self._starts, self._ends))
+
+    def free_windows(self, duration=0):
+        """Gaps within opening hours that are at least ``duration`` minutes long."""
+        windows = []
+        cursor = self.opening
+        for start, end in zip(self._starts, self._ends):
+            if start > cursor and min(start, self.closing) - cursor >= max(duration, 1):
+                windows.append((cursor, min(start, self.closing)))
+            cursor = max(cursor, end)
+        if self.closing - cursor >= max(duration, 1):
+            windows.append((cursor, self.closing))
+        return windows
+
+    def available_slots(self, duration, step=None):
+        """Slot start times, on the booking grid, that can fit ``duration`` minutes."""
+        step = step or settings.BOOKING_SLOT_MINUTES
+        return [
+            start for start in range(self.opening, self.closing, step)
+            if self.is_free(start, max(duration, 1))
+        ]
+
+    def as_dict(self, duration=0):
+        return {
+            'busy': [{'start': format_minutes(s), 'end': format_minutes(e)} for s, e in self.busy_windows()],
+            'free': [{'start': format_minutes(s), 'end': format_minutes(e)} for s, e in self.free_windows(duration)],
+            'available_slots': [format_minutes(s) for s in self.available_slots(duration)],
+        }
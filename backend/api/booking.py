@@ -0,0 +1,51 @@
+from django.db import transaction
+from django.utils import timezone
+from rest_framework import serializers
+
+from . import models as api_models
+
+OVERLAP_MESSAGE = 'This time slot overlaps with an existing appointment.'
+
+
+def lock_day(date):
+    """
+    Serialize bookings for ``date`` until the surrounding transaction ends.
+
+    The lock is a write to the day's ``BookingDayLock`` row: a row lock on
+    PostgreSQL, the database write lock on SQLite. Writing first, before any
+    read in the transaction, keeps SQLite from failing the lock upgrade.
+    """
+    lock_days([date])
+
+
+def lock_days(dates):
+    """
+    ``lock_day`` for many dates at once, in one upsert: it creates the
+    missing rows and writes the others, and a concurrent booking of the same
+    day waits on either.
+    """
+    dates = sorted(set(dates))
+    if not dates:
+        return
+    now = timezone.now()
+    api_models.BookingDayLock.objects.bulk_create(
+        [api_models.BookingDayLock(date=date, locked_at=now) for date in dates],
+        update_conflicts=True, unique_fields=['date'], update_fields=['locked_at'],
+    )
+
+
+def ensure_available(date, start, end, exclude=None):
+    """Raise a ValidationError if ``[start, end)`` on ``date`` intersects a live booking."""
+    overlapping = api_models.Appointment.objects.overlapping(date, start, end)
+    if exclude is not None:
+        overlapping = overlapping.exclude(pk=exclude)
+    if overlapping.exists():
+        raise serializers.ValidationError(OVERLAP_MESSAGE)
+
+
+def reserve(date, start, end, exclude=None):
+    """Lock ``date`` and check the window. Call inside ``transaction.atomic()`` and write before it ends."""
+    if not transaction.get_connection().in_atomic_block:
+        raise RuntimeError('reserve() must be called inside transaction.atomic()')
+    lock_day(date)
+    ensure_available(date, start, end, exclude=exclude)
@@ -0,0 +1,66 @@
+import hashlib
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponseNotModified
+from django.utils.cache import patch_cache_control
+from django.utils.http import parse_etags
+from rest_framework.response import Response
+
+CATALOG_VERSION_KEY = 'catalog:version'
+
+
+def catalog_version():
+    """Opaque token that changes whenever a category or service is saved or deleted."""
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        cache.add(CATALOG_VERSION_KEY, uuid.uuid4().hex, None)
+        version = cache.get(CATALOG_VERSION_KEY)
+    return version
+
+
+def bump_catalog_version():
+    # a fresh token rather than incr(): an evicted counter restarting at 1 could revive stale entries
+    cache.set(CATALOG_VERSION_KEY, uuid.uuid4().hex, None)
+
+
+class CatalogCacheMixin:
+    """
+    Serve GET responses from a cache keyed on the catalog version and the
+    request path. The ETag is derived from the same key, so a matching
+    ``If-None-Match`` is answered with a 304 before touching the database.
+
+    Views using this must not authenticate (the catalog is public), otherwise
+    the user lookup would still hit the database.
+    """
+
+    authentication_classes = []
+
+    def get_catalog_cache_key(self, request):
+        fingerprint = f"{catalog_version()}:{request.build_absolute_uri()}:{request.accepted_renderer.format}"
+        return hashlib.sha256(fingerprint.encode()).hexdigest()[:32]
+
+    def get(self, request, *args, **kwargs):
+        key = self.get_catalog_cache_key(request)
+        etag = f'"{key}"'
+
+        client_etags = parse_etags(request.headers.get('If-None-Match', ''))
+        if etag in client_etags or '*' in client_etags:
+            response = HttpResponseNotModified()
+            response['ETag'] = etag
+            patch_cache_control(response, no_cache=True)
+            return response
+
+        data = cache.get(f'catalog:response:{key}')
+        if data is None:
+            response = super().get(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+            cache.set(f'catalog:response:{key}', response.data, settings.CATALOG_CACHE_TIMEOUT)
+        else:
+            response = Response(data)
+
+        response['ETag'] = etag
+        patch_cache_control(response, no_cache=True)
+        return response
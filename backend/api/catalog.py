@@ -0,0 +1,35 @@
+from collections import defaultdict
+
+from . import models as api_models
+from . import serializers as api_serializers
+
+
+def build_catalog(categories=None, context=None):
+    """
+    Serialize ``categories`` (default: all) with their services in two queries.
+
+    Each service is serialized exactly once. The category summary embedded in
+    every service is built once per category and shared, and the grouped
+    service payloads are handed to ``CategorySerializer`` through its context.
+    Returns ``(categories_data, services_by_category)``.
+    """
+    categories = list(api_models.Category.objects.all() if categories is None else categories)
+    by_id = {category.id: category for category in categories}
+
+    services = list(api_models.Service.objects.filter(category_id__in=by_id).order_by('id'))
+    for service in services:
+        service.category = by_id[service.category_id]  # no per-service category lookup
+
+    context = dict(context or {})
+    context['category_summaries'] = {
+        category.id: api_serializers.ServiceSerializer.category_summary(category) for category in categories
+    }
+    services_data = api_serializers.ServiceSerializer(services, many=True, context=context).data
+
+    services_by_category = defaultdict(list)
+    for service, data in zip(services, services_data):
+        services_by_category[service.category_id].append(data)
+
+    context['services_by_category'] = services_by_category
+    categories_data = api_serializers.CategorySerializer(categories, many=True, context=context).data
+    return categories_data, services_by_category
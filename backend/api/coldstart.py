@@ -0,0 +1,89 @@
+"""
+How long a new worker spends importing the app before it can serve.
+
+``profile()`` starts a fresh interpreter with ``-X importtime``, loads the
+WSGI application and the URLconf (so every view module is imported, as on
+the first request), and returns the time of each module it imported. It is
+what ``manage.py profile_startup`` prints, and what ``--check`` holds to
+``COLD_START_BUDGET_MS``. The test suite only checks that no lazy module is
+imported: a wall-clock budget would fail on a loaded CI machine.
+
+``LAZY_MODULES`` are slow to import and only needed by a few requests (the
+payment SDKs, image processing, schema generation); startup must not
+import them.
+"""
+import json
+import os
+import re
+import subprocess
+import sys
+from collections import defaultdict
+
+from django.conf import settings
+
+LAZY_MODULES = ('stripe', 'httpx', 'PIL', 'drf_yasg.generators')
+
+STARTUP = """
+import json, sys
+from backend.wsgi import application
+from django.urls import get_resolver
+get_resolver().url_patterns
+print(json.dumps(sorted(sys.modules)))
+"""
+
+_IMPORT_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \| ( *)(\S+)$')
+
+
+class ModuleTime:
+    def __init__(self, name, self_us, cumulative_us, depth):
+        self.name = name
+        self.self_ms = self_us / 1000
+        self.cumulative_ms = cumulative_us / 1000
+        self.depth = depth
+
+    @property
+    def package(self):
+        return self.name.partition('.')[0]
+
+
+class StartupProfile:
+    def __init__(self, modules, loaded):
+        self.modules = modules
+        self.loaded = loaded
+
+    @property
+    def total_ms(self):
+        return sum(module.self_ms for module in self.modules)
+
+    def lazy_modules_loaded(self):
+        return [name for name in LAZY_MODULES if name in self.loaded]
+
+    def slowest(self, limit=None):
+        """Modules by their own import time, children excluded."""
+        return sorted(self.modules, key=lambda module: module.self_ms, reverse=True)[:limit]
+
+    def by_package(self, limit=None):
+        """``(package, milliseconds)`` by top-level package, slowest first."""
+        totals = defaultdict(float)
+        for module in self.modules:
+            totals[module.package] += module.self_ms
+        return sorted(totals.items(), key=lambda item: item[1], reverse=True)[:limit]
+
+
+def profile():
+    env = {**os.environ, 'DJANGO_SETTINGS_MODULE': os.environ.get('DJANGO_SETTINGS_MODULE', 'backend.settings')}
+    env.pop('PYTHONPROFILEIMPORTTIME', None)
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', STARTUP],
+        cwd=settings.BASE_DIR, env=env, capture_output=True, text=True, check=False,
+    )
+    if result.returncode:
+        raise RuntimeError(f"The app failed to start:\n{result.stderr[-2000:]}")
+
+    modules = []
+    for line in result.stderr.splitlines():
+        match = _IMPORT_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            modules.append(ModuleTime(name, int(self_us), int(cumulative_us), len(indent) // 2))
+    return StartupProfile(modules, set(json.loads(result.stdout.splitlines()[-1])))
@@ -0,0 +1,43 @@
+import datetime
+
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend
+
+
+class AppointmentFilterBackend(BaseFilterBackend):
+    """
+    Server-side filters for appointment lists:
+    ``date_from`` / ``date_to`` (inclusive, YYYY-MM-DD), ``cancelled`` and ``rescheduled`` (true/false).
+    """
+
+    boolean_params = {'cancelled': 'is_cancelled', 'rescheduled': 'is_rescheduled'}
+    truthy = {'1', 'true', 'yes'}
+    falsy = {'0', 'false', 'no'}
+
+    def filter_queryset(self, request, queryset, view):
+        params = request.query_params
+        date_from = self.parse_date(params, 'date_from')
+        date_to = self.parse_date(params, 'date_to')
+        if date_from:
+            queryset = queryset.filter(appointment_date__gte=date_from)
+        if date_to:
+            queryset = queryset.filter(appointment_date__lte=date_to)
+        for param, field in self.boolean_params.items():
+            value = params.get(param)
+            if value is None or value == '':
+                continue
+            value = value.lower()
+            if value not in self.truthy | self.falsy:
+                raise ValidationError({param: 'Must be true or false'})
+            queryset = queryset.filter(**{field: value in self.truthy})
+        return queryset
+
+    @staticmethod
+    def parse_date(params, name):
+        value = params.get(name)
+        if not value:
+            return None
+        try:
+            return datetime.date.fromisoformat(value)
+        except ValueError:
+            raise ValidationError({name: 'Date must be in YYYY-MM-DD format'})
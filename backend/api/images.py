@@ -0,0 +1,142 @@
+"""
+Resized copies of ``Service.image`` for the catalog.
+
+Each uploaded image gets a thumbnail, a card and a hero derivative, scaled
+to fit within their box (never enlarged) and recompressed as WebP. The
+derivatives are written next to the uploads under a name hashed from the
+original's bytes and the derivative's size and quality, so they can be
+cached forever and a changed image or spec gets new names.
+
+What was made is recorded on ``Service.image_derivatives``: the upload's
+name, its SHA-256 and the derivative paths. An image whose name is the one
+recorded is not read again; a new upload with the same bytes is hashed but
+finds its derivatives already there and is not decoded.
+
+Derivatives are made after a service is saved with a new image (see
+api/signals.py). ``manage.py build_image_derivatives`` backfills the
+existing media on a thread pool; Pillow releases the GIL while it decodes,
+resizes and encodes.
+"""
+import hashlib
+import io
+import logging
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.db.models import Q
+
+from . import models as api_models
+from .cache import bump_catalog_version
+
+logger = logging.getLogger(__name__)
+
+# name: the box the derivative is scaled to fit, largest first so each is resized from the one before
+VARIANTS = {
+    'hero': (1600, 1200),
+    'card': (640, 480),
+    'thumbnail': (160, 160),
+}
+FORMAT = 'WEBP'
+DIRECTORY = 'service-images/derived'
+
+
+def derivative_path(digest, variant):
+    width, height = VARIANTS[variant]
+    spec = f'{digest}:{variant}:{width}x{height}:{FORMAT}:{settings.SERVICE_IMAGE_QUALITY}'
+    name = hashlib.sha256(spec.encode()).hexdigest()[:20]
+    return f'{DIRECTORY}/{name}-{variant}.{FORMAT.lower()}'
+
+
+def derivative_paths(digest):
+    return {variant: derivative_path(digest, variant) for variant in VARIANTS}
+
+
+def is_current(service):
+    """Whether ``image_derivatives`` matches the service's image, without reading the file."""
+    record = service.image_derivatives or {}
+    if not service.image:
+        return not record
+    if record.get('source') != service.image.name:
+        return False
+    # an unreadable upload is recorded with no paths; a changed spec renames every derivative
+    return not record['paths'] or record['paths'] == derivative_paths(record['sha256'])
+
+
+def build(image, force=False):
+    """
+    Make the derivatives of ``image`` (a ``FieldFile``) that are missing, or
+    all of them with ``force``, and return the record for
+    ``image_derivatives``. Touches storage only, not the database.
+    """
+    storage = image.storage
+    with image.open('rb') as source:
+        data = source.read()
+    digest = hashlib.sha256(data).hexdigest()
+    paths = derivative_paths(digest)
+    record = {'source': image.name, 'sha256': digest, 'paths': paths}
+    missing = {variant: path for variant, path in paths.items() if force or not storage.exists(path)}
+    if not missing:
+        return record
+
+    from PIL import Image
+
+    try:
+        rendered = render(data, missing)
+    except (OSError, Image.DecompressionBombError) as exc:
+        logger.warning("Could not make derivatives of %s: %s", image.name, exc)
+        return {**record, 'paths': {}}
+    for variant, content in rendered.items():
+        if storage.exists(missing[variant]):
+            storage.delete(missing[variant])
+        storage.save(missing[variant], ContentFile(content))
+    return record
+
+
+def render(data, variants):
+    """Encoded bytes of each of ``variants`` (names) from the original image bytes."""
+    # Pillow is only needed when an image changes, not by every worker at startup
+    from PIL import Image, ImageOps
+
+    picture = Image.open(io.BytesIO(data))
+    # let the JPEG decoder scale down while it decodes, to no less than the largest box
+    picture.draft('RGB', VARIANTS[next(iter(VARIANTS))])
+    picture = ImageOps.exif_transpose(picture)
+    if picture.mode not in ('RGB', 'RGBA'):
+        picture = picture.convert('RGBA' if picture.has_transparency_data else 'RGB')
+
+    rendered = {}
+    for variant, box in VARIANTS.items():
+        picture.thumbnail(box, Image.Resampling.LANCZOS)
+        if variant in variants:
+            output = io.BytesIO()
+            picture.save(output, FORMAT, quality=settings.SERVICE_IMAGE_QUALITY, method=4)
+            rendered[variant] = output.getvalue()
+    return rendered
+
+
+def save_record(service, record):
+    """Store ``record`` on the service, unless its image was replaced in the meantime."""
+    unchanged = Q(image=service.image.name) if service.image else Q(image='') | Q(image__isnull=True)
+    api_models.Service.objects.filter(unchanged, pk=service.pk).update(image_derivatives=record)
+    service.image_derivatives = record
+    transaction.on_commit(bump_catalog_version)
+
+
+def derive(service, force=False):
+    """Bring the service's derivatives up to date; returns whether anything was done."""
+    if not force and is_current(service):
+        return False
+    save_record(service, build(service.image, force) if service.image else {})
+    return True
+
+
+def urls(service, request=None):
+    """``{variant: url}`` of the service's derivatives, or None before they are made."""
+    paths = (service.image_derivatives or {}).get('paths')
+    if not paths or not is_current(service):
+        return None
+    storage = service.image.storage
+    if request is None:
+        return {variant: storage.url(path) for variant, path in paths.items()}
+    return {variant: request.build_absolute_uri(storage.url(path)) for variant, path in paths.items()}
@@ -0,0 +1,211 @@
+"""
+Bulk import of appointments, for moving bookings over from another system.
+
+Rows are read as a stream (CSV, JSON Lines or a JSON array) and handled in
+chunks of ``APPOINTMENT_IMPORT_BATCH_SIZE``. Each chunk is checked in
+memory: its days are locked and their live bookings loaded with one query
+into a ``DayAvailability`` per day, which accepted rows are added to, so a
+row is refused when it overlaps an existing booking or an earlier row.
+Accepted rows are written with ``bulk_create`` for the appointments and the
+``services`` through table; clients without an account get one with an
+unusable password. No emails are sent; the days' rollups (api/rollups.py)
+are marked stale with each chunk.
+
+A bad row is reported with its row number (the line for CSV, the record for
+JSON) and the rest of the import goes on.
+"""
+import codecs
+import csv
+import json
+import re
+from collections import defaultdict
+from decimal import Decimal
+from datetime import timedelta
+from itertools import chain, islice
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+
+from . import booking, rollups
+from . import models as api_models
+from .availability import DayAvailability, end_minutes, to_minutes
+from .serializers import AppointmentImportRowSerializer
+
+FORMATS = ('csv', 'json')
+
+
+class ImportReport:
+    def __init__(self):
+        self.created = 0
+        self.clients_created = 0
+        self.errors = []
+
+    def fail(self, row, errors):
+        self.errors.append({'row': row, 'errors': errors})
+
+    def as_dict(self):
+        return {
+            'created': self.created,
+            'failed': len(self.errors),
+            'clients_created': self.clients_created,
+            'errors': self.errors,
+        }
+
+
+def decode_lines(chunks, encoding='utf-8-sig'):
+    """Text lines from an iterable of byte lines (an uploaded file), decoded as they arrive."""
+    return codecs.iterdecode(chunks, encoding)
+
+
+def read_rows(lines, fmt):
+    """Yield ``(row_number, record)`` from text lines; ``record`` is a dict, or None for an unreadable row."""
+    if fmt == 'csv':
+        # line 1 is the header
+        for number, row in enumerate(csv.DictReader(lines), start=2):
+            yield number, clean_csv_row(row)
+        return
+
+    lines = iter(lines)
+    first = next((line for line in lines if line.strip()), None)
+    if first is None:
+        return
+    if first.lstrip().startswith('['):
+        # a JSON array can't be parsed piecemeal; JSON Lines is the streaming form
+        try:
+            records = json.loads(first + ''.join(lines))
+        except ValueError:
+            yield 1, None
+            return
+        yield from enumerate(records, start=1)
+        return
+    for number, line in enumerate(chain([first], lines), start=1):
+        try:
+            yield number, json.loads(line)
+        except ValueError:
+            yield number, None
+
+
+def clean_csv_row(row):
+    """Drop empty cells (so optional columns can be left blank) and split ``services`` ("3;7" or "3,7")."""
+    row = {key: value.strip() for key, value in row.items() if key and value and value.strip()}
+    if 'services' in row:
+        row['services'] = [item for item in re.split(r'[;,\s]+', row['services']) if item]
+    return row
+
+
+def chunks(rows, size):
+    rows = iter(rows)
+    while chunk := list(islice(rows, size)):
+        yield chunk
+
+
+def import_appointments(rows, batch_size=None):
+    """Import ``(row_number, record)`` pairs (see ``read_rows``); returns an ``ImportReport``."""
+    report = ImportReport()
+    services = {service.id: service for service in api_models.Service.objects.all()}
+    for chunk in chunks(rows, batch_size or settings.APPOINTMENT_IMPORT_BATCH_SIZE):
+        import_chunk(chunk, services, report)
+    # within a chunk, overlaps are found after the rows that fail validation
+    report.errors.sort(key=lambda error: error['row'])
+    return report
+
+
+def import_chunk(chunk, services, report):
+    candidates = []
+    for number, record in chunk:
+        if not isinstance(record, dict):
+            report.fail(number, {'non_field_errors': ["Row is not a valid JSON object"]})
+            continue
+        serializer = AppointmentImportRowSerializer(data=record, context={'services': services})
+        if serializer.is_valid():
+            candidates.append((number, serializer.validated_data))
+        else:
+            report.fail(number, serializer.errors)
+    if not candidates:
+        return
+
+    with transaction.atomic():
+        days = {row['appointment_date'] for _, row in candidates if not row['is_cancelled']}
+        booking.lock_days(days)
+        occupancy = day_occupancy(days)
+
+        accepted = []
+        for number, row in candidates:
+            appointment = build_appointment(row)
+            if not appointment.is_cancelled:
+                day = occupancy[appointment.appointment_date]
+                start, end = to_minutes(appointment.appointment_time), end_minutes(appointment.end_time)
+                if not day.is_unoccupied(start, end):
+                    report.fail(number, {'non_field_errors': [booking.OVERLAP_MESSAGE]})
+                    continue
+                day.add(start, end)
+            accepted.append((row, appointment))
+        if accepted:
+            write(accepted, report)
+
+
+def day_occupancy(days):
+    """A ``DayAvailability`` of the live bookings on each of ``days``, from one query."""
+    intervals = defaultdict(list)
+    rows = api_models.Appointment.objects.filter(appointment_date__in=days, is_cancelled=False).values_list(
+        'appointment_date', 'appointment_time', 'end_time',
+    )
+    for day, start_time, end_time in rows:
+        intervals[day].append((to_minutes(start_time), end_minutes(end_time)))
+    return {day: DayAvailability(intervals[day]) for day in days}
+
+
+def build_appointment(row):
+    """An unsaved appointment with its totals worked out from the row's services."""
+    appointment = api_models.Appointment(
+        client_phone=row.get('client_phone'),
+        appointment_date=row['appointment_date'],
+        appointment_time=row['appointment_time'],
+        payment_reference=row.get('payment_reference'),
+        is_cancelled=row['is_cancelled'],
+        total_price=sum((service.price for service in row['services']), Decimal('0')),
+        total_duration=sum((service.duration for service in row['services']), timedelta()),
+    )
+    appointment.end_time = appointment.calculate_end_time()
+    return appointment
+
+
+def write(accepted, report):
+    """Create the clients, appointments and service links of a chunk: a handful of queries whatever its size."""
+    names = {}
+    for row, _ in accepted:
+        names.setdefault(row['client_email'], row.get('client_name'))
+    user_ids = dict(api_models.User.objects.filter(email__in=names).values_list('email', 'id'))
+    new_users = [
+        api_models.User(email=email, full_name=name or email.split('@')[0], password=make_password(None))
+        for email, name in names.items() if email not in user_ids
+    ]
+    if new_users:
+        api_models.User.objects.bulk_create(new_users)
+        user_ids.update((user.email, user.id) for user in new_users)
+        report.clients_created += len(new_users)
+
+    references = {appointment.payment_reference for _, appointment in accepted if appointment.payment_reference}
+    payments = {}
+    if references:
+        payments = {
+            payment.reference: payment for payment in api_models.VerifiedPayment.objects.filter(
+                reference__in=references, status=api_models.VerifiedPayment.STATUS_SUCCESS,
+            )
+        }
+
+    for row, appointment in accepted:
+        appointment.user_id = user_ids[row['client_email']]
+        appointment.payment = payments.get(appointment.payment_reference)
+    appointments = api_models.Appointment.objects.bulk_create([appointment for _, appointment in accepted])
+
+    through = api_models.Appointment.services.through
+    through.objects.bulk_create([
+        through(appointment_id=appointment.pk, service_id=service.pk)
+        for (row, _), appointment in zip(accepted, appointments)
+        for service in row['services']
+    ])
+    # bulk_create sends no signals, so the days are marked for the dashboard figures here
+    rollups.mark_stale({appointment.appointment_date for appointment in appointments})
+    report.created += len(appointments)
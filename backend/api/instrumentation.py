@@ -0,0 +1,106 @@
+"""
+Per-request timing: SQL, serializers and outbound HTTP.
+
+``PerformanceMiddleware`` (api/middleware.py) opens a ``RequestMetrics`` for
+each request; code being measured adds to it with ``timed(kind)``. The
+current metrics live in a context variable, so they follow the request into
+``sync_to_async`` threads and are ignored outside a request (management
+commands, workers).
+"""
+import contextvars
+import time
+from contextlib import contextmanager
+
+SQL = 'sql'
+SERIALIZER = 'serializer'
+EXTERNAL = 'external'
+
+_current = contextvars.ContextVar('request_metrics', default=None)
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.durations = {SQL: 0.0, SERIALIZER: 0.0, EXTERNAL: 0.0}
+        self.counts = {SQL: 0, SERIALIZER: 0, EXTERNAL: 0}
+        self._active = set()
+
+    @property
+    def total(self):
+        return time.perf_counter() - self.started
+
+    def add(self, kind, seconds):
+        self.durations[kind] += seconds
+        self.counts[kind] += 1
+
+    def server_timing(self):
+        """Value for the ``Server-Timing`` header, durations in milliseconds."""
+        entries = [
+            f'{SQL};dur={self.durations[SQL] * 1000:.1f};desc="{self.counts[SQL]} queries"',
+            f'{SERIALIZER};dur={self.durations[SERIALIZER] * 1000:.1f}',
+            f'{EXTERNAL};dur={self.durations[EXTERNAL] * 1000:.1f};desc="{self.counts[EXTERNAL]} calls"',
+            f'total;dur={self.total * 1000:.1f}',
+        ]
+        return ', '.join(entries)
+
+
+def current():
+    return _current.get()
+
+
+def start():
+    """Begin collecting for the current request; pass the token to ``stop``."""
+    return _current.set(RequestMetrics())
+
+
+def stop(token):
+    _current.reset(token)
+
+
+@contextmanager
+def timed(kind):
+    """
+    Add the time spent in the block to the current request. Nested blocks of
+    the same kind (a serializer inside a serializer) are counted once.
+    """
+    metrics = _current.get()
+    if metrics is None or kind in metrics._active:
+        yield
+        return
+    metrics._active.add(kind)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics._active.discard(kind)
+        metrics.add(kind, time.perf_counter() - started)
+
+
+def time_sql(execute, sql, params, many, context):
+    """Database execute wrapper, installed on every connection (see ``install_sql_timer``)."""
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.add(SQL, time.perf_counter() - started)
+
+
+def install_sql_timer(sender, connection, **kwargs):
+    """``connection_created`` receiver; runs again when a connection reconnects."""
+    if time_sql not in connection.execute_wrappers:
+        connection.execute_wrappers.append(time_sql)
+
+
+class TimedSerializerMixin:
+    """Count a serializer's validation and representation as serializer time."""
+
+    def run_validation(self, *args, **kwargs):
+        with timed(SERIALIZER):
+            return super().run_validation(*args, **kwargs)
+
+    def to_representation(self, instance):
+        with timed(SERIALIZER):
+            return super().to_representation(instance)
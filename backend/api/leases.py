@@ -0,0 +1,30 @@
+"""
+Work queues kept in a table and drained by workers (the email outbox, the
+payment webhook events).
+
+A queued row is due while its ``status`` is pending and its
+``next_attempt_at`` has passed. ``claim_batch`` leases due rows to one
+worker; the worker clears ``claim_token`` on each row as it settles it.
+"""
+import uuid
+from datetime import timedelta
+
+from django.utils import timezone
+
+
+def claim_batch(model, batch_size, lease_seconds):
+    """
+    Lease up to ``batch_size`` due rows of ``model`` to this worker.
+
+    The lease pushes ``next_attempt_at`` forward and stamps a claim token with
+    one short UPDATE, so no transaction is held open while the batch is worked.
+    Rows from a worker that died mid-batch become due again when the lease expires.
+    """
+    now = timezone.now()
+    due = model.objects.filter(status=model.STATUS_PENDING, next_attempt_at__lte=now)
+    ids = list(due.order_by('next_attempt_at', 'id').values_list('id', flat=True)[:batch_size])
+    if not ids:
+        return []
+    token = uuid.uuid4()
+    due.filter(id__in=ids).update(claim_token=token, next_attempt_at=now + timedelta(seconds=lease_seconds))
+    return list(model.objects.filter(claim_token=token).order_by('id'))
@@ -0,0 +1,350 @@
+"""
+End-to-end load test for the routes in api/urls.py.
+
+Every named route has a request builder in ``ROUTES``. ``run_route`` drives
+one route with the Django test client from a pool of threads and records
+latency, status and the number of SQL queries of each request. The payment
+gateways are served by ``payments.stub.GatewayStub`` and mail goes to the
+locmem backend, so nothing leaves the machine. ``manage.py loadtest`` wraps
+this in a throwaway database and writes JSON results.
+"""
+import asyncio
+import contextvars
+import hashlib
+import hmac
+import json
+import math
+import statistics
+import time
+from collections import Counter, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import date, time as clock_time, timedelta
+from decimal import Decimal
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.test import AsyncClient, Client
+from django.urls import reverse
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from . import models as api_models
+from . import urls as api_urls
+
+PASSWORD = 'Loadtest-pass-123'
+STRIPE_WEBHOOK_SECRET = 'whsec_loadtest'
+# bookings made during a run land from here on, one day per opening-hours' worth of requests
+FIRST_BOOKING_DAY = date(2031, 1, 6)
+# each import request fills one day of its own from here on
+FIRST_IMPORT_DAY = date(2033, 1, 3)
+
+Call = namedtuple('Call', 'method path data headers content_type', defaults=(None, None, None))
+
+
+class Fixture:
+    """Rows and credentials the request builders draw on."""
+
+    def __init__(self, requests_per_route, categories=5, services_per_category=8):
+        self.customer = api_models.User.objects.create_user('Load Customer', 'load-customer@example.com', PASSWORD)
+        self.staff = api_models.User.objects.create_user('Load Staff', 'load-staff@example.com', PASSWORD)
+        self.staff.is_staff = True
+        self.staff.save()
+        self.customer_auth = {'Authorization': f"Bearer {self.customer.tokens()['access']}"}
+        self.staff_auth = {'Authorization': f"Bearer {self.staff.tokens()['access']}"}
+        # refresh tokens rotate and are blacklisted after use, so every refresh needs its own
+        self.refresh_tokens = [str(RefreshToken.for_user(self.customer)) for _ in range(requests_per_route)]
+        self.verify_token = str(RefreshToken.for_user(self.customer).access_token)
+
+        self.categories = []
+        self.services = []
+        for c in range(categories):
+            category = api_models.Category.objects.create(name=f'Load category {c}')
+            self.categories.append(category)
+            for s in range(services_per_category):
+                self.services.append(api_models.Service.objects.create(
+                    name=f'Load service {c}-{s}', category=category, price=Decimal('40.00'), duration=timedelta(minutes=60),
+                ))
+
+        history_day = date(2030, 1, 1)
+        for i in range(40):
+            appointment = api_models.Appointment.objects.create(
+                user=self.customer, appointment_date=history_day + timedelta(days=i), appointment_time=clock_time(10),
+                client_phone='0123456789',
+            )
+            appointment.services.set([self.services[i % len(self.services)]])
+        self.appointment = appointment
+
+    def booking_slot(self, i):
+        """A distinct free hour for the i-th booking: eight bookings a day from 09:00."""
+        return FIRST_BOOKING_DAY + timedelta(days=i // 8), f"{9 + i % 8:02d}:00"
+
+
+def signed_stripe(event):
+    body = json.dumps(event).encode()
+    timestamp = int(time.time())
+    digest = hmac.new(STRIPE_WEBHOOK_SECRET.encode(), f"{timestamp}.".encode() + body, hashlib.sha256).hexdigest()
+    return body, {'Stripe-Signature': f"t={timestamp},v1={digest}"}
+
+
+def signed_paystack(event):
+    body = json.dumps(event).encode()
+    digest = hmac.new(settings.PAYSTACK_SECRET_KEY.encode(), body, hashlib.sha512).hexdigest()
+    return body, {'X-Paystack-Signature': digest}
+
+
+def stripe_webhook(fx, i):
+    body, headers = signed_stripe({'id': f'evt_load_{i}', 'type': 'checkout.session.completed', 'data': {'object': {
+        'id': f'cs_load_{i}', 'payment_status': 'paid', 'status': 'complete', 'amount_total': 4000, 'currency': 'gbp',
+    }}})
+    return Call('post', reverse('stripe-webhook'), body, headers, 'application/json')
+
+
+def paystack_webhook(fx, i):
+    body, headers = signed_paystack({'event': 'charge.success', 'data': {
+        'id': i, 'reference': f'ref_load_{i}', 'status': 'success', 'amount': 400000, 'currency': 'NGN',
+    }})
+    return Call('post', reverse('paystack-webhook'), body, headers, 'application/json')
+
+
+def create_appointment(fx, i):
+    day, start = fx.booking_slot(i)
+    return Call('post', reverse('appointment-create'), {
+        'services': [fx.services[i % len(fx.services)].id], 'appointment_date': day.isoformat(),
+        'appointment_time': start, 'client_phone': '0123456789',
+    }, fx.customer_auth)
+
+
+def import_appointments(fx, i):
+    day = FIRST_IMPORT_DAY + timedelta(days=i)
+    rows = ['client_email,client_name,appointment_date,appointment_time,services']
+    rows += [
+        f'import-client-{slot}@example.com,Import Client {slot},{day.isoformat()},{9 + slot:02d}:00,{fx.services[slot].id}'
+        for slot in range(8)
+    ]
+    upload = SimpleUploadedFile(f'import-{i}.csv', '\n'.join(rows).encode(), content_type='text/csv')
+    return Call('post', reverse('appointment-import'), {'file': upload}, fx.staff_auth)
+
+
+# route name -> builder(fixture, request index) -> Call
+ROUTES = {
+    'token-refresh': lambda fx, i: Call('post', reverse('token-refresh'), {'refresh': fx.refresh_tokens[i]}),
+    'register': lambda fx, i: Call('post', reverse('register'), {
+        'full_name': f'Load User {i}', 'email': f'load-user-{i}@example.com', 'password': PASSWORD, 'password2': PASSWORD,
+    }),
+    'email-verify': lambda fx, i: Call('get', reverse('email-verify'), {'token': fx.verify_token}),
+    'login': lambda fx, i: Call('post', reverse('login'), {'email': fx.customer.email, 'password': PASSWORD}),
+
+    'category-list': lambda fx, i: Call('get', reverse('category-list')),
+    'category-detail': lambda fx, i: Call('get', reverse('category-detail', args=[fx.categories[i % len(fx.categories)].slug])),
+    'service-list': lambda fx, i: Call('get', reverse('service-list')),
+
+    'appointment-create': create_appointment,
+    'my-appointments': lambda fx, i: Call('get', reverse('my-appointments'), None, fx.customer_auth),
+    'appointment-detail': lambda fx, i: Call('get', reverse('appointment-detail', args=[fx.appointment.pk]), None, fx.customer_auth),
+    'appointment-update': lambda fx, i: Call(
+        'patch', reverse('appointment-update', args=[fx.appointment.pk]),
+        json.dumps({'client_phone': f'07{i:09d}'}), fx.customer_auth, 'application/json',
+    ),
+    'admin-appointment-view': lambda fx, i: Call('get', reverse('admin-appointment-view'), None, fx.staff_auth),
+    'appointment-import': import_appointments,
+    'analytics': lambda fx, i: Call('get', reverse('analytics'), None, fx.staff_auth),
+    'availability': lambda fx, i: Call('get', reverse('availability'), {
+        'start': fx.appointment.appointment_date.isoformat(), 'services': str(fx.services[0].id),
+    }, fx.customer_auth),
+    'booked-slots': lambda fx, i: Call('get', reverse('booked-slots'), {
+        'date': fx.appointment.appointment_date.isoformat(), 'services': str(fx.services[0].id),
+    }, fx.customer_auth),
+
+    'paystack-payment': lambda fx, i: Call(
+        'post', reverse('paystack-payment'), {'email': fx.customer.email, 'amount': '40'}, fx.customer_auth,
+    ),
+    'verify-paystack-payment': lambda fx, i: Call(
+        'get', reverse('verify-paystack-payment'), {'reference': f'ref_verify_{i}'}, fx.customer_auth,
+    ),
+    'stripe-payment': lambda fx, i: Call('post', reverse('stripe-payment'), {'amount': '40'}, fx.customer_auth),
+    'verify-stripe-payment': lambda fx, i: Call(
+        'get', reverse('verify-stripe-payment'), {'session_id': f'cs_verify_{i}'}, fx.customer_auth,
+    ),
+
+    'login-async': lambda fx, i: Call(
+        'post', reverse('login-async'), json.dumps({'email': fx.customer.email, 'password': PASSWORD}), None, 'application/json',
+    ),
+    'paystack-payment-async': lambda fx, i: Call(
+        'post', reverse('paystack-payment-async'), json.dumps({'email': fx.customer.email, 'amount': '40'}),
+        fx.customer_auth, 'application/json',
+    ),
+    'verify-paystack-payment-async': lambda fx, i: Call(
+        'get', reverse('verify-paystack-payment-async'), {'reference': f'ref_averify_{i}'}, fx.customer_auth,
+    ),
+    'stripe-payment-async': lambda fx, i: Call(
+        'post', reverse('stripe-payment-async'), json.dumps({'amount': '40'}), fx.customer_auth, 'application/json',
+    ),
+    'verify-stripe-payment-async': lambda fx, i: Call(
+        'get', reverse('verify-stripe-payment-async'), {'session_id': f'cs_averify_{i}'}, fx.customer_auth,
+    ),
+
+    'stripe-webhook': stripe_webhook,
+    'paystack-webhook': paystack_webhook,
+}
+
+
+def uncovered_routes():
+    """Named routes in api/urls.py without a builder here; a new route should get one."""
+    return sorted({pattern.name for pattern in api_urls.urlpatterns} - set(ROUTES))
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def request_kwargs(call):
+    kwargs = {'headers': call.headers or {}}
+    if call.content_type:
+        kwargs['content_type'] = call.content_type
+    return kwargs
+
+
+def send(client, call):
+    return getattr(client, call.method)(call.path, call.data, **request_kwargs(call))
+
+
+async def send_async(client, call):
+    return await getattr(client, call.method)(call.path, call.data, **request_kwargs(call))
+
+
+def run_route(name, fixture, requests, concurrency):
+    """Drive one route; returns its summary dict. Async views are driven over ASGI, the rest over WSGI."""
+    build = ROUTES[name]
+    calls = [build(fixture, i) for i in range(requests)]
+    if name.endswith('-async'):
+        results, wall = asyncio.run(drive_asgi(calls, concurrency))
+    else:
+        results, wall = drive_wsgi(calls, concurrency)
+    return summarize(name, calls[0], results, wall)
+
+
+def drive_wsgi(calls, concurrency):
+    counter = QueryCounter()
+
+    def one(call):
+        client = Client()
+        queries = [0]
+        _query_count.set(queries)
+        started = time.perf_counter()
+        response = send(client, call)
+        elapsed = time.perf_counter() - started
+        # each worker thread has its own connection; don't let them pile up past the run
+        connections.close_all()
+        return elapsed, response.status_code, queries[0]
+
+    with counter.installed():
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            results = list(pool.map(one, calls))
+        return results, time.perf_counter() - started
+
+
+_query_count = contextvars.ContextVar('loadtest_query_count')
+
+
+class QueryCounter:
+    """
+    Execute wrapper counting each query into the request's list in
+    ``_query_count``, on the connections opened while it is installed. The
+    queries a connection runs to set itself up come before
+    ``connection_created`` and are not counted.
+    """
+
+    def __init__(self):
+        # connection -> the DB-API connection it had once set up
+        self.ready = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        counter = _query_count.get(None)
+        db = context['connection']
+        if counter is not None and self.ready.get(db) is db.connection:
+            counter[0] += 1
+        return execute(sql, params, many, context)
+
+    def install(self, sender, connection, **kwargs):
+        """``connection_created`` receiver; runs again when a connection reconnects."""
+        if self not in connection.execute_wrappers:
+            connection.execute_wrappers.append(self)
+        self.ready[connection] = connection.connection
+
+    @contextmanager
+    def installed(self):
+        connection_created.connect(self.install)
+        try:
+            yield self
+        finally:
+            connection_created.disconnect(self.install)
+            for db in self.ready:
+                if self in db.execute_wrappers:
+                    db.execute_wrappers.remove(self)
+
+
+async def drive_asgi(calls, concurrency):
+    """
+    Requests in flight on one event loop. The ASGI handler gives each request
+    its own sync_to_async thread (and so database connection), so queries are
+    counted by a ``QueryCounter`` on every connection opened during the run
+    and attributed to requests through a context variable, which
+    sync_to_async carries into those threads.
+    """
+    client = AsyncClient()
+    gate = asyncio.Semaphore(concurrency)
+    counter = QueryCounter()
+
+    async def one(call):
+        async with gate:
+            queries = [0]
+            _query_count.set(queries)
+            started = time.perf_counter()
+            response = await send_async(client, call)
+            return time.perf_counter() - started, response.status_code, queries[0]
+
+    try:
+        with counter.installed():
+            started = time.perf_counter()
+            results = await asyncio.gather(*(one(call) for call in calls))
+            return results, time.perf_counter() - started
+    finally:
+        # the handler's threads are done with these; close them here, or SQLite's WAL outlives the run
+        await sync_to_async(close_connections)(list(counter.ready))
+
+
+def close_connections(opened):
+    """Close connections that other, finished threads opened."""
+    for opened_connection in opened:
+        opened_connection.inc_thread_sharing()
+        try:
+            opened_connection.close()
+        finally:
+            opened_connection.dec_thread_sharing()
+
+
+def summarize(name, call, results, wall):
+    latencies = sorted(elapsed * 1000 for elapsed, _, _ in results)
+    statuses = Counter(status for _, status, _ in results)
+    return {
+        'route': name,
+        'method': call.method.upper(),
+        'path': call.path,
+        'requests': len(results),
+        'errors': sum(count for status, count in statuses.items() if status >= 400),
+        'status_codes': {str(status): count for status, count in sorted(statuses.items())},
+        'rps': round(len(results) / wall, 2) if wall else None,
+        'p50_ms': round(percentile(latencies, 50), 2),
+        'p95_ms': round(percentile(latencies, 95), 2),
+        'p99_ms': round(percentile(latencies, 99), 2),
+        'mean_ms': round(statistics.fmean(latencies), 2),
+        'queries_per_request': round(statistics.fmean(queries for _, _, queries in results), 2),
+    }
@@ -0,0 +1,38 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+
+class QueueWorkerCommand(BaseCommand):
+    """
+    A worker draining a queue (api/leases.py) one batch at a time until
+    nothing is due, or for good with ``--loop``. Subclasses name the counts
+    ``run_batch`` returns in ``outcomes``.
+    """
+    outcomes = ()
+    summary = "Queue drained"
+    batch_size_help = "Rows per batch"
+    loop_help = "Keep polling instead of exiting when nothing is due"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None, help=self.batch_size_help)
+        parser.add_argument('--loop', action='store_true', help=self.loop_help)
+        parser.add_argument('--interval', type=float, default=5.0, help="Seconds to sleep between polls when idle")
+
+    def run_batch(self, batch_size):
+        """Work one batch; returns a count for each of ``outcomes``."""
+        raise NotImplementedError
+
+    def handle(self, *args, **options):
+        totals = [0] * len(self.outcomes)
+        while True:
+            counts = self.run_batch(options['batch_size'])
+            totals = [total + count for total, count in zip(totals, counts)]
+            if any(counts):
+                self.stdout.write(', '.join(f"{outcome} {count}" for outcome, count in zip(self.outcomes, counts)))
+                continue
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+        totals = ', '.join(f"{total} {outcome}" for outcome, total in zip(self.outcomes, totals))
+        self.stdout.write(self.style.SUCCESS(f"{self.summary}: {totals}"))
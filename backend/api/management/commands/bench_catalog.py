@@ -0,0 +1,67 @@
+import statistics
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from api import models as api_models
+from api import serializers as api_serializers
+from api.catalog import build_catalog
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark catalog serialization: the per-category serializer path against "
+        "catalog.build_catalog(). Fixture rows are created inside a transaction that is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--categories', type=int, default=50)
+        parser.add_argument('--services', type=int, default=1000, help="Total services, spread across the categories")
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            self.create_fixture(options['categories'], options['services'])
+
+            def naive():
+                categories = api_models.Category.objects.all()
+                return api_serializers.CategorySerializer(categories, many=True).data
+
+            def single_pass():
+                return build_catalog()[0]
+
+            for name, build in (('per-category serializer', naive), ('build_catalog', single_pass)):
+                timings, queries = self.measure(build, options['repeat'])
+                self.stdout.write(
+                    f"{name:<24} median {statistics.median(timings) * 1000:8.1f} ms  "
+                    f"min {min(timings) * 1000:8.1f} ms  queries {queries}"
+                )
+            transaction.set_rollback(True)
+
+    def create_fixture(self, category_count, service_count):
+        prefix = f"bench-{time.time_ns()}"
+        categories = api_models.Category.objects.bulk_create([
+            api_models.Category(name=f"Bench category {i}", slug=f"{prefix}-c{i}") for i in range(category_count)
+        ])
+        api_models.Service.objects.bulk_create([
+            api_models.Service(
+                name=f"Bench service {i}", slug=f"{prefix}-s{i}", price=Decimal('25.00'),
+                duration=timedelta(minutes=30), category=categories[i % category_count],
+            )
+            for i in range(service_count)
+        ], batch_size=500)
+
+    def measure(self, build, repeat):
+        timings = []
+        queries = 0
+        for _ in range(repeat):
+            with CaptureQueriesContext(connection) as ctx:
+                start = time.perf_counter()
+                build()
+                timings.append(time.perf_counter() - start)
+            queries = len(ctx.captured_queries)
+        return timings, queries
@@ -0,0 +1,104 @@
+import asyncio
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.test import AsyncClient, Client, override_settings
+from django.test.utils import setup_databases, setup_test_environment, teardown_databases, teardown_test_environment
+from django.urls import reverse
+
+from api import models as api_models
+from api.payments import paystack, stripe_checkout
+from api.payments.stub import GatewayStub
+
+ENDPOINTS = {
+    'paystack-verify': ('verify-paystack-payment', 'verify-paystack-payment-async', ('reference', 'ref_bench')),
+    'stripe-verify': ('verify-stripe-payment', 'verify-stripe-payment-async', ('session_id', 'cs_bench')),
+}
+
+
+def unique_params(param, run, i):
+    # settled payments are answered locally, so every request verifies a fresh reference to reach the gateway
+    name, prefix = param
+    return {name: f"{prefix}_{run}_{i}"}
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare payment verification throughput of the sync views under WSGI and the async views under "
+        "ASGI, against a local gateway stub with injected latency. Runs on a throwaway test database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--endpoint', choices=sorted(ENDPOINTS), default='paystack-verify')
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument('--latency', type=float, default=0.1, help="Seconds the stub gateway sleeps per call")
+        parser.add_argument('--wsgi-workers', type=int, default=8, help="Worker threads serving the WSGI run")
+        parser.add_argument('--concurrency', type=int, default=20, help="Requests in flight during the ASGI run")
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        old_config = setup_databases(verbosity=0, interactive=False)
+        stub = GatewayStub().start()
+        stub.latency = options['latency']
+        try:
+            # size the gateway pool to the offered concurrency so it is not the bottleneck on either side
+            pool_size = max(options['concurrency'], options['wsgi_workers'])
+            with override_settings(PAYSTACK_BASE_URL=stub.url, STRIPE_API_BASE=stub.url,
+                                   PAYMENT_GATEWAY_RETRIES=0, PAYMENT_GATEWAY_POOL_SIZE=pool_size):
+                paystack.reset_client()
+                stripe_checkout.reset_client()
+                user = api_models.User.objects.create_user('Bench Client', 'bench@example.com', 'bench-pass-123')
+                token = user.tokens()['access']
+                sync_name, async_name, param = ENDPOINTS[options['endpoint']]
+
+                wsgi = self.run_wsgi(reverse(sync_name), param, token, options)
+                asgi = asyncio.run(self.run_asgi(reverse(async_name), param, token, options))
+                self.report('WSGI (sync view)', wsgi, options['requests'])
+                self.report('ASGI (async view)', asgi, options['requests'])
+        finally:
+            stub.stop()
+            paystack.reset_client()
+            stripe_checkout.reset_client()
+            connections.close_all()
+            teardown_databases(old_config, verbosity=0)
+            teardown_test_environment()
+
+    def run_wsgi(self, url, param, token, options):
+        def call(i):
+            client = Client(headers={"Authorization": f"Bearer {token}"})
+            started = time.perf_counter()
+            response = client.get(url, unique_params(param, 'wsgi', i))
+            connections.close_all()
+            return time.perf_counter() - started, response.status_code
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['wsgi_workers']) as pool:
+            results = list(pool.map(call, range(options['requests'])))
+        return time.perf_counter() - started, results
+
+    async def run_asgi(self, url, param, token, options):
+        client = AsyncClient()
+        gate = asyncio.Semaphore(options['concurrency'])
+
+        async def call(i):
+            async with gate:
+                started = time.perf_counter()
+                response = await client.get(url, unique_params(param, 'asgi', i), headers={"Authorization": f"Bearer {token}"})
+                return time.perf_counter() - started, response.status_code
+
+        started = time.perf_counter()
+        results = await asyncio.gather(*(call(i) for i in range(options['requests'])))
+        return time.perf_counter() - started, results
+
+    def report(self, label, run, total):
+        elapsed, results = run
+        latencies = sorted(latency for latency, _ in results)
+        errors = sum(1 for _, status in results if status != 200)
+        p95 = latencies[int(len(latencies) * 0.95) - 1]
+        self.stdout.write(
+            f"{label:<18} {total / elapsed:8.1f} req/s  p50 {statistics.median(latencies) * 1000:7.1f} ms  "
+            f"p95 {p95 * 1000:7.1f} ms  errors {errors}"
+        )
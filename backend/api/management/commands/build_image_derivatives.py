@@ -0,0 +1,34 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+from api import images
+from api import models as api_models
+
+
+class Command(BaseCommand):
+    help = "Make the resized copies of service images that are missing or out of date"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count(), help="Images processed at once (default: one per CPU)")
+        parser.add_argument('--force', action='store_true', help="Remake every derivative, even the current ones")
+
+    def handle(self, *args, **options):
+        services = [
+            service for service in api_models.Service.objects.only('id', 'image', 'image_derivatives').order_by('id')
+            if options['force'] or not images.is_current(service)
+        ]
+        if not services:
+            self.stdout.write(self.style.SUCCESS("Service images are up to date"))
+            return
+
+        def build(service):
+            return images.build(service.image, options['force']) if service.image else {}
+
+        # the pool only reads and writes media; the records are saved from this thread
+        with ThreadPoolExecutor(max_workers=options['workers'], thread_name_prefix='image-derivatives') as pool:
+            for service, record in zip(services, pool.map(build, services)):
+                images.save_record(service, record)
+                self.stdout.write(f"{service.image.name or service.pk}: {len(record.get('paths', {}))} derivatives")
+        self.stdout.write(self.style.SUCCESS(f"Service images processed: {len(services)}"))
@@ -0,0 +1,28 @@
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from api import openapi
+
+
+class Command(BaseCommand):
+    help = "Generate the OpenAPI schema served at / into OPENAPI_SCHEMA_PATH"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true', help="Fail if the stored schema is out of date, without writing it")
+
+    def handle(self, *args, **options):
+        path = Path(settings.OPENAPI_SCHEMA_PATH)
+        content = openapi.generate()
+        current = path.read_bytes() if path.exists() else None
+        if options['check']:
+            if current != content:
+                raise CommandError(f"{path} is out of date; run manage.py build_openapi_schema")
+            self.stdout.write(self.style.SUCCESS(f"{path} is up to date"))
+            return
+        if current == content:
+            self.stdout.write(self.style.SUCCESS(f"{path} is up to date"))
+            return
+        path.write_bytes(content)
+        self.stdout.write(self.style.SUCCESS(f"Wrote {path}"))
@@ -0,0 +1,44 @@
+import csv
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api import imports
+
+
+class Command(BaseCommand):
+    help = "Bulk import appointments from a CSV or JSON (array or JSON Lines) file, without sending emails"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="File to import")
+        parser.add_argument('--format', choices=imports.FORMATS, default=None, help="Default: from the file extension")
+        parser.add_argument('--batch-size', type=int, default=None, help="Rows per batch (default APPOINTMENT_IMPORT_BATCH_SIZE)")
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or ('csv' if path.lower().endswith('.csv') else 'json')
+        line = 0
+
+        def numbered(lines):
+            nonlocal line
+            for line, text in enumerate(lines, start=1):
+                yield text
+
+        try:
+            # decoded line by line as the import view does, so an undecodable line is found where it is
+            with open(path, 'rb') as rows:
+                lines = numbered(imports.decode_lines(rows))
+                report = imports.import_appointments(imports.read_rows(lines, fmt), batch_size=options['batch_size'])
+        except OSError as e:
+            raise CommandError(e)
+        except UnicodeDecodeError as e:
+            # the line being decoded is the one after the last line read; the rows before it are already imported
+            raise CommandError(f"Unreadable file at line {line + 1}: {e}")
+        except csv.Error as e:
+            raise CommandError(f"Unreadable file at line {line}: {e}")
+
+        for error in report.errors:
+            self.stderr.write(f"row {error['row']}: {json.dumps(error['errors'])}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {report.created} appointments ({report.clients_created} new clients), {len(report.errors)} rows failed"
+        ))
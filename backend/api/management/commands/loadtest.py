@@ -0,0 +1,110 @@
+import json
+import platform
+import subprocess
+from datetime import datetime, timezone
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import override_settings
+from django.test.utils import setup_databases, setup_test_environment, teardown_databases, teardown_test_environment
+
+from api import loadtest
+from api.payments import paystack, stripe_checkout
+from api.payments.stub import GatewayStub
+
+
+class Command(BaseCommand):
+    help = (
+        "Load-test every route in api/urls.py on a throwaway test database, with the payment gateways and "
+        "mail stubbed locally. Reports p50/p95/p99 latency, requests per second and queries per request."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=50, help="Requests per route")
+        parser.add_argument('--concurrency', type=int, default=8, help="Client threads per route")
+        parser.add_argument('--routes', nargs='+', metavar='NAME', help="Only these route names (default: all)")
+        parser.add_argument('--latency', type=float, default=0.05, help="Seconds the stub gateway sleeps per call")
+        parser.add_argument('--output', help="Write the results as JSON to this file")
+        parser.add_argument('--baseline', help="A previous --output file to compare p95 and queries against")
+
+    def handle(self, *args, **options):
+        missing = loadtest.uncovered_routes()
+        if missing:
+            raise CommandError(f"No load-test builder for route(s): {', '.join(missing)} (add them to api.loadtest.ROUTES)")
+        names = options['routes'] or list(loadtest.ROUTES)
+        unknown = sorted(set(names) - set(loadtest.ROUTES))
+        if unknown:
+            raise CommandError(f"Unknown route(s): {', '.join(unknown)}")
+
+        setup_test_environment()
+        old_config = setup_databases(verbosity=0, interactive=False)
+        stub = GatewayStub().start()
+        stub.latency = options['latency']
+        try:
+            with override_settings(
+                PAYSTACK_BASE_URL=stub.url, STRIPE_API_BASE=stub.url, STRIPE_WEBHOOK_SECRET=loadtest.STRIPE_WEBHOOK_SECRET,
+                EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend', PAYMENT_GATEWAY_RETRIES=0,
+                PAYMENT_GATEWAY_POOL_SIZE=max(options['concurrency'], settings.PAYMENT_GATEWAY_POOL_SIZE),
+            ):
+                paystack.reset_client()
+                stripe_checkout.reset_client()
+                fixture = loadtest.Fixture(options['requests'])
+                results = []
+                for name in names:
+                    summary = loadtest.run_route(name, fixture, options['requests'], options['concurrency'])
+                    results.append(summary)
+                    self.stdout.write(self.format_row(summary))
+        finally:
+            stub.stop()
+            paystack.reset_client()
+            stripe_checkout.reset_client()
+            connections.close_all()
+            teardown_databases(old_config, verbosity=0)
+            teardown_test_environment()
+
+        report = {'meta': self.meta(options), 'routes': results}
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Results written to {options['output']}"))
+        if options['baseline']:
+            self.compare(results, options['baseline'])
+
+    def format_row(self, summary):
+        return (
+            f"{summary['route']:<30} {summary['rps']:8.1f} req/s  p50 {summary['p50_ms']:8.1f}  "
+            f"p95 {summary['p95_ms']:8.1f}  p99 {summary['p99_ms']:8.1f} ms  "
+            f"queries {summary['queries_per_request']:5.1f}  errors {summary['errors']}"
+        )
+
+    def meta(self, options):
+        try:
+            commit = subprocess.run(
+                ['git', 'rev-parse', 'HEAD'], cwd=settings.BASE_DIR, capture_output=True, text=True, timeout=5,
+            ).stdout.strip() or None
+        except (OSError, subprocess.SubprocessError):
+            commit = None
+        return {
+            'commit': commit,
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connections['default'].vendor,
+            'options': {key: options[key] for key in ('requests', 'concurrency', 'latency', 'routes')},
+        }
+
+    def compare(self, results, path):
+        with open(path) as f:
+            baseline = {row['route']: row for row in json.load(f)['routes']}
+        self.stdout.write(f"\nAgainst {path}:")
+        for row in results:
+            before = baseline.get(row['route'])
+            if before is None:
+                continue
+            change = (row['p95_ms'] - before['p95_ms']) / before['p95_ms'] * 100 if before['p95_ms'] else 0
+            self.stdout.write(
+                f"{row['route']:<30} p95 {before['p95_ms']:8.1f} -> {row['p95_ms']:8.1f} ms ({change:+.0f}%)  "
+                f"queries {before['queries_per_request']:5.1f} -> {row['queries_per_request']:5.1f}"
+            )
@@ -0,0 +1,13 @@
+from api import webhooks
+from api.management.base import QueueWorkerCommand
+
+
+class Command(QueueWorkerCommand):
+    help = "Apply received payment webhook events in batches: record settled payments and link them to appointments"
+    outcomes = ('processed', 'dead')
+    summary = "Webhook events applied"
+    batch_size_help = "Events per batch (default WEBHOOK_BATCH_SIZE)"
+    loop_help = "Keep polling for events instead of exiting when none are due"
+
+    def run_batch(self, batch_size):
+        return webhooks.process_batch(batch_size=batch_size)
@@ -0,0 +1,31 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from api import coldstart
+
+
+class Command(BaseCommand):
+    help = "Report how long a new worker spends importing each module before it can serve"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=25, help="Rows to show (default 25)")
+        parser.add_argument('--packages', action='store_true', help="Sum the time by top-level package")
+        parser.add_argument('--check', action='store_true', help="Fail if startup is over COLD_START_BUDGET_MS or imports a lazy module")
+
+    def handle(self, *args, **options):
+        profile = coldstart.profile()
+        if options['packages']:
+            rows = profile.by_package(options['limit'])
+        else:
+            rows = [(module.name, module.self_ms) for module in profile.slowest(options['limit'])]
+        width = max((len(name) for name, _ in rows), default=0)
+        for name, ms in rows:
+            self.stdout.write(f"{name:<{width}}  {ms:8.1f} ms")
+
+        budget = settings.COLD_START_BUDGET_MS
+        lazy = profile.lazy_modules_loaded()
+        self.stdout.write(f"{len(profile.modules)} modules imported in {profile.total_ms:.0f} ms (budget {budget} ms)")
+        if lazy:
+            self.stdout.write(self.style.WARNING(f"Imported at startup but meant to load lazily: {', '.join(lazy)}"))
+        if options['check'] and (lazy or profile.total_ms > budget):
+            raise CommandError("Cold start is over budget")
@@ -0,0 +1,26 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api import revocation
+
+
+class Command(BaseCommand):
+    help = "Delete expired refresh tokens from the outstanding and blacklisted token tables, in batches"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None, help="Tokens per batch (default TOKEN_PRUNE_BATCH_SIZE)")
+        parser.add_argument('--pause', type=float, default=0.0, help="Seconds to sleep between batches, to leave room for other writers")
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size'] or settings.TOKEN_PRUNE_BATCH_SIZE
+        total = 0
+        while True:
+            deleted = revocation.prune_expired(batch_size)
+            if not deleted:
+                break
+            total += deleted
+            self.stdout.write(f"deleted {deleted}")
+            time.sleep(options['pause'])
+        self.stdout.write(self.style.SUCCESS(f"Expired refresh tokens pruned: {total}"))
@@ -0,0 +1,18 @@
+import datetime
+
+from django.core.management.base import BaseCommand
+
+from api import rollups
+
+
+class Command(BaseCommand):
+    help = "Recompute the daily revenue and utilisation rollups from the appointments"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', type=datetime.date.fromisoformat, default=None, help="First day (YYYY-MM-DD); default the earliest")
+        parser.add_argument('--end', type=datetime.date.fromisoformat, default=None, help="Last day (YYYY-MM-DD); default the latest")
+        parser.add_argument('--batch-days', type=int, default=None, help="Days recomputed per transaction (default ROLLUP_REBUILD_BATCH_DAYS)")
+
+    def handle(self, *args, **options):
+        days = rollups.rebuild(options['start'], options['end'], options['batch_days'])
+        self.stdout.write(self.style.SUCCESS(f"Rollups rebuilt for {days} days"))
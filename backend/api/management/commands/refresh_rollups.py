@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api import rollups
+
+
+class Command(BaseCommand):
+    help = "Recompute the daily rollups of the days whose appointments changed since the last run"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-days', type=int, default=None, help="Days recomputed per transaction (default ROLLUP_REBUILD_BATCH_DAYS)")
+        parser.add_argument('--loop', action='store_true', help="Keep polling for stale days instead of exiting when there are none")
+        parser.add_argument('--interval', type=float, default=5.0, help="Seconds to sleep between polls when idle")
+
+    def handle(self, *args, **options):
+        total = 0
+        while True:
+            refreshed = rollups.refresh_stale(batch_days=options['batch_days'])
+            total += refreshed
+            if refreshed:
+                self.stdout.write(f"refreshed {refreshed} days")
+                continue
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+        self.stdout.write(self.style.SUCCESS(f"Rollups up to date: {total} days refreshed"))
@@ -0,0 +1,13 @@
+from api import outbox
+from api.management.base import QueueWorkerCommand
+
+
+class Command(QueueWorkerCommand):
+    help = "Deliver queued emails from the outbox in batches over a reused mail connection"
+    outcomes = ('sent', 'failed')
+    summary = "Outbox drained"
+    batch_size_help = "Emails per batch (default EMAIL_OUTBOX_BATCH_SIZE)"
+    loop_help = "Keep polling the outbox instead of exiting when it is empty"
+
+    def run_batch(self, batch_size):
+        return outbox.drain(batch_size=batch_size)
@@ -0,0 +1,101 @@
+import json
+import logging
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.http import JsonResponse
+from django.utils.deprecation import MiddlewareMixin
+
+from . import instrumentation
+from .passwords import HashingBusy
+
+logger = logging.getLogger('api.performance')
+
+
+class QueryBudgetExceeded(AssertionError):
+    """A request ran more queries than its view's ``query_budget`` (raised when ``QUERY_BUDGET_ENFORCED``)."""
+
+
+class PerformanceMiddleware:
+    """
+    Time SQL, serializers and outbound HTTP for each request.
+
+    Adds a ``Server-Timing`` header (when ``SERVER_TIMING_HEADER`` is on) and
+    logs one JSON line per request on the ``api.performance`` logger, flagged
+    when a view goes over its declared ``query_budget``; with
+    ``QUERY_BUDGET_ENFORCED`` (on under the test runner) the request fails
+    instead. Keep it first in ``MIDDLEWARE`` so the total covers the whole
+    stack.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = instrumentation.start()
+        try:
+            response = self.get_response(request)
+            self.report(request, response, instrumentation.current())
+        finally:
+            instrumentation.stop(token)
+        return response
+
+    async def __acall__(self, request):
+        token = instrumentation.start()
+        try:
+            response = await self.get_response(request)
+            self.report(request, response, instrumentation.current())
+        finally:
+            instrumentation.stop(token)
+        return response
+
+    def report(self, request, response, metrics):
+        if settings.SERVER_TIMING_HEADER:
+            response['Server-Timing'] = metrics.server_timing()
+
+        match = request.resolver_match
+        view_class = getattr(getattr(match, 'func', None), 'view_class', None)
+        budget = getattr(view_class, 'query_budget', None)
+        record = {
+            'method': request.method,
+            'path': request.path,
+            'view': match.view_name if match else None,
+            'status': response.status_code,
+            'total_ms': round(metrics.total * 1000, 2),
+            'sql_count': metrics.counts[instrumentation.SQL],
+            'sql_ms': round(metrics.durations[instrumentation.SQL] * 1000, 2),
+            'serializer_ms': round(metrics.durations[instrumentation.SERIALIZER] * 1000, 2),
+            'external_count': metrics.counts[instrumentation.EXTERNAL],
+            'external_ms': round(metrics.durations[instrumentation.EXTERNAL] * 1000, 2),
+        }
+        if budget is not None:
+            record['query_budget'] = budget
+            record['over_budget'] = record['sql_count'] > budget
+        level = logging.WARNING if record.get('over_budget') else logging.INFO
+        logger.log(level, json.dumps(record))
+        if record.get('over_budget') and settings.QUERY_BUDGET_ENFORCED:
+            raise QueryBudgetExceeded(
+                f"{record['view']} ran {record['sql_count']} queries, over its budget of {budget}"
+            )
+
+
+class HashingBusyMiddleware(MiddlewareMixin):
+    """
+    Answer 503 with a ``Retry-After`` when the password hashing pool is full
+    (api/passwords.py), for every view that hashes: the API's sign-up and
+    logins, the admin's login, and any other ``authenticate`` caller.
+    """
+
+    def process_exception(self, request, exception):
+        if not isinstance(exception, HashingBusy):
+            return None
+        response = JsonResponse({"error": "Too many sign-ins right now, please try again"}, status=503)
+        response['Retry-After'] = str(settings.PASSWORD_HASHING_RETRY_AFTER)
+        return response
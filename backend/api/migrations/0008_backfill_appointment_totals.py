@@ -0,0 +1,34 @@
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.db import migrations
+
+
+def backfill_totals(apps, schema_editor):
+    Appointment = apps.get_model('api', 'Appointment')
+    appointments = Appointment.objects.using(schema_editor.connection.alias).prefetch_related('services')
+    batch = []
+    for appointment in appointments.iterator(chunk_size=500):
+        services = list(appointment.services.all())
+        appointment.total_price = sum((service.price for service in services), Decimal('0'))
+        appointment.total_duration = sum((service.duration for service in services), timedelta())
+        start = datetime.combine(appointment.appointment_date, appointment.appointment_time)
+        end = start + appointment.total_duration
+        appointment.end_time = end.time() if end.date() == start.date() else time.max
+        batch.append(appointment)
+        if len(batch) >= 500:
+            Appointment.objects.using(schema_editor.connection.alias).bulk_update(batch, ['total_price', 'total_duration', 'end_time'])
+            batch = []
+    if batch:
+        Appointment.objects.using(schema_editor.connection.alias).bulk_update(batch, ['total_price', 'total_duration', 'end_time'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_appointment_totals'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_totals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.4 on 2026-10-18 13:23
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_appointment_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookingDayLock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(unique=True)),
+                ('locked_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.4 on 2026-10-18 13:33
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_booking_day_lock'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VerifiedPayment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('provider', models.CharField(choices=[('paystack', 'Paystack'), ('stripe', 'Stripe')], max_length=10)),
+                ('reference', models.CharField(help_text='Paystack reference or Stripe checkout session id', max_length=255)),
+                ('status', models.CharField(choices=[('success', 'Success'), ('failed', 'Failed')], max_length=10)),
+                ('payload', models.JSONField(blank=True, default=dict)),
+                ('verified_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('provider', 'reference'), name='verified_payment_reference_uniq')],
+            },
+        ),
+    ]
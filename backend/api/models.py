@@ -5,7 +5,9 @@ from django.contrib.auth.models import (
 
 from rest_framework_simplejwt.tokens import RefreshToken
 from django.utils.text import slugify
-from datetime import timedelta
+from django.utils import timezone
+from datetime import datetime, time, timedelta
+from decimal import Decimal
 import uuid
 
 # Create your models here.
@@ -63,6 +65,20 @@ class User(AbstractBaseUser, PermissionsMixin):
         }
 
 
+class ClaimsUser(User):
+    """
+    A user rebuilt from the claims of a verified access token by
+    ``authentication.ClaimsJWTAuthentication``, without a query. Only the
+    claimed fields are set, so it must not be saved; load the ``User`` for that.
+    """
+
+    class Meta:
+        proxy = True
+
+    def save(self, *args, **kwargs):
+        raise TypeError("ClaimsUser is built from token claims and can't be saved; load the User instead")
+
+
 class Category(models.Model):
     name = models.CharField(max_length=255)
     description = models.TextField(null=True, blank=True)
@@ -88,19 +104,56 @@ class Service(models.Model):
     slug = models.SlugField(unique=True, null=True, blank=True)
     category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='services')
     image = models.FileField(upload_to='service-images/', blank=True, null=True)
+    # the resized copies made from image, see api/images.py
+    image_derivatives = models.JSONField(default=dict, blank=True, editable=False)
 
     class Meta:
         verbose_name_plural = "Services"
 
     def __str__(self):
         return self.name
-    
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # price and duration as stored, so a change reprices the bookings to come (api/signals.py)
+        instance._stored_terms = (instance.__dict__.get('price'), instance.__dict__.get('duration'))
+        return instance
+
+    def terms_changed(self):
+        stored = getattr(self, '_stored_terms', None)
+        return stored is not None and stored != (self.price, self.duration)
+
     def save(self, *args, **kwargs):
         if self.slug == "" or self.slug == None:
             self.slug = slugify(self.name)
         super(Service, self).save(*args, **kwargs)
 
 
+def appointment_end_time(date, start_time, duration):
+    end = datetime.combine(date, start_time) + (duration or timedelta())
+    if end.date() != date:
+        # bookings never run past midnight, clamp so same-day comparisons hold
+        return time.max
+    return end.time()
+
+
+class AppointmentQuerySet(models.QuerySet):
+    def active_on(self, date):
+        """Live (not cancelled) bookings on ``date``."""
+        return self.filter(appointment_date=date, is_cancelled=False)
+
+    def overlapping(self, date, start, end):
+        """Live bookings on ``date`` whose ``[appointment_time, end_time)`` intersects ``[start, end)``."""
+        return self.active_on(date).filter(appointment_time__lt=end, end_time__gt=start)
+
+    def with_related(self):
+        """Load the client and services (with their category) up front for serialization."""
+        return self.select_related('user').prefetch_related(
+            models.Prefetch('services', queryset=Service.objects.select_related('category'))
+        )
+
+
 class Appointment(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="appointments")
     services = models.ManyToManyField('Service')
@@ -112,14 +165,212 @@ class Appointment(models.Model):
     # is_paid = models.BooleanField(default=False)
     is_rescheduled = models.BooleanField(default=False)
     is_cancelled = models.BooleanField(default=False)
-    payment_reference = models.CharField(max_length=100, blank=True, null=True)
+    payment_reference = models.CharField(max_length=100, blank=True, null=True, db_index=True)
+    # denormalized from services, kept up to date by the m2m_changed handler in signals.py
+    total_price = models.DecimalField(max_digits=10, decimal_places=2, default=0, editable=False)
+    total_duration = models.DurationField(default=timedelta, editable=False)
+    end_time = models.TimeField(null=True, blank=True, editable=False)
+    # set when a payment with this payment_reference is confirmed (verify endpoint or webhook)
+    payment = models.ForeignKey(
+        'VerifiedPayment', null=True, blank=True, on_delete=models.SET_NULL, related_name='appointments', editable=False,
+    )
+
+    objects = AppointmentQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # day occupancy, overlap checks and the live schedule only look at active bookings;
+            # keeps calendar order and covers end_time so availability never touches the table
+            models.Index(
+                fields=['appointment_date', 'appointment_time', 'id', 'end_time'],
+                condition=models.Q(is_cancelled=False),
+                name='appt_active_day_idx',
+            ),
+            # staff schedule: date range filters and keyset pagination in calendar order
+            models.Index(fields=['appointment_date', 'appointment_time', 'id'], name='appt_schedule_idx'),
+            # a client's history, newest first
+            models.Index(fields=['user', '-created_at', '-id'], name='appt_user_history_idx'),
+        ]
 
     def __str__(self):
         return f"Appointment for {self.user.full_name} on {self.appointment_date} at {self.appointment_time}"
 
-    def total_price(self):
-        return sum(service.price for service in self.services.all())
-    
-    def total_duration(self):
-        total = sum((service.duration for service in self.services.all()), timedelta())
-        return total
\ No newline at end of file
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # the day as stored, so moving a booking marks the rollups of the day it left stale (api/rollups.py)
+        instance._stored_date = instance.__dict__.get('appointment_date')
+        return instance
+
+    def save(self, *args, **kwargs):
+        self.end_time = self.calculate_end_time()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'end_time' not in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'end_time'}
+        super(Appointment, self).save(*args, **kwargs)
+
+    def calculate_end_time(self):
+        return appointment_end_time(self.appointment_date, self.appointment_time, self.total_duration)
+
+    def refresh_totals(self, services=None):
+        """Recompute the denormalized totals from ``services`` (defaults to the current set) and persist them."""
+        if services is None:
+            services = self.services.all()
+        services = list(services)
+        self.total_price = sum((service.price for service in services), Decimal('0'))
+        self.total_duration = sum((service.duration for service in services), timedelta())
+        if self.pk:
+            self.end_time = self.calculate_end_time()
+            Appointment.objects.filter(pk=self.pk).update(
+                total_price=self.total_price, total_duration=self.total_duration, end_time=self.end_time
+            )
+
+class OutboxEmail(models.Model):
+    STATUS_PENDING = 'pending'
+    STATUS_SENT = 'sent'
+    STATUS_DEAD = 'dead'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_SENT, 'Sent'),
+        (STATUS_DEAD, 'Dead'),
+    ]
+
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    to = models.EmailField(max_length=255)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    claim_token = models.UUIDField(null=True, blank=True, db_index=True)
+    last_error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name_plural = "Outbox emails"
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='outbox_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} to {self.to} ({self.status})"
+
+
+class BookingDayLock(models.Model):
+    """One row per booked day; bookings take a write lock on it to serialize overlap checks."""
+    date = models.DateField(unique=True)
+    locked_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return str(self.date)
+
+
+class VerifiedPayment(models.Model):
+    """
+    A settled gateway verification result. Settled payments never change, so
+    verify endpoints answer from here instead of calling the gateway again.
+    """
+    PROVIDER_PAYSTACK = 'paystack'
+    PROVIDER_STRIPE = 'stripe'
+    PROVIDER_CHOICES = [
+        (PROVIDER_PAYSTACK, 'Paystack'),
+        (PROVIDER_STRIPE, 'Stripe'),
+    ]
+    STATUS_SUCCESS = 'success'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_SUCCESS, 'Success'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    provider = models.CharField(max_length=10, choices=PROVIDER_CHOICES)
+    reference = models.CharField(max_length=255, help_text="Paystack reference or Stripe checkout session id")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES)
+    payload = models.JSONField(default=dict, blank=True)
+    verified_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['provider', 'reference'], name='verified_payment_reference_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.provider} {self.reference} ({self.status})"
+
+
+class WebhookEvent(models.Model):
+    """
+    A signed gateway event, stored as received and applied later in batches
+    by ``manage.py process_webhook_events``.
+    """
+    STATUS_PENDING = 'pending'
+    STATUS_PROCESSED = 'processed'
+    STATUS_DEAD = 'dead'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_PROCESSED, 'Processed'),
+        (STATUS_DEAD, 'Dead'),
+    ]
+
+    provider = models.CharField(max_length=10, choices=VerifiedPayment.PROVIDER_CHOICES)
+    event_id = models.CharField(max_length=255)
+    event_type = models.CharField(max_length=100)
+    payload = models.JSONField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    # leased by a worker until next_attempt_at, see webhooks.claim_batch
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    claim_token = models.UUIDField(null=True, blank=True, db_index=True)
+    last_error = models.TextField(blank=True, default='')
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['provider', 'event_id'], name='webhook_event_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='webhook_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.provider} {self.event_type} {self.event_id} ({self.status})"
+
+
+class DailyRollup(models.Model):
+    """Live bookings on one day; recomputed from the appointments by api/rollups.py after they change."""
+    date = models.DateField(unique=True)
+    bookings = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    booked_minutes = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.date}: {self.bookings} bookings"
+
+
+class DailyServiceRollup(models.Model):
+    """Live bookings of one service on one day, see ``DailyRollup``."""
+    date = models.DateField()
+    service = models.ForeignKey(Service, on_delete=models.CASCADE, related_name='daily_rollups')
+    bookings = models.PositiveIntegerField(default=0)
+    # the service's price for each booking; a day's revenue is the sum of its services'
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    booked_minutes = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'service'], name='service_rollup_day_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.date} {self.service_id}: {self.bookings} bookings"
+
+
+class StaleRollupDay(models.Model):
+    """A day whose rollups are behind its appointments, until ``manage.py refresh_rollups`` recomputes them."""
+    date = models.DateField(unique=True)
+    # replaced by every change to the day, so a refresh only clears the mark it read
+    token = models.UUIDField(default=uuid.uuid4)
+    marked_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return str(self.date)
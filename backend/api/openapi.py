@@ -0,0 +1,110 @@
+"""
+The API's OpenAPI (Swagger 2.0) schema, built ahead of time.
+
+drf_yasg introspects every view and serializer to produce the schema, and
+the docs sit at ``/``, where health checks and crawlers land. So the schema
+is generated by ``manage.py build_openapi_schema`` into
+``OPENAPI_SCHEMA_PATH`` (committed with the code) and served from that
+file: read once per process, with an ETag from its hash. When the file is
+missing (a fresh checkout) the schema is generated on the first request and
+kept for the life of the process.
+
+The generated schema is the same for every host (no ``host`` or
+``schemes``; Swagger UI uses the page's), so the stored file can be compared
+byte for byte: ``build_openapi_schema --check`` and the test suite fail when
+it is out of date.
+"""
+import hashlib
+import logging
+import threading
+from pathlib import Path
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.template.loader import render_to_string
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition, require_safe
+from drf_yasg import openapi
+
+logger = logging.getLogger(__name__)
+
+VERSION = "v1"
+INFO = openapi.Info(
+    title="Booking Backend APIs",
+    default_version=VERSION,
+    description="This is the documentation for the booking backend API",
+    terms_of_service="http://mywbsite.com/policies/",
+    contact=openapi.Contact(email="ahalomzymike@gmail.com"),
+    license=openapi.License(name="BSD Licence"),
+)
+
+
+class StoredSchema:
+    def __init__(self, content):
+        self.content = content
+        self.etag = hashlib.sha256(content).hexdigest()[:32]
+
+
+_lock = threading.Lock()
+_stored = None
+
+
+def generate():
+    """The schema as JSON bytes, introspected from the URLconf."""
+    # the generator is only needed by the build command, not by the workers serving the file
+    from drf_yasg.codecs import OpenAPICodecJson
+    from drf_yasg.generators import OpenAPISchemaGenerator
+
+    schema = OpenAPISchemaGenerator(INFO).get_schema(request=None, public=True)
+    return OpenAPICodecJson(validators=[], pretty=True).encode(schema) + b'\n'
+
+
+def stored():
+    """The schema served to clients: the stored file, or a generated one if there is none."""
+    global _stored
+    with _lock:
+        if _stored is None:
+            path = Path(settings.OPENAPI_SCHEMA_PATH)
+            try:
+                content = path.read_bytes()
+            except FileNotFoundError:
+                logger.warning("%s is missing, generating the schema; run manage.py build_openapi_schema", path)
+                content = generate()
+            _stored = StoredSchema(content)
+        return _stored
+
+
+def forget():
+    """Drop the schema read by ``stored``, so the next request reads the file again."""
+    global _stored
+    with _lock:
+        _stored = None
+
+
+def schema_etag(request, *args, **kwargs):
+    return stored().etag
+
+
+@require_safe
+@condition(etag_func=schema_etag)
+def schema_json(request):
+    response = HttpResponse(stored().content, content_type='application/json')
+    # revalidate each time: the ETag changes with a deploy, the URL does not
+    patch_cache_control(response, no_cache=True)
+    return response
+
+
+@require_safe
+def swagger_ui(request):
+    """Swagger UI, which fetches the schema from ``schema_json``."""
+    if request.GET.get('format') == 'openapi':
+        # the URL drf_yasg served the schema at
+        return schema_json(request)
+    from drf_yasg.renderers import SwaggerUIRenderer
+
+    renderer = SwaggerUIRenderer()
+    context = {'request': request}
+    renderer.set_context(context)
+    context['title'] = INFO.title
+    context['version'] = VERSION
+    return HttpResponse(render_to_string(renderer.template, context, request))
@@ -0,0 +1,84 @@
+import logging
+import random
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import get_connection
+from django.utils import timezone
+
+from . import leases
+from . import models as api_models
+from .utils import Util
+
+logger = logging.getLogger(__name__)
+
+
+def backoff_delay(attempts):
+    """Exponential backoff with random jitter, capped at ``EMAIL_OUTBOX_MAX_BACKOFF``."""
+    base = settings.EMAIL_OUTBOX_BACKOFF_SECONDS
+    ceiling = min(settings.EMAIL_OUTBOX_MAX_BACKOFF, base * 2 ** max(attempts - 1, 0))
+    return timedelta(seconds=random.uniform(base, max(base, ceiling)))
+
+
+def claim_batch(batch_size):
+    """Lease up to ``batch_size`` due emails to this worker (see ``leases.claim_batch``)."""
+    return leases.claim_batch(api_models.OutboxEmail, batch_size, settings.EMAIL_OUTBOX_LEASE_SECONDS)
+
+
+def drain(batch_size=None, mail_connection=None):
+    """
+    Deliver one batch of due emails over a single mail connection.
+
+    Returns a ``(sent, failed)`` tuple. Failed rows are rescheduled with
+    backoff and dead-lettered after ``EMAIL_OUTBOX_MAX_ATTEMPTS`` tries.
+    """
+    batch = claim_batch(batch_size or settings.EMAIL_OUTBOX_BATCH_SIZE)
+    if not batch:
+        return 0, 0
+
+    mail_connection = mail_connection or get_connection()
+    try:
+        mail_connection.open()
+    except Exception as e:
+        # provider unreachable: reschedule the whole batch rather than trying each message
+        logger.warning("Email outbox could not connect: %s", e)
+        for outbox_email in batch:
+            mark_failed(outbox_email, e)
+        return 0, len(batch)
+
+    sent = failed = 0
+    try:
+        for outbox_email in batch:
+            try:
+                Util.build_email(outbox_email, connection=mail_connection).send()
+            except Exception as e:
+                failed += 1
+                mark_failed(outbox_email, e)
+            else:
+                sent += 1
+                mark_sent(outbox_email)
+    finally:
+        mail_connection.close()
+    return sent, failed
+
+
+def mark_sent(outbox_email):
+    outbox_email.status = api_models.OutboxEmail.STATUS_SENT
+    outbox_email.attempts += 1
+    outbox_email.sent_at = timezone.now()
+    outbox_email.last_error = ''
+    outbox_email.claim_token = None
+    outbox_email.save(update_fields=['status', 'attempts', 'sent_at', 'last_error', 'claim_token'])
+
+
+def mark_failed(outbox_email, error):
+    outbox_email.attempts += 1
+    outbox_email.last_error = str(error)[:2000]
+    if outbox_email.attempts >= settings.EMAIL_OUTBOX_MAX_ATTEMPTS:
+        outbox_email.status = api_models.OutboxEmail.STATUS_DEAD
+        logger.error("Email %s to %s dead-lettered after %s attempts: %s",
+                     outbox_email.pk, outbox_email.to, outbox_email.attempts, error)
+    else:
+        outbox_email.next_attempt_at = timezone.now() + backoff_delay(outbox_email.attempts)
+    outbox_email.claim_token = None
+    outbox_email.save(update_fields=['attempts', 'last_error', 'status', 'next_attempt_at', 'claim_token'])
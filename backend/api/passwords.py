@@ -0,0 +1,142 @@
+"""
+Password hashing off the request thread.
+
+PBKDF2 is slow on purpose, so a burst of logins run inline would tie up
+every worker (and CPU) the catalog and booking endpoints need. Hashes run on
+a small pool instead: at most ``PASSWORD_HASHING_WORKERS`` at once, with up
+to ``PASSWORD_HASHING_QUEUE`` more waiting. Past that, ``HashingBusy`` is
+raised straight away and ``HashingBusyMiddleware`` answers 503, so a login
+spike is shed rather than queued. hashlib releases the GIL while hashing, so the pool
+does not stall the request threads.
+
+Sign-in goes through ``PooledHashingBackend`` (``AUTHENTICATION_BACKENDS``).
+A sync view's thread still waits for its hash, but only the pool's threads
+spend CPU on it; the async login view awaits the hash without holding a
+thread. Async code awaits ``amake_password`` / ``averify_password``.
+"""
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth import get_user_model, hashers
+from django.contrib.auth.backends import ModelBackend
+
+UserModel = get_user_model()
+
+
+class HashingBusy(Exception):
+    """Every hashing slot is taken; the caller should retry shortly."""
+
+
+_lock = threading.Lock()
+_pool = None
+_slots = None
+
+
+def _executor():
+    global _pool, _slots
+    with _lock:
+        if _pool is None:
+            workers = settings.PASSWORD_HASHING_WORKERS
+            _pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-hashing')
+            _slots = threading.BoundedSemaphore(workers + settings.PASSWORD_HASHING_QUEUE)
+        return _pool, _slots
+
+
+def submit(fn, *args):
+    """Run ``fn(*args)`` on the hashing pool; raises ``HashingBusy`` instead of queueing past the limit."""
+    pool, slots = _executor()
+    if not slots.acquire(blocking=False):
+        raise HashingBusy("Too many sign-ins in progress")
+    try:
+        future = pool.submit(fn, *args)
+    except BaseException:
+        slots.release()
+        raise
+    future.add_done_callback(lambda _: slots.release())
+    return future
+
+
+def make_password(raw_password):
+    return submit(hashers.make_password, raw_password).result()
+
+
+def verify_password(raw_password, encoded):
+    """``(matches, must_update)``, as ``django.contrib.auth.hashers.verify_password``."""
+    return submit(hashers.verify_password, raw_password, encoded).result()
+
+
+async def amake_password(raw_password):
+    return await asyncio.wrap_future(submit(hashers.make_password, raw_password))
+
+
+async def averify_password(raw_password, encoded):
+    return await asyncio.wrap_future(submit(hashers.verify_password, raw_password, encoded))
+
+
+def check_password(user, raw_password):
+    """``user.check_password`` with the hashing on the pool, upgrading an outdated hash as it does."""
+    matches, must_update = verify_password(raw_password, user.password)
+    if matches and must_update:
+        # the hasher's settings changed since this hash was made
+        user.password = make_password(raw_password)
+        user.save(update_fields=['password'])
+    return matches
+
+
+async def acheck_password(user, raw_password):
+    matches, must_update = await averify_password(raw_password, user.password)
+    if matches and must_update:
+        user.password = await amake_password(raw_password)
+        await user.asave(update_fields=['password'])
+    return matches
+
+
+class PooledHashingBackend(ModelBackend):
+    """
+    ``ModelBackend`` with the password hashing on the pool, so logins go
+    through ``auth.authenticate`` / ``auth.aauthenticate`` and the
+    ``AUTHENTICATION_BACKENDS`` setting. ``HashingBusy`` passes through them
+    to ``HashingBusyMiddleware``, which answers 503.
+    """
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        if username is None:
+            username = kwargs.get(UserModel.USERNAME_FIELD)
+        if username is None or password is None:
+            return None
+        try:
+            user = UserModel._default_manager.get_by_natural_key(username)
+        except UserModel.DoesNotExist:
+            # hash anyway, so an unknown email takes as long to refuse as a wrong password
+            make_password(password)
+            return None
+        if check_password(user, password) and self.user_can_authenticate(user):
+            return user
+        return None
+
+    async def aauthenticate(self, request, username=None, password=None, **kwargs):
+        if username is None:
+            username = kwargs.get(UserModel.USERNAME_FIELD)
+        if username is None or password is None:
+            return None
+        try:
+            user = await UserModel._default_manager.aget_by_natural_key(username)
+        except UserModel.DoesNotExist:
+            await amake_password(password)
+            return None
+        if await acheck_password(user, password) and self.user_can_authenticate(user):
+            return user
+        return None
+
+
+def refusal(user):
+    """Why ``user``, as returned by ``authenticate``, may not sign in; None if they may."""
+    if user is None:
+        return 'Invalid credentials'
+    if not user.is_active:
+        return 'Account disabled'
+    if not user.is_verified:
+        return 'Account not verified'
+    return None
@@ -0,0 +1,224 @@
+import asyncio
+import logging
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from api import instrumentation
+
+logger = logging.getLogger(__name__)
+
+
+class GatewayError(Exception):
+    """The payment gateway could not be reached or kept failing."""
+
+
+class CircuitOpenError(GatewayError):
+    """Calls are being short-circuited after repeated gateway failures."""
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker.
+
+    After ``threshold`` failures in a row the circuit opens and calls fail
+    fast for ``reset_timeout`` seconds; then a single trial call is let
+    through (half-open) and its outcome closes or re-opens the circuit.
+    """
+
+    def __init__(self, threshold=5, reset_timeout=30.0, clock=time.monotonic):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        if self.clock() - self.opened_at >= self.reset_timeout:
+            return 'half-open'
+        return 'open'
+
+    def before_call(self):
+        with self._lock:
+            state = self.state
+            if state == 'open' or (state == 'half-open' and self.trial_in_flight):
+                raise CircuitOpenError('Payment gateway temporarily unavailable')
+            if state == 'half-open':
+                self.trial_in_flight = True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self.trial_in_flight = False
+            if self.opened_at is not None or self.failures >= self.threshold:
+                self.opened_at = self.clock()
+
+    def abandon_call(self):
+        """The call ended with no verdict on the gateway (cancelled, or a bug of ours): let another trial through."""
+        with self._lock:
+            self.trial_in_flight = False
+
+
+class BaseGatewayClient:
+    """
+    Retry, backoff and circuit-breaking policy shared by the sync and async clients.
+
+    Connect/read timeouts apply to every call. Retries are bounded, with jittered
+    exponential backoff: connection failures are always retried (the request never
+    reached the gateway), 5xx responses and read timeouts only for idempotent methods.
+    4xx responses are returned to the caller, they are not gateway failures.
+    """
+
+    idempotent_methods = frozenset({'GET', 'HEAD', 'OPTIONS'})
+
+    def __init__(self, base_url, headers=None, connect_timeout=3.05, read_timeout=10.0,
+                 retries=2, backoff=0.2, pool_size=10, breaker=None, name='gateway'):
+        self.base_url = base_url.rstrip('/')
+        self.headers = headers or {}
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.pool_size = pool_size
+        self.name = name
+        self.breaker = breaker or CircuitBreaker()
+
+    def url(self, path):
+        return f"{self.base_url}/{path.lstrip('/')}"
+
+    def backoff_delay(self, attempt):
+        return random.uniform(0, self.backoff * 2 ** attempt)
+
+    def fail(self, method, path, attempt, error):
+        self.breaker.record_failure()
+        logger.warning("%s %s %s failed after %s attempt(s): %s", self.name, method, path, attempt + 1, error)
+        raise GatewayError(str(error)) from error
+
+    def server_error(self, method, status_code):
+        return GatewayError(f"{self.name} returned {status_code}"), method in self.idempotent_methods
+
+    def get(self, path, **kwargs):
+        return self.request('GET', path, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.request('POST', path, **kwargs)
+
+
+class GatewayClient(BaseGatewayClient):
+    """Blocking client: one pooled, keep-alive ``requests.Session`` per gateway."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.timeout = (self.connect_timeout, self.read_timeout)
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, max_retries=0)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def request(self, method, path, **kwargs):
+        method = method.upper()
+        kwargs.setdefault('timeout', self.timeout)
+        self.breaker.before_call()
+
+        try:
+            attempt = 0
+            while True:
+                try:
+                    with instrumentation.timed(instrumentation.EXTERNAL):
+                        response = self.session.request(method, self.url(path), **kwargs)
+                except requests.ConnectionError as e:
+                    # includes ConnectTimeout
+                    error, retryable = e, True
+                except requests.Timeout as e:
+                    error, retryable = e, method in self.idempotent_methods
+                except requests.RequestException as e:
+                    # a broken or undecodable response, a bad URL: the call failed, but retrying won't help
+                    error, retryable = e, False
+                else:
+                    if response.status_code < 500:
+                        self.breaker.record_success()
+                        return response
+                    error, retryable = self.server_error(method, response.status_code)
+
+                if not retryable or attempt >= self.retries:
+                    self.fail(method, path, attempt, error)
+                attempt += 1
+                time.sleep(self.backoff_delay(attempt))
+        except GatewayError:
+            raise
+        except BaseException:
+            # an error of ours, or an interrupt: no verdict on the gateway, but free a half-open trial
+            self.breaker.abandon_call()
+            raise
+
+
+class AsyncGatewayClient(BaseGatewayClient):
+    """
+    Non-blocking client over a pooled ``httpx.AsyncClient``, for async views under ASGI.
+
+    httpx connection pools belong to the event loop that opened them, so keep
+    one instance per loop (see ``paystack.get_async_client``).
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        import httpx
+
+        self.httpx = httpx
+        self.client = httpx.AsyncClient(
+            headers=self.headers,
+            timeout=httpx.Timeout(self.read_timeout, connect=self.connect_timeout),
+            limits=httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size),
+        )
+
+    async def request(self, method, path, **kwargs):
+        method = method.upper()
+        self.breaker.before_call()
+
+        try:
+            attempt = 0
+            while True:
+                try:
+                    with instrumentation.timed(instrumentation.EXTERNAL):
+                        response = await self.client.request(method, self.url(path), **kwargs)
+                except (self.httpx.ConnectError, self.httpx.ConnectTimeout, self.httpx.PoolTimeout) as e:
+                    error, retryable = e, True
+                except self.httpx.TransportError as e:
+                    error, retryable = e, method in self.idempotent_methods
+                except self.httpx.HTTPError as e:
+                    # e.g. DecodingError, TooManyRedirects: the call failed, but retrying won't help
+                    error, retryable = e, False
+                else:
+                    if response.status_code < 500:
+                        self.breaker.record_success()
+                        return response
+                    error, retryable = self.server_error(method, response.status_code)
+
+                if not retryable or attempt >= self.retries:
+                    self.fail(method, path, attempt, error)
+                attempt += 1
+                await asyncio.sleep(self.backoff_delay(attempt))
+        except GatewayError:
+            raise
+        except BaseException:
+            # cancelled (the client went away) or an error of ours: no verdict, but free a half-open trial
+            self.breaker.abandon_call()
+            raise
+
+    async def aclose(self):
+        await self.client.aclose()
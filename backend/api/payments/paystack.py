@@ -0,0 +1,79 @@
+import asyncio
+import weakref
+
+from django.conf import settings
+
+from .client import AsyncGatewayClient, CircuitBreaker, GatewayClient
+
+_client = None
+_async_clients = weakref.WeakKeyDictionary()
+# sync and async clients share one breaker: it tracks the gateway, not the transport
+_breaker = None
+
+
+def client_options():
+    global _breaker
+    if _breaker is None:
+        _breaker = CircuitBreaker(
+            threshold=settings.PAYMENT_GATEWAY_BREAKER_THRESHOLD,
+            reset_timeout=settings.PAYMENT_GATEWAY_BREAKER_RESET,
+        )
+    return dict(
+        base_url=settings.PAYSTACK_BASE_URL,
+        headers={"Authorization": f"Bearer {settings.PAYSTACK_SECRET_KEY}"},
+        connect_timeout=settings.PAYMENT_GATEWAY_CONNECT_TIMEOUT,
+        read_timeout=settings.PAYMENT_GATEWAY_READ_TIMEOUT,
+        retries=settings.PAYMENT_GATEWAY_RETRIES,
+        pool_size=settings.PAYMENT_GATEWAY_POOL_SIZE,
+        breaker=_breaker,
+        name='paystack',
+    )
+
+
+def get_client():
+    """The process-wide Paystack client, created on first use so its pool is shared by all requests."""
+    global _client
+    if _client is None:
+        _client = GatewayClient(**client_options())
+    return _client
+
+
+def get_async_client():
+    """The async Paystack client for the running event loop."""
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = _async_clients[loop] = AsyncGatewayClient(**client_options())
+    return client
+
+
+def reset_client():
+    global _client, _breaker
+    _client = None
+    _breaker = None
+    _async_clients.clear()
+
+
+def initialize_payload(email, amount, callback_url):
+    """``amount`` is in the major unit (Naira); Paystack expects kobo."""
+    return {
+        "email": email,
+        "amount": int(float(amount) * 100),
+        "callback_url": callback_url,
+    }
+
+
+def initialize_transaction(email, amount, callback_url):
+    return get_client().post("transaction/initialize", json=initialize_payload(email, amount, callback_url))
+
+
+def verify_transaction(reference):
+    return get_client().get(f"transaction/verify/{reference}")
+
+
+async def ainitialize_transaction(email, amount, callback_url):
+    return await get_async_client().post("transaction/initialize", json=initialize_payload(email, amount, callback_url))
+
+
+async def averify_transaction(reference):
+    return await get_async_client().get(f"transaction/verify/{reference}")
@@ -0,0 +1,100 @@
+"""
+Stripe Checkout. The stripe SDK takes longer to import than the rest of the
+app together, so it is imported with the first client rather than by every
+worker at startup.
+"""
+import asyncio
+import weakref
+
+from django.conf import settings
+
+from api import instrumentation
+
+_client = None
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def client_options():
+    return dict(
+        base_addresses={"api": settings.STRIPE_API_BASE},
+        max_network_retries=settings.PAYMENT_GATEWAY_RETRIES,
+    )
+
+
+def get_client():
+    """Process-wide Stripe client over a pooled requests session with connect/read timeouts."""
+    global _client
+    if _client is None:
+        import stripe
+
+        http_client = stripe.RequestsClient(
+            timeout=(settings.PAYMENT_GATEWAY_CONNECT_TIMEOUT, settings.PAYMENT_GATEWAY_READ_TIMEOUT)
+        )
+        _client = stripe.StripeClient(settings.STRIPE_SECRET_KEY, http_client=http_client, **client_options())
+    return _client
+
+
+def get_async_client():
+    """Stripe client backed by httpx for the running event loop."""
+    import httpx
+    import stripe
+
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        http_client = stripe.HTTPXClient(
+            timeout=httpx.Timeout(settings.PAYMENT_GATEWAY_READ_TIMEOUT, connect=settings.PAYMENT_GATEWAY_CONNECT_TIMEOUT)
+        )
+        client = _async_clients[loop] = stripe.StripeClient(
+            settings.STRIPE_SECRET_KEY, http_client=http_client, **client_options()
+        )
+    return client
+
+
+def reset_client():
+    global _client
+    _client = None
+    _async_clients.clear()
+
+
+def checkout_params(user, amount, frontend_url):
+    return {
+        "payment_method_types": ["card", "klarna"],
+        "line_items": [{
+            'price_data': {
+                'currency': 'gbp',
+                'product_data': {
+                    'name': 'Appointment Booking',
+                },
+                'unit_amount': int(float(amount) * 100),
+            },
+            'quantity': 1,
+        }],
+        "mode": 'payment',
+        "success_url": f'{frontend_url}/stripe-payment-success?session_id={{CHECKOUT_SESSION_ID}}',
+        "cancel_url": f"{frontend_url}/payment-cancelled",
+        "metadata": {
+            "user_id": user.id,
+            "email": user.email
+        },
+    }
+
+
+def create_checkout_session(user, amount, frontend_url):
+    with instrumentation.timed(instrumentation.EXTERNAL):
+        return get_client().checkout.sessions.create(params=checkout_params(user, amount, frontend_url))
+
+
+def retrieve_session(session_id):
+    with instrumentation.timed(instrumentation.EXTERNAL):
+        return get_client().checkout.sessions.retrieve(session_id)
+
+
+async def acreate_checkout_session(user, amount, frontend_url):
+    with instrumentation.timed(instrumentation.EXTERNAL):
+        return await get_async_client().checkout.sessions.create_async(params=checkout_params(user, amount, frontend_url))
+
+
+async def aretrieve_session(session_id):
+    with instrumentation.timed(instrumentation.EXTERNAL):
+        return await get_async_client().checkout.sessions.retrieve_async(session_id)
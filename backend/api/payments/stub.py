@@ -0,0 +1,151 @@
+"""
+A local stand-in for the payment gateways, used by tests and benchmarks.
+
+Serves the subset of the Paystack and Stripe APIs we call, over keep-alive
+HTTP/1.1 on 127.0.0.1, and can inject latency and error responses.
+"""
+import json
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.dispatch()
+
+    def do_POST(self):
+        self.dispatch()
+
+    def dispatch(self):
+        stub = self.server.stub
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        stub.record(self.command, self.path, self.client_address, self.headers)
+
+        if stub.latency:
+            time.sleep(stub.latency)
+        status = stub.next_failure()
+        if status is not None:
+            return self.reply(status, {'status': False, 'message': 'Injected failure'})
+
+        for method, pattern, handler in stub.routes:
+            match = re.fullmatch(pattern, self.path.split('?')[0])
+            if method == self.command and match:
+                return self.reply(*handler(body, **match.groupdict()))
+        self.reply(404, {'status': False, 'message': 'Not found'})
+
+    def reply(self, status, payload):
+        data = json.dumps(payload).encode()
+        try:
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+        except (BrokenPipeError, ConnectionResetError):
+            # the client gave up (timeout tests), nothing to deliver
+            self.close_connection = True
+
+
+class GatewayStub:
+    """
+    Usage::
+
+        with GatewayStub() as stub:
+            settings.PAYSTACK_BASE_URL = settings.STRIPE_API_BASE = stub.url
+            stub.fail_with(502, 502)   # next two calls fail
+            stub.latency = 0.5         # every call sleeps first
+    """
+
+    def __init__(self):
+        self.latency = 0
+        self.requests = []
+        self._failures = []
+        self._lock = threading.Lock()
+        self.routes = [
+            ('POST', r'/transaction/initialize', self.paystack_initialize),
+            ('GET', r'/transaction/verify/(?P<reference>[^/]+)', self.paystack_verify),
+            ('POST', r'/v1/checkout/sessions', self.stripe_create_session),
+            ('GET', r'/v1/checkout/sessions/(?P<session_id>[^/]+)', self.stripe_retrieve_session),
+        ]
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+        self.server.daemon_threads = True
+        self.server.stub = self
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self.server.server_address
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def fail_with(self, *statuses):
+        with self._lock:
+            self._failures.extend(statuses)
+
+    def next_failure(self):
+        with self._lock:
+            return self._failures.pop(0) if self._failures else None
+
+    def record(self, method, path, client_address, headers):
+        with self._lock:
+            self.requests.append({'method': method, 'path': path, 'client_port': client_address[1], 'headers': dict(headers)})
+
+    @property
+    def connections(self):
+        """Distinct client sockets seen, to check keep-alive reuse."""
+        return len({r['client_port'] for r in self.requests})
+
+    # Paystack
+
+    def paystack_initialize(self, body):
+        payload = json.loads(body or b'{}')
+        reference = f"ref_{uuid.uuid4().hex[:12]}"
+        return 200, {'status': True, 'message': 'Authorization URL created', 'data': {
+            'authorization_url': f"https://checkout.paystack.test/{reference}",
+            'access_code': reference,
+            'reference': reference,
+            'amount': payload.get('amount'),
+        }}
+
+    def paystack_verify(self, body, reference):
+        status = 'failed' if reference.startswith('failed') else 'success'
+        return 200, {'status': True, 'message': 'Verification successful', 'data': {
+            'status': status, 'reference': reference, 'amount': 500000, 'currency': 'NGN',
+        }}
+
+    # Stripe
+
+    def stripe_session(self, session_id, payment_status):
+        return {
+            'id': session_id, 'object': 'checkout.session', 'mode': 'payment',
+            'payment_status': payment_status, 'status': 'open' if payment_status == 'unpaid' else 'complete',
+            'url': f"https://checkout.stripe.test/{session_id}",
+        }
+
+    def stripe_create_session(self, body):
+        return 200, self.stripe_session(f"cs_test_{uuid.uuid4().hex[:12]}", 'unpaid')
+
+    def stripe_retrieve_session(self, body, session_id):
+        return 200, self.stripe_session(session_id, 'unpaid' if session_id.startswith('cs_unpaid') else 'paid')
@@ -0,0 +1,232 @@
+"""
+Idempotent payment verification.
+
+A payment that has settled never changes, so the first verification of a
+reference is stored as a ``VerifiedPayment`` and later ones (success page
+reloads, client retries) are answered from the database. Concurrent
+verifications of the same reference in this process share one upstream call.
+
+Each function returns a ``VerifiedPayment``; it is unsaved when the payment
+has not settled yet (e.g. a Stripe session still awaiting payment), so the
+next verification asks the gateway again.
+"""
+import asyncio
+import threading
+
+from asgiref.sync import sync_to_async
+from django.db import IntegrityError, transaction
+
+from api import models as api_models
+
+from . import paystack, stripe_checkout
+from .client import GatewayError
+
+PAYSTACK = api_models.VerifiedPayment.PROVIDER_PAYSTACK
+STRIPE = api_models.VerifiedPayment.PROVIDER_STRIPE
+
+
+class LeaderAborted(GatewayError):
+    """The call being shared was interrupted (e.g. by a worker shutdown) before it had an outcome."""
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Collapse concurrent calls with the same key into one; callers arriving meanwhile share its outcome."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            # a KeyboardInterrupt or SystemExit is the leader's to handle; its followers just get no outcome
+            call.error = e if isinstance(e, Exception) else LeaderAborted(f"The shared call for {key!r} was aborted")
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+
+class AsyncSingleFlight:
+    """``SingleFlight`` for coroutines; futures belong to a loop, so calls are keyed per loop."""
+
+    def __init__(self):
+        self._calls = {}
+
+    async def do(self, key, fn):
+        key = (asyncio.get_running_loop(), key)
+        while (future := self._calls.get(key)) is not None:
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    raise  # this caller was cancelled, not the leader
+                # the leader was cancelled (its client went away): try again, leading if nobody else is
+
+        future = self._calls[key] = asyncio.get_running_loop().create_future()
+        try:
+            result = await fn()
+        except Exception as e:
+            future.set_exception(e)
+            # followers retrieve it; mark it retrieved so an unshared failure isn't logged as unhandled
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            del self._calls[key]
+            if not future.done():
+                # cancelled (or another BaseException): release the followers rather than leave them waiting
+                future.cancel()
+
+
+_flight = SingleFlight()
+_async_flight = AsyncSingleFlight()
+
+
+def settled_payment(provider, reference):
+    return api_models.VerifiedPayment.objects.filter(provider=provider, reference=reference).first()
+
+
+def record(payment, settled):
+    """Persist a settled result; if another process got there first, theirs wins."""
+    if not settled:
+        return payment
+    try:
+        with transaction.atomic():
+            payment.save()
+    except IntegrityError:
+        return settled_payment(payment.provider, payment.reference)
+    link_appointments([payment])
+    return payment
+
+
+def link_appointments(payments):
+    """Attach successful payments to the appointments booked with their reference, in two queries."""
+    by_reference = {p.reference: p for p in payments if p.status == api_models.VerifiedPayment.STATUS_SUCCESS}
+    if not by_reference:
+        return 0
+    appointments = list(
+        api_models.Appointment.objects.filter(payment_reference__in=by_reference, payment__isnull=True).only('id', 'payment_reference')
+    )
+    for appointment in appointments:
+        appointment.payment = by_reference[appointment.payment_reference]
+    api_models.Appointment.objects.bulk_update(appointments, ['payment'])
+    return len(appointments)
+
+
+def paystack_payment(reference, data):
+    """``data`` is a Paystack transaction, from the verify endpoint or a ``charge.*`` webhook."""
+    success = data.get('status') == 'success'
+    payment = api_models.VerifiedPayment(
+        provider=PAYSTACK, reference=reference,
+        status=api_models.VerifiedPayment.STATUS_SUCCESS if success else api_models.VerifiedPayment.STATUS_FAILED,
+        payload=data,
+    )
+    # a failed Paystack charge can still be retried on the same reference, so only success is final
+    return payment, success
+
+
+def paystack_result(reference, response):
+    res_data = response.json()
+    data = res_data.get('data') or {}
+    if response.status_code == 200 and data:
+        return paystack_payment(reference, data)
+    payment = api_models.VerifiedPayment(
+        provider=PAYSTACK, reference=reference, status=api_models.VerifiedPayment.STATUS_FAILED, payload=res_data,
+    )
+    return payment, False
+
+
+def stripe_result(session):
+    """``session`` is a Checkout Session, retrieved from the API or taken from a webhook event."""
+    paid = session['payment_status'] in ('paid', 'no_payment_required')
+    payment = api_models.VerifiedPayment(
+        provider=STRIPE, reference=session['id'],
+        status=api_models.VerifiedPayment.STATUS_SUCCESS if paid else api_models.VerifiedPayment.STATUS_FAILED,
+        payload={
+            'id': session['id'],
+            'payment_status': session['payment_status'],
+            'status': session.get('status'),
+            'amount_total': session.get('amount_total'),
+            'currency': session.get('currency'),
+        },
+    )
+    return payment, paid or session.get('status') == 'expired'
+
+
+def verify_paystack(reference):
+    """Raises ``GatewayError`` when Paystack can't be reached and nothing is stored."""
+    payment = settled_payment(PAYSTACK, reference)
+    if payment is not None:
+        return payment
+
+    def fetch():
+        # a previous leader may have settled it between our lookup and taking the lead
+        return settled_payment(PAYSTACK, reference) or record(*paystack_result(reference, paystack.verify_transaction(reference)))
+
+    return _flight.do((PAYSTACK, reference), fetch)
+
+
+def verify_stripe(session_id):
+    payment = settled_payment(STRIPE, session_id)
+    if payment is not None:
+        return payment
+
+    def fetch():
+        return settled_payment(STRIPE, session_id) or record(*stripe_result(stripe_checkout.retrieve_session(session_id)))
+
+    return _flight.do((STRIPE, session_id), fetch)
+
+
+async def averify_paystack(reference):
+    payment = await sync_to_async(settled_payment)(PAYSTACK, reference)
+    if payment is not None:
+        return payment
+
+    async def fetch():
+        payment = await sync_to_async(settled_payment)(PAYSTACK, reference)
+        if payment is not None:
+            return payment
+        response = await paystack.averify_transaction(reference)
+        return await sync_to_async(record)(*paystack_result(reference, response))
+
+    return await _async_flight.do((PAYSTACK, reference), fetch)
+
+
+async def averify_stripe(session_id):
+    payment = await sync_to_async(settled_payment)(STRIPE, session_id)
+    if payment is not None:
+        return payment
+
+    async def fetch():
+        payment = await sync_to_async(settled_payment)(STRIPE, session_id)
+        if payment is not None:
+            return payment
+        session = await stripe_checkout.aretrieve_session(session_id)
+        return await sync_to_async(record)(*stripe_result(session))
+
+    return await _async_flight.do((STRIPE, session_id), fetch)
@@ -0,0 +1,95 @@
+"""
+Refresh-token rotation that stays flat as the blacklist grows.
+
+simplejwt checks the blacklist with a read (a join of ``BlacklistedToken``
+and ``OutstandingToken``) and then blacklists with two get-or-creates, so
+every refresh costs several queries and two concurrent refreshes of the same
+token can both pass the read. Here the unique ``BlacklistedToken.token``
+column is the check: blacklisting inserts the row, and an insert that
+conflicts means the token was already used. That insert is an index probe
+whatever the table size.
+
+Revoked jtis are also cached until their token expires, so replays of a used
+token (a client retrying, a stolen token) are turned away without touching
+the database. The cache only ever says "revoked"; a miss falls through to
+the insert, which stays correct when the cache is per-process or evicted.
+
+Expired rows are deleted in batches by ``manage.py prune_token_blacklist``.
+"""
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.utils import datetime_from_epoch
+
+
+def revoked_key(jti):
+    return f'auth:revoked:{jti}'
+
+
+def remember_revoked(jti, expires_at):
+    timeout = (expires_at - timezone.now()).total_seconds()
+    if timeout > 0:
+        cache.set(revoked_key(jti), True, timeout)
+
+
+class RotatingRefreshToken(RefreshToken):
+    """
+    A refresh token that is blacklisted as it is used. Its ``verify`` only
+    consults the revoked cache; ``blacklist`` is the authoritative check, so
+    use it only where the token is blacklisted right after (rotation).
+    """
+
+    def check_blacklist(self):
+        if cache.get(revoked_key(self.payload[api_settings.JTI_CLAIM])):
+            raise TokenError(_("Token is blacklisted"))
+
+    def blacklist(self):
+        """Blacklist the token, raising ``TokenError`` if it already was."""
+        jti = self.payload[api_settings.JTI_CLAIM]
+        expires_at = datetime_from_epoch(self.payload['exp'])
+        token_id = OutstandingToken.objects.filter(jti=jti).values_list('id', flat=True).first()
+        if token_id is None:
+            # issued without the blacklist app (or pruned early): record it now
+            token_id = self.outstand().id
+        try:
+            with transaction.atomic():
+                blacklisted = BlacklistedToken.objects.create(token_id=token_id)
+        except IntegrityError:
+            remember_revoked(jti, expires_at)
+            raise TokenError(_("Token is blacklisted"))
+        transaction.on_commit(lambda: remember_revoked(jti, expires_at))
+        return blacklisted
+
+    def outstand(self):
+        """Record the token as issued; the user id comes from the claim rather than a query."""
+        return OutstandingToken.objects.create(
+            user_id=self.payload.get(api_settings.USER_ID_CLAIM),
+            jti=self.payload[api_settings.JTI_CLAIM],
+            token=str(self),
+            created_at=self.current_time,
+            expires_at=datetime_from_epoch(self.payload['exp']),
+        )
+
+
+def prune_expired(batch_size):
+    """
+    Delete up to ``batch_size`` expired outstanding tokens and their blacklist
+    entries. Returns the number of tokens deleted; call it until it returns 0.
+    """
+    # every refresh token lives REFRESH_TOKEN_LIFETIME, so the expired rows are the oldest ids: walking the
+    # primary key finds a batch of them without an index on expires_at
+    ids = list(
+        OutstandingToken.objects.filter(expires_at__lte=timezone.now()).order_by('id')
+        .values_list('id', flat=True)[:batch_size]
+    )
+    if not ids:
+        return 0
+    with transaction.atomic():
+        BlacklistedToken.objects.filter(token_id__in=ids).delete()
+        OutstandingToken.objects.filter(id__in=ids).delete()
+    return len(ids)
@@ -0,0 +1,211 @@
+"""
+Daily booking, revenue and utilisation figures for the staff dashboard.
+
+``DailyRollup`` (per day) and ``DailyServiceRollup`` (per day and service)
+hold what the live appointments of each day add up to, so the analytics
+endpoint reads a row per day and service instead of the appointment
+history. Revenue and minutes are the prices and durations of each
+appointment's services, for the day rows and the service rows alike, so a
+day's revenue is always the sum of its services'.
+
+Whatever creates, changes, moves, cancels or deletes an appointment marks
+its days stale (api/signals.py, and the bulk import) with one upsert in the
+same transaction, so the mark commits or rolls back with the change and a
+booking never pays for the figures. ``manage.py refresh_rollups`` recomputes
+the marked days from their appointments under the same day locks bookings
+take: a whole day rather than deltas, so the rows stay exact however many
+changes land together, and a day holds a handful of appointments. A mark
+carries a token replaced by every change, and a refresh only clears the
+token it read, so a change that lands while a day is recomputed is picked
+up by the next run. The dashboard lags the bookings by the worker's poll
+interval.
+
+A change to a service's price or duration marks the days of its bookings
+to come (api/signals.py); the figures of earlier days change only when
+``manage.py rebuild_rollups`` recomputes their range.
+"""
+import threading
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q, Sum
+from django.utils import timezone
+
+from . import booking
+from . import models as api_models
+from .availability import duration_minutes, to_minutes
+
+_local = threading.local()
+
+
+class MarkedDays:
+    """The days one transaction has marked, so its signals mark each day once."""
+
+    def __init__(self):
+        self.days = set()
+
+    def forget(self):
+        _local.marked = None
+
+
+def marked_in_transaction():
+    connection = transaction.get_connection()
+    if not connection.in_atomic_block:
+        return MarkedDays()
+    marked = getattr(_local, 'marked', None)
+    # still this transaction's while its callback is pending: a commit runs it, and a rollback (or that of
+    # the savepoint it was registered in) drops it with the marks
+    if marked is None or not any(callback == marked.forget for _, callback, _ in connection.run_on_commit):
+        marked = _local.marked = MarkedDays()
+        transaction.on_commit(marked.forget)
+    return marked
+
+
+def mark_stale(days):
+    """Queue ``days`` for ``refresh_stale``, in the caller's transaction."""
+    marked = marked_in_transaction()
+    days = sorted({day for day in days if day is not None} - marked.days)
+    if not days:
+        return
+    marked.days.update(days)
+    now = timezone.now()
+    api_models.StaleRollupDay.objects.bulk_create(
+        [api_models.StaleRollupDay(date=day, marked_at=now) for day in days],
+        update_conflicts=True, unique_fields=['date'], update_fields=['token', 'marked_at'],
+    )
+
+
+def refresh_stale(batch_days=None):
+    """Recompute the longest-stale days, at most ``batch_days`` of them; returns how many."""
+    batch_days = batch_days or settings.ROLLUP_REBUILD_BATCH_DAYS
+    with transaction.atomic():
+        marks = list(
+            api_models.StaleRollupDay.objects.order_by('marked_at', 'date').values_list('date', 'token')[:batch_days]
+        )
+        if not marks:
+            return 0
+        refresh_days(day for day, _ in marks)
+        read = Q()
+        for day, token in marks:
+            read |= Q(date=day, token=token)
+        api_models.StaleRollupDay.objects.filter(read).delete()
+        # a change later in the same transaction has to mark its day again
+        _local.marked = None
+    return len(marks)
+
+
+def refresh_days(days):
+    """Recompute the rollups of ``days`` from their live appointments."""
+    days = sorted(set(days))
+    with transaction.atomic():
+        booking.lock_days(days)
+        # one row per appointment and service (one with no services for an appointment without any)
+        rows = api_models.Appointment.objects.filter(appointment_date__in=days, is_cancelled=False).values_list(
+            'id', 'appointment_date', 'services', 'services__price', 'services__duration',
+        )
+        day_rows, service_rows, counted = {}, {}, set()
+        for appointment_id, day, service_id, price, duration in rows:
+            rollup = day_rows.setdefault(day, api_models.DailyRollup(date=day))
+            if appointment_id not in counted:
+                counted.add(appointment_id)
+                rollup.bookings += 1
+            if service_id is not None:
+                add(rollup, price, duration)
+                key = (day, service_id)
+                service_rollup = service_rows.setdefault(key, api_models.DailyServiceRollup(date=day, service_id=service_id))
+                service_rollup.bookings += 1
+                add(service_rollup, price, duration)
+
+        api_models.DailyRollup.objects.filter(date__in=days).delete()
+        api_models.DailyServiceRollup.objects.filter(date__in=days).delete()
+        api_models.DailyRollup.objects.bulk_create(day_rows.values())
+        api_models.DailyServiceRollup.objects.bulk_create(service_rows.values())
+
+
+def add(rollup, price, duration):
+    rollup.revenue += price
+    rollup.booked_minutes += duration_minutes(duration)
+
+
+def rebuild(start=None, end=None, batch_days=None):
+    """Recompute every day from ``start`` to ``end`` that has appointments or rollups; returns the day count."""
+    appointments = api_models.Appointment.objects.all()
+    rollups = api_models.DailyRollup.objects.all()
+    if start is not None:
+        appointments = appointments.filter(appointment_date__gte=start)
+        rollups = rollups.filter(date__gte=start)
+    if end is not None:
+        appointments = appointments.filter(appointment_date__lte=end)
+        rollups = rollups.filter(date__lte=end)
+    days = set(appointments.values_list('appointment_date', flat=True).distinct())
+    days.update(rollups.values_list('date', flat=True))
+    days = sorted(days)
+    batch_days = batch_days or settings.ROLLUP_REBUILD_BATCH_DAYS
+    for offset in range(0, len(days), batch_days):
+        refresh_days(days[offset:offset + batch_days])
+    return len(days)
+
+
+def open_minutes():
+    """Minutes the salon is open each day, the denominator of utilisation."""
+    return max(to_minutes(settings.SALON_CLOSING_TIME) - to_minutes(settings.SALON_OPENING_TIME), 0)
+
+
+def utilisation(booked_minutes, available_minutes):
+    if not available_minutes:
+        return 0.0
+    return round(booked_minutes / available_minutes, 4)
+
+
+def report(start, end):
+    """The dashboard figures from ``start`` to ``end`` (inclusive), from the rollups alone."""
+    per_day = open_minutes()
+    rows = {
+        row.date: row for row in api_models.DailyRollup.objects.filter(date__range=(start, end)).order_by('date')
+    }
+    days = []
+    totals = {'bookings': 0, 'revenue': Decimal('0'), 'booked_minutes': 0}
+    day = start
+    while day <= end:
+        row = rows.get(day)
+        bookings, revenue, minutes = (row.bookings, row.revenue, row.booked_minutes) if row else (0, Decimal('0'), 0)
+        days.append({
+            'date': day.isoformat(),
+            'bookings': bookings,
+            'revenue': revenue,
+            'booked_minutes': minutes,
+            'utilisation': utilisation(minutes, per_day),
+        })
+        totals['bookings'] += bookings
+        totals['revenue'] += revenue
+        totals['booked_minutes'] += minutes
+        day += timedelta(days=1)
+
+    services = (
+        api_models.DailyServiceRollup.objects.filter(date__range=(start, end))
+        .values('service_id', 'service__name')
+        .annotate(bookings=Sum('bookings'), revenue=Sum('revenue'), booked_minutes=Sum('booked_minutes'))
+        .order_by('-revenue', 'service_id')
+    )
+    return {
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'open_minutes_per_day': per_day,
+        'totals': {
+            **totals,
+            'utilisation': utilisation(totals['booked_minutes'], per_day * len(days)),
+        },
+        'days': days,
+        'services': [
+            {
+                'id': row['service_id'],
+                'name': row['service__name'],
+                'bookings': row['bookings'],
+                'revenue': row['revenue'],
+                'booked_minutes': row['booked_minutes'],
+            }
+            for row in services
+        ],
+    }
@@ -0,0 +1,55 @@
+"""
+Read replica routing.
+
+Views that only read (the catalog, appointment lists, booked slots) use
+``ReplicaReadMixin``; while they run, reads go to the ``replica`` database
+alias if one is configured. Everything else reads the primary, so a
+booking's overlap check or a payment lookup never sees a lagging copy, and
+every write goes to the primary. A client may not see a booking it has just
+made in its list until the replica catches up.
+"""
+import contextvars
+from contextlib import contextmanager
+
+from django.db import DEFAULT_DB_ALIAS, connections
+
+REPLICA = 'replica'
+
+_replica_reads = contextvars.ContextVar('replica_reads', default=False)
+
+
+@contextmanager
+def replica_reads():
+    """Send reads in the block to the replica, when there is one."""
+    token = _replica_reads.set(True)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if _replica_reads.get() and REPLICA in connections.settings:
+            return REPLICA
+        return None
+
+    def db_for_write(self, model, **hints):
+        # explicit, or saving a row read from the replica would write it there
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # the replica holds the same rows as the primary
+        return {obj1._state.db, obj2._state.db} <= {DEFAULT_DB_ALIAS, REPLICA, None}
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # the replica gets its schema from the primary
+        return db != REPLICA
+
+
+class ReplicaReadMixin:
+    """Serve a read-only view from the replica. Don't use on views that write."""
+
+    def dispatch(self, request, *args, **kwargs):
+        with replica_reads():
+            return super().dispatch(request, *args, **kwargs)
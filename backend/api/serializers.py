@@ -1,14 +1,27 @@
 from rest_framework import serializers
 from django.contrib.auth.password_validation import validate_password
 from . import models as api_models
+from . import booking, passwords
+from . import images as service_images
+from .instrumentation import TimedSerializerMixin
 from django.contrib import auth
 from rest_framework.exceptions import AuthenticationFailed
 from datetime import timedelta
 from datetime import datetime
 from django.utils import timezone
+from django.db import transaction
+from decimal import Decimal
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from .authentication import user_state
+from .revocation import RotatingRefreshToken
 
 
-class RegisterSerializer(serializers.ModelSerializer):
+class TimedModelSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    """Base for our serializers; their time shows up in the request's Server-Timing."""
+
+
+class RegisterSerializer(TimedModelSerializer):
     password = serializers.CharField(write_only=True, required=True, validators=[validate_password])
     password2 = serializers.CharField(write_only=True, required=True)
 
@@ -22,16 +35,15 @@ class RegisterSerializer(serializers.ModelSerializer):
         return attrs
     
     def create(self, validated_data):
-        user = api_models.User.objects.create(
+        # hash first, so the user is written once
+        return api_models.User.objects.create(
             full_name=validated_data['full_name'],
             email=validated_data['email'],
+            password=passwords.make_password(validated_data['password']),
         )
-        user.set_password(validated_data['password'])
-        user.save()
-        return user
 
 
-class EmailVerificationSerializer(serializers.ModelSerializer):
+class EmailVerificationSerializer(TimedModelSerializer):
     token = serializers.CharField(max_length=555)
 
     class Meta:
@@ -40,7 +52,7 @@ class EmailVerificationSerializer(serializers.ModelSerializer):
 
 
 
-class LoginSerializer(serializers.ModelSerializer):
+class LoginSerializer(TimedModelSerializer):
     email = serializers.EmailField(max_length=255)
     password = serializers.CharField(max_length=255, write_only=True)
     full_name = serializers.CharField(source='get_full_name', read_only=True)
@@ -57,19 +69,41 @@ class LoginSerializer(serializers.ModelSerializer):
         email = attrs.get('email', '')
         password = attrs.get('password', '')
 
-        user = auth.authenticate(email=email, password=password)
-        if not user:
-            raise AuthenticationFailed('Invalid credentials')
-        if not user.is_active:
-            raise AuthenticationFailed('Account disabled')
-        if not user.is_verified:
-            raise AuthenticationFailed('Account not verified')
+        user = auth.authenticate(self.context.get('request'), email=email, password=password)
+        refusal = passwords.refusal(user)
+        if refusal:
+            raise AuthenticationFailed(refusal)
 
         self.instance = user  # important: required for SerializerMethodField to work
 
         return attrs
 
 
+class RotatingTokenRefreshSerializer(TokenRefreshSerializer):
+    """
+    Refresh with rotation: the used token is blacklisted (see api/revocation.py)
+    and a new one issued. The user's state comes from the authentication cache.
+    """
+    token_class = RotatingRefreshToken
+
+    def validate(self, attrs):
+        refresh = self.token_class(attrs['refresh'])
+
+        state = user_state(refresh.payload.get(api_settings.USER_ID_CLAIM))
+        if state is None or not state[0]:
+            raise AuthenticationFailed(self.error_messages['no_active_account'], 'no_active_account')
+
+        data = {'access': str(refresh.access_token)}
+        refresh.blacklist()
+
+        refresh.set_jti()
+        refresh.set_exp()
+        refresh.set_iat()
+        refresh.outstand()
+        data['refresh'] = str(refresh)
+        return data
+
+
 
 # class LoginSerializer(serializers.ModelSerializer):
 #     email = serializers.EmailField(max_length=255)
@@ -101,27 +135,38 @@ class LoginSerializer(serializers.ModelSerializer):
 #         }
 
 
-class ServiceSerializer(serializers.ModelSerializer):
+class ServiceSerializer(TimedModelSerializer):
     category = serializers.SerializerMethodField()
     category_id = serializers.PrimaryKeyRelatedField(
         queryset=api_models.Category.objects.all(),
         write_only=True,
         source="category"
     )
+    images = serializers.SerializerMethodField()
 
     class Meta:
         model = api_models.Service
-        fields = '__all__'
+        exclude = ('image_derivatives',)
 
-    def get_category(self, obj):
+    @staticmethod
+    def category_summary(category):
         return {
-            'id': obj.category.id,
-            'name': obj.category.name,
-            'description': obj.category.description,
+            'id': category.id,
+            'name': category.name,
+            'description': category.description,
         }
 
+    def get_category(self, obj):
+        summaries = self.context.get('category_summaries')
+        if summaries and obj.category_id in summaries:
+            return summaries[obj.category_id]
+        return self.category_summary(obj.category)
 
-class CategorySerializer(serializers.ModelSerializer):
+    def get_images(self, obj):
+        return service_images.urls(obj, self.context.get('request'))
+
+
+class CategorySerializer(TimedModelSerializer):
     services = serializers.SerializerMethodField()
 
     class Meta:
@@ -129,14 +174,17 @@ class CategorySerializer(serializers.ModelSerializer):
         fields = '__all__'
 
     def get_services(self, obj):
-        from .serializers import ServiceSerializer  # lazy import
+        # catalog.build_catalog() serializes all services up front and passes them in
+        services_by_category = self.context.get('services_by_category')
+        if services_by_category is not None:
+            return services_by_category.get(obj.id, [])
         services = obj.services.all()
         return ServiceSerializer(services, many=True, context=self.context).data
 
 
 
 
-class AppointmentSerializer(serializers.ModelSerializer):
+class AppointmentSerializer(TimedModelSerializer):
     services = serializers.PrimaryKeyRelatedField(
         queryset=api_models.Service.objects.all(),
         many=True,
@@ -155,32 +203,51 @@ class AppointmentSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = api_models.Appointment
-        fields = ['id', 'user', 'services', 'total_price', 'total_duration', 'status', 'service_ids', 'clientEmail', 'clientName', 'appointment_date', 'client_phone', 'appointment_time', 'payment_reference', 'is_rescheduled', 'is_cancelled']
+        fields = ['id', 'user', 'services', 'total_price', 'total_duration', 'status', 'service_ids', 'clientEmail', 'clientName', 'appointment_date', 'client_phone', 'appointment_time', 'end_time', 'payment_reference', 'is_rescheduled', 'is_cancelled']
         read_only_fields = ['is_cancelled'] # might be changed 'is_rescheduled'
-    
-    def validate(self, attrs):
-        appointment_date = attrs.get('appointment_date')
-        appointment_time = attrs.get('appointment_time')
-        services = attrs.get('services')
-        
 
-        # Compute end time based on total duration
-        total_duration = sum((service.duration for service in services), timedelta())
-        start_time = datetime.combine(appointment_date, appointment_time)
-        end_time = start_time + total_duration
-
-        overlapping = api_models.Appointment.objects.filter(
-            appointment_date=appointment_date,
-            is_cancelled=False
-        ).exclude(user=self.context['request'].user).filter(
-            appointment_time__lt=end_time.time(),
-            appointment_time__gte=appointment_time
-        )
-
-        if overlapping.exists():
-            raise serializers.ValidationError('This time slot overlaps with an existing appointment.')
+    def validate_services(self, value):
+        # the services relation holds each service once, so totals counting a repeat would not match it
+        if len({service.pk for service in value}) != len(value):
+            raise serializers.ValidationError("Each service can be booked once per appointment")
+        return value
 
+    def validate(self, attrs):
+        instance = self.instance
+        appointment_date = attrs.get('appointment_date', getattr(instance, 'appointment_date', None))
+        appointment_time = attrs.get('appointment_time', getattr(instance, 'appointment_time', None))
+        if 'services' in attrs:
+            services = attrs['services']
+        else:
+            services = list(instance.services.all()) if instance else []
+
+        # Compute end time based on total duration; the overlap check itself runs
+        # under the day lock in create()/update()
+        attrs['total_duration'] = sum((service.duration for service in services), timedelta())
+        attrs['total_price'] = sum((service.price for service in services), Decimal('0'))
+        self.booking_window = (
+            appointment_date,
+            appointment_time,
+            api_models.appointment_end_time(appointment_date, appointment_time, attrs['total_duration']),
+        )
         return attrs
+
+    def create(self, validated_data):
+        reference = validated_data.get('payment_reference')
+        if reference:
+            # the payment may already be confirmed (verify endpoint or webhook) before the booking is made
+            validated_data['payment'] = api_models.VerifiedPayment.objects.filter(
+                reference=reference, status=api_models.VerifiedPayment.STATUS_SUCCESS,
+            ).first()
+        with transaction.atomic():
+            booking.reserve(*self.booking_window)
+            return super().create(validated_data)
+
+    def update(self, instance, validated_data):
+        with transaction.atomic():
+            if not instance.is_cancelled:
+                booking.reserve(*self.booking_window, exclude=instance.pk)
+            return super().update(instance, validated_data)
     
     def get_status(self, obj):
         now = timezone.now()  # Aware datetime (UTC or your default timezone)
@@ -200,12 +267,37 @@ class AppointmentSerializer(serializers.ModelSerializer):
     
     def get_total_duration(self, obj):
         # Return total duration in minutes
-        total = obj.total_duration()
+        total = obj.total_duration
         return int(total.total_seconds() // 60)
     
     def get_total_price(self, obj):
-        total = obj.total_price()
+        total = obj.total_price
         return total
     
     def get_clientName(self, obj):
-        return f"{obj.user.full_name}"
\ No newline at end of file
+        return f"{obj.user.full_name}"
+
+
+class AppointmentImportRowSerializer(TimedSerializerMixin, serializers.Serializer):
+    """
+    One row of a bulk import (api/imports.py). ``services`` are ids checked
+    against ``context['services']`` (id -> Service), so a row costs no query.
+    """
+    client_email = serializers.EmailField(max_length=255)
+    client_name = serializers.CharField(max_length=255, required=False)
+    client_phone = serializers.CharField(max_length=20, required=False)
+    appointment_date = serializers.DateField()
+    appointment_time = serializers.TimeField()
+    services = serializers.ListField(child=serializers.IntegerField(), allow_empty=False)
+    payment_reference = serializers.CharField(max_length=100, required=False)
+    is_cancelled = serializers.BooleanField(default=False)
+
+    def validate_client_email(self, value):
+        return api_models.User.objects.normalize_email(value)
+
+    def validate_services(self, value):
+        known = self.context['services']
+        unknown = [service_id for service_id in value if service_id not in known]
+        if unknown:
+            raise serializers.ValidationError(f"Unknown services: {', '.join(map(str, unknown))}")
+        return [known[service_id] for service_id in dict.fromkeys(value)]
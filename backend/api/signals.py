@@ -0,0 +1,85 @@
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import images, rollups
+from . import models as api_models
+from .authentication import forget_user_state, remember_user_state
+from .cache import bump_catalog_version
+
+
+@receiver([post_save, post_delete], sender=api_models.Category)
+@receiver([post_save, post_delete], sender=api_models.Service)
+def invalidate_catalog_cache(sender, **kwargs):
+    # bump after commit, otherwise a concurrent read could cache the old rows under the new version
+    transaction.on_commit(bump_catalog_version)
+
+
+@receiver(post_save, sender=api_models.Service)
+def derive_service_images(sender, instance, raw=False, **kwargs):
+    if raw or images.is_current(instance):
+        return
+    # the upload is only in storage for certain once the row is committed
+    transaction.on_commit(lambda: images.derive(instance))
+
+
+@receiver(post_save, sender=api_models.Service)
+def refresh_upcoming_totals(sender, instance, raw=False, **kwargs):
+    """Reprice and retime the live bookings to come when the service's price or duration changes."""
+    if raw or not instance.terms_changed():
+        return
+    instance._stored_terms = (instance.price, instance.duration)
+    # past bookings keep the totals they were made at
+    appointments = instance.appointment_set.filter(
+        is_cancelled=False, appointment_date__gte=timezone.localdate(),
+    ).prefetch_related('services')
+    days = set()
+    for appointment in appointments.iterator(chunk_size=500):
+        appointment.refresh_totals()
+        days.add(appointment.appointment_date)
+    rollups.mark_stale(days)
+
+
+@receiver(post_save, sender=api_models.User)
+def refresh_user_state(sender, instance, **kwargs):
+    transaction.on_commit(lambda: remember_user_state(instance))
+
+
+@receiver(post_delete, sender=api_models.User)
+def drop_user_state(sender, instance, **kwargs):
+    user_id = instance.pk
+    transaction.on_commit(lambda: forget_user_state(user_id))
+
+
+@receiver(m2m_changed, sender=api_models.Appointment.services.through)
+def refresh_appointment_totals(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse and action == 'pre_clear':
+        # service.appointment_set.clear() does not report which appointments it touched
+        instance._cleared_appointment_ids = list(instance.appointment_set.values_list('pk', flat=True))
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        instance.refresh_totals()
+        rollups.mark_stale([instance.appointment_date])
+        return
+    if action == 'post_clear':
+        pk_set = instance.__dict__.pop('_cleared_appointment_ids', [])
+    appointments = api_models.Appointment.objects.filter(pk__in=pk_set).prefetch_related('services')
+    for appointment in appointments:
+        appointment.refresh_totals()
+    rollups.mark_stale(appointment.appointment_date for appointment in appointments)
+
+
+@receiver(post_save, sender=api_models.Appointment)
+def mark_rollups_on_save(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    rollups.mark_stale([instance.appointment_date, getattr(instance, '_stored_date', None)])
+    instance._stored_date = instance.appointment_date
+
+
+@receiver(post_delete, sender=api_models.Appointment)
+def mark_rollups_on_delete(sender, instance, **kwargs):
+    rollups.mark_stale([instance.appointment_date, getattr(instance, '_stored_date', None)])
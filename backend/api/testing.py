@@ -0,0 +1,15 @@
+"""
+The test runner (``TEST_RUNNER``): Django's, with query budgets enforced.
+
+Every request the suite makes is held to its view's ``query_budget`` by
+``PerformanceMiddleware``'s own count, so any test that drives a view over
+budget fails, not only ``QueryBudgetTests``.
+"""
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+
+
+class QueryBudgetTestRunner(DiscoverRunner):
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        settings.QUERY_BUDGET_ENFORCED = True
@@ -1,3 +1,1858 @@
-from django.test import TestCase
+import asyncio
+import csv
+import hashlib
+import hmac
+import io
+import json
+import logging
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time as clock
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, time, timedelta
+from decimal import Decimal
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
+from django.contrib.auth.signals import user_login_failed
+from django.core import mail
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connection, connections
+from django.db.backends.signals import connection_created
+from django.test import AsyncClient, Client, RequestFactory, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.urls import resolve, reverse
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.test import APIClient, APITestCase
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.tokens import RefreshToken
+from PIL import Image
+import requests
+
+from . import models as api_models
+from . import async_views as api_async_views
+from . import (
+    booking, coldstart, images, imports, loadtest, openapi, outbox, passwords, revocation, rollups, routers, webhooks,
+)
+from . import urls as api_urls
+from . import views as api_views
+from .admin import AppointmentAdmin
+from .authentication import ClaimsJWTAuthentication, remember_user_state
+from .availability import DayAvailability
+from .middleware import QueryBudgetExceeded
+from .payments import paystack, stripe_checkout, verification
+from .payments.client import AsyncGatewayClient, CircuitBreaker, CircuitOpenError, GatewayClient, GatewayError
+from .payments.stub import GatewayStub
+from .pagination import AppointmentHistoryPagination, AppointmentSchedulePagination
+
+# one JSON line per request is what production wants; in the test output it is noise
+logging.getLogger('api.performance').setLevel(logging.WARNING)
+
+
+def make_user(email='client@example.com', **extra):
+    user = api_models.User.objects.create_user('Test Client', email, 'S3cure-pass!')
+    for key, value in extra.items():
+        setattr(user, key, value)
+    if extra:
+        user.save()
+    return user
+
+
+def make_service(category=None, name='Silk Press', minutes=60, price='50.00'):
+    if category is None:
+        category = api_models.Category.objects.create(name=f'{name} category')
+    return api_models.Service.objects.create(
+        name=name, category=category, price=Decimal(price), duration=timedelta(minutes=minutes),
+    )
+
+
+def make_appointment(user, services, day, start, **extra):
+    appointment = api_models.Appointment.objects.create(
+        user=user, appointment_date=day, appointment_time=start, client_phone='0123456789', **extra
+    )
+    appointment.services.set(services)
+    return appointment
+
+
+class DayAvailabilityTests(TestCase):
+    def test_intervals_are_merged_and_probed(self):
+        day = DayAvailability([(600, 660), (630, 700), (800, 830)], opening='09:00', closing='17:00')
+        self.assertEqual(day.busy_windows(), [(600, 700), (800, 830)])
+        self.assertTrue(day.is_free(540, 60))
+        self.assertFalse(day.is_free(540, 61))
+        self.assertFalse(day.is_free(690, 5))
+        self.assertTrue(day.is_free(700, 100))
+        self.assertFalse(day.is_free(1000, 30))  # runs past closing
+
+    def test_free_windows_respect_duration(self):
+        day = DayAvailability([(600, 700), (730, 990)], opening='09:00', closing='17:00')
+        self.assertEqual(day.free_windows(), [(540, 600), (700, 730), (990, 1020)])
+        self.assertEqual(day.free_windows(45), [(540, 600)])
+
+    def test_add_merges_neighbours(self):
+        day = DayAvailability([(600, 630), (700, 730)])
+        day.add(620, 710)
+        self.assertEqual(day.busy_windows(), [(600, 730)])
+
+
+class BookedSlotsAPITests(APITestCase):
+    def setUp(self):
+        self.user = make_user()
+        self.long = make_service(name='Braids', minutes=90)
+        self.short = make_service(category=self.long.category, name='Trim', minutes=30)
+        self.day = date(2030, 1, 7)
+        make_appointment(self.user, [self.long], self.day, time(10, 0))
+        make_appointment(self.user, [self.short], self.day, time(14, 0), is_cancelled=True)
+        self.client.force_authenticate(self.user)
+
+    def test_returns_busy_and_free_windows_in_one_query(self):
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('booked-slots'), {'date': self.day.isoformat(), 'services': str(self.long.id)})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['booked'], ['10:00:00'])
+        self.assertEqual(response.data['busy'], [{'start': '10:00', 'end': '11:30'}])
+        self.assertEqual(response.data['free'], [{'start': '11:30', 'end': '17:00'}])
+        self.assertNotIn('09:00', response.data['available_slots'])
+        self.assertIn('11:30', response.data['available_slots'])
+
+    def test_rejects_bad_date(self):
+        response = self.client.get(reverse('booked-slots'), {'date': 'tomorrow'})
+        self.assertEqual(response.status_code, 400)
+
+
+class AvailabilityAPITests(APITestCase):
+    def setUp(self):
+        self.user = make_user()
+        self.long = make_service(name='Braids', minutes=90)
+        self.short = make_service(category=self.long.category, name='Trim', minutes=30)
+        self.monday = date(2030, 1, 7)
+        make_appointment(self.user, [self.long], self.monday, time(10, 0))
+        make_appointment(self.user, [self.short], self.monday + timedelta(days=2), time(9, 0))
+        make_appointment(self.user, [self.long], self.monday + timedelta(days=2), time(12, 0), is_cancelled=True)
+        make_appointment(self.user, [self.long], self.monday + timedelta(days=8), time(9, 0))
+        self.client.force_authenticate(self.user)
+
+    def test_week_in_one_query_per_kind(self):
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('availability'), {
+                'start': self.monday.isoformat(), 'services': f'{self.long.id},{self.short.id}',
+            })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['duration'], 120)
+        days = response.data['days']
+        self.assertEqual([day['date'] for day in days], [(self.monday + timedelta(days=n)).isoformat() for n in range(7)])
+        # 09:00-10:00 is too short for two hours
+        self.assertEqual(days[0]['free'], [{'start': '11:30', 'end': '17:00'}])
+        self.assertEqual(days[2]['busy'], [{'start': '09:00', 'end': '09:30'}])
+        self.assertEqual(days[1]['busy'], [])
+        self.assertEqual(days[1]['free'], [{'start': '09:00', 'end': '17:00'}])
+
+    def test_day_matches_booked_slots(self):
+        day = (self.monday + timedelta(days=2)).isoformat()
+        ranged = self.client.get(reverse('availability'), {'start': day, 'end': day, 'services': str(self.short.id)})
+        single = self.client.get(reverse('booked-slots'), {'date': day, 'services': str(self.short.id)})
+        self.assertEqual(len(ranged.data['days']), 1)
+        for key in ('busy', 'free', 'available_slots'):
+            self.assertEqual(ranged.data['days'][0][key], single.data[key])
+
+    def test_rejects_bad_ranges(self):
+        for params in (
+            {'start': 'monday'},
+            {'start': '2030-01-07', 'end': '2030-01-06'},
+            {'start': '2030-01-01', 'end': '2030-03-02'},  # 61 days
+            {'start': '2030-01-07', 'services': 'braids'},
+            {'start': '2030-01-07', 'services': f'{self.long.id},{self.long.id}'},
+        ):
+            with self.subTest(params=params):
+                self.assertEqual(self.client.get(reverse('availability'), params).status_code, 400)
+        response = self.client.get(reverse('availability'), {'start': '2030-01-01', 'end': '2030-03-01'})
+        self.assertEqual(len(response.data['days']), 60)
+
+
+class AppointmentListQueryTests(APITestCase):
+    def setUp(self):
+        self.staff = make_user('staff@example.com', is_staff=True)
+        self.client.force_authenticate(self.staff)
+        category = api_models.Category.objects.create(name='Colour')
+        self.services = [make_service(category, name=f'Service {i}', minutes=30) for i in range(3)]
+
+    def book(self, count):
+        for i in range(count):
+            make_appointment(self.staff, self.services, date(2030, 2, 1) + timedelta(days=i), time(9, 0))
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries)
+
+    def test_query_count_is_independent_of_row_count(self):
+        for name in ('my-appointments', 'admin-appointment-view'):
+            api_models.Appointment.objects.all().delete()
+            self.book(1)
+            single = self.count_queries(reverse(name))
+            self.book(10)
+            self.assertEqual(self.count_queries(reverse(name)), single, name)
+
+    def test_list_payload_uses_prefetched_services(self):
+        self.book(2)
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('admin-appointment-view'))
+        first = response.data['results'][0]
+        self.assertEqual(first['total_duration'], 90)
+        self.assertEqual(first['clientEmail'], 'staff@example.com')
+        self.assertEqual(first['service_ids'][0]['category']['name'], 'Colour')
+
+
+class AppointmentTotalsTests(TestCase):
+    def setUp(self):
+        self.user = make_user()
+        self.colour = make_service(name='Colour', minutes=45, price='40.00')
+        self.cut = make_service(category=self.colour.category, name='Cut', minutes=30, price='25.50')
+
+    def test_totals_follow_service_changes(self):
+        appointment = make_appointment(self.user, [self.colour], date(2030, 3, 1), time(9, 0))
+        appointment.refresh_from_db()
+        self.assertEqual(appointment.total_price, Decimal('40.00'))
+        self.assertEqual(appointment.end_time, time(9, 45))
+
+        appointment.services.add(self.cut)
+        appointment.refresh_from_db()
+        self.assertEqual(appointment.total_price, Decimal('65.50'))
+        self.assertEqual(appointment.total_duration, timedelta(minutes=75))
+        self.assertEqual(appointment.end_time, time(10, 15))
+
+        self.colour.appointment_set.remove(appointment)
+        appointment.refresh_from_db()
+        self.assertEqual(appointment.total_price, Decimal('25.50'))
+
+        self.cut.appointment_set.clear()
+        appointment.refresh_from_db()
+        self.assertEqual(appointment.total_duration, timedelta())
+        self.assertEqual(appointment.end_time, time(9, 0))
+
+    def test_repricing_a_service_updates_the_bookings_to_come(self):
+        today = timezone.localdate()
+        past = make_appointment(self.user, [self.colour], today - timedelta(days=1), time(9, 0))
+        upcoming = make_appointment(self.user, [self.colour, self.cut], today + timedelta(days=1), time(9, 0))
+        cancelled = make_appointment(self.user, [self.colour], today + timedelta(days=2), time(9, 0), is_cancelled=True)
+        rollups.refresh_stale()
+
+        colour = api_models.Service.objects.get(pk=self.colour.pk)
+        colour.name = 'Colour & gloss'
+        with self.assertNumQueries(1):
+            colour.save()
+        colour.price, colour.duration = Decimal('50.00'), timedelta(minutes=60)
+        colour.save()
+
+        for appointment in (past, upcoming, cancelled):
+            appointment.refresh_from_db()
+        self.assertEqual((upcoming.total_price, upcoming.end_time), (Decimal('75.50'), time(10, 30)))
+        self.assertEqual((past.total_price, past.end_time), (Decimal('40.00'), time(9, 45)))
+        self.assertEqual(cancelled.end_time, time(9, 45))
+        self.assertEqual(
+            list(api_models.StaleRollupDay.objects.values_list('date', flat=True)), [upcoming.appointment_date],
+        )
+
+    def test_rescheduling_moves_end_time(self):
+        appointment = make_appointment(self.user, [self.colour, self.cut], date(2030, 3, 1), time(9, 0))
+        appointment.appointment_time = time(13, 30)
+        appointment.save(update_fields=['appointment_time'])
+        appointment.refresh_from_db()
+        self.assertEqual(appointment.end_time, time(14, 45))
+
+
+class EmailOutboxTests(APITestCase):
+    def setUp(self):
+        self.user = make_user()
+        self.service = make_service()
+        self.client.force_authenticate(self.user)
+
+    def book(self):
+        return self.client.post(reverse('appointment-create'), {
+            'services': [self.service.id], 'appointment_date': '2030-04-01',
+            'appointment_time': '10:00', 'client_phone': '0123456789',
+        })
+
+    def test_booking_queues_email_without_sending(self):
+        response = self.book()
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(mail.outbox), 0)
+        queued = api_models.OutboxEmail.objects.get()
+        self.assertEqual(queued.to, self.user.email)
+        self.assertEqual(queued.status, api_models.OutboxEmail.STATUS_PENDING)
+
+        call_command('send_queued_emails', stdout=mock.MagicMock())
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].subject, 'Appointment Confirmation')
+        queued.refresh_from_db()
+        self.assertEqual(queued.status, api_models.OutboxEmail.STATUS_SENT)
+
+    def test_failed_sends_back_off_then_dead_letter(self):
+        self.book()
+        queued = api_models.OutboxEmail.objects.get()
+        with mock.patch('django.core.mail.EmailMessage.send', side_effect=OSError('smtp down')), \
+                self.assertLogs('api.outbox', 'ERROR'):
+            for attempt in range(1, 9):
+                self.assertEqual(outbox.drain(), (0, 1))
+                queued.refresh_from_db()
+                self.assertEqual(queued.attempts, attempt)
+                if queued.status == api_models.OutboxEmail.STATUS_PENDING:
+                    self.assertGreater(queued.next_attempt_at, timezone.now())
+                    self.assertEqual(outbox.drain(), (0, 0))  # not due yet
+                    api_models.OutboxEmail.objects.update(next_attempt_at=timezone.now())
+        self.assertEqual(queued.status, api_models.OutboxEmail.STATUS_DEAD)
+        self.assertEqual(queued.last_error, 'smtp down')
+        self.assertEqual(outbox.drain(), (0, 0))
+
+
+class CatalogCacheTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.service = make_service(name='Knotless Braids')
+
+    def test_repeat_requests_are_served_without_the_database(self):
+        url = reverse('category-list')
+        first = self.client.get(url)
+        self.assertEqual(first.status_code, 200)
+        etag = first['ETag']
+        self.assertTrue(etag.startswith('"'))
+
+        with self.assertNumQueries(0):
+            cached = self.client.get(url)
+            not_modified = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(cached.data, first.data)
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified['ETag'], etag)
+
+    def test_catalog_changes_bump_the_version(self):
+        url = reverse('service-list')
+        etag = self.client.get(url)['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.service.name = 'Box Braids'
+            self.service.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.data[0]['name'], 'Box Braids')
+
+    def test_missing_category_is_not_cached(self):
+        url = reverse('category-detail', kwargs={'slug': 'nope'})
+        self.assertEqual(self.client.get(url).status_code, 404)
+        api_models.Category.objects.create(name='Nope')
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+
+class CatalogBuilderTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        for c in range(3):
+            category = api_models.Category.objects.create(name=f'Category {c}')
+            for s in range(4):
+                make_service(category, name=f'Service {c}-{s}')
+
+    def test_category_list_uses_constant_queries(self):
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('category-list'))
+        self.assertEqual(len(response.data), 3)
+        first = response.data[0]
+        self.assertEqual([s['name'] for s in first['services']], [f'Service 0-{s}' for s in range(4)])
+        self.assertEqual(first['services'][0]['category'], {'id': first['id'], 'name': 'Category 0', 'description': None})
+
+    def test_category_detail_serializes_services_once(self):
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('category-detail', kwargs={'slug': 'category-1'}))
+        self.assertEqual(response.data['category']['name'], 'Category 1')
+        self.assertEqual(response.data['services'], response.data['category']['services'])
+        self.assertEqual(len(response.data['services']), 4)
+
+
+class ServiceImageTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        overrides = self.settings(MEDIA_ROOT=media.name)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.service = make_service(name='Knotless Braids')
+
+    def photo(self, name='braids.jpg', size=(2000, 1000), color='purple'):
+        output = io.BytesIO()
+        Image.new('RGB', size, color).save(output, 'JPEG')
+        return SimpleUploadedFile(name, output.getvalue(), content_type='image/jpeg')
+
+    def upload(self, photo):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.service.image = photo
+            self.service.save()
+        self.service.refresh_from_db()
+
+    def test_upload_makes_resized_derivatives(self):
+        self.upload(self.photo())
+        paths = self.service.image_derivatives['paths']
+        self.assertEqual(set(paths), set(images.VARIANTS))
+        for variant, path in paths.items():
+            self.assertRegex(path, rf'^service-images/derived/[0-9a-f]{{20}}-{variant}\.webp$')
+            with self.service.image.storage.open(path) as derived, Image.open(derived) as picture:
+                self.assertEqual(picture.format, 'WEBP')
+                width, height = images.VARIANTS[variant]
+                self.assertEqual(picture.size, (width, width // 2))
+
+        response = self.client.get(reverse('service-list'))
+        self.assertEqual(
+            response.data[0]['images'],
+            {variant: f'http://testserver/media/{path}' for variant, path in paths.items()},
+        )
+        self.assertNotIn('image_derivatives', response.data[0])
+
+    def test_unchanged_images_are_not_reprocessed(self):
+        self.upload(self.photo())
+        paths = self.service.image_derivatives['paths']
+        with mock.patch.object(images, 'render', wraps=images.render) as render:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.service.name = 'Box Braids'
+                self.service.save()
+            # the same bytes uploaded again under another name find their derivatives made
+            self.upload(self.photo(name='braids-again.jpg'))
+            render.assert_not_called()
+            self.assertEqual(self.service.image_derivatives['paths'], paths)
+
+            self.upload(self.photo(color='teal'))
+            render.assert_called_once()
+        self.assertNotEqual(self.service.image_derivatives['paths'], paths)
+
+    def test_small_and_unreadable_images(self):
+        self.upload(self.photo(size=(100, 50)))
+        storage = self.service.image.storage
+        with storage.open(self.service.image_derivatives['paths']['hero']) as derived, Image.open(derived) as hero:
+            self.assertEqual(hero.size, (100, 50))  # never enlarged
+
+        with self.assertLogs('api.images', 'WARNING'):
+            self.upload(SimpleUploadedFile('notes.jpg', b'not an image'))
+        self.assertEqual(self.service.image_derivatives['paths'], {})
+        self.assertIsNone(self.client.get(reverse('service-list')).data[0]['images'])
+
+    def test_backfill_command(self):
+        # media uploaded before derivatives existed
+        api_models.Service.objects.filter(pk=self.service.pk).update(
+            image=self.service.image.storage.save('service-images/old.jpg', self.photo()),
+        )
+        make_service(name='Cornrows')
+
+        call_command('build_image_derivatives', '--workers', '2', stdout=io.StringIO())
+        self.service.refresh_from_db()
+        self.assertTrue(images.is_current(self.service))
+        self.assertEqual(len(self.service.image_derivatives['paths']), len(images.VARIANTS))
+
+        output = io.StringIO()
+        call_command('build_image_derivatives', stdout=output)
+        self.assertIn("up to date", output.getvalue())
+
+
+class AppointmentPaginationTests(APITestCase):
+    def setUp(self):
+        self.staff = make_user('staff@example.com', is_staff=True)
+        self.client.force_authenticate(self.staff)
+        service = make_service(minutes=30)
+        self.appointments = []
+        for day in range(5):
+            for hour in (9, 11):
+                appointment = make_appointment(
+                    self.staff, [service], date(2030, 5, 1) + timedelta(days=day), time(hour, 0),
+                    is_cancelled=(hour == 11 and day % 2 == 0),
+                )
+                self.appointments.append(appointment)
+
+    def walk(self, url, params):
+        ids = []
+        while url:
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, 200)
+            ids.extend(row['id'] for row in response.data['results'])
+            url, params = response.data['next'], None
+        return ids
+
+    def test_admin_schedule_pages_in_calendar_order(self):
+        ids = self.walk(reverse('admin-appointment-view'), {'page_size': 3})
+        self.assertEqual(ids, [a.id for a in self.appointments])
+
+    def test_history_pages_newest_first(self):
+        ids = self.walk(reverse('my-appointments'), {'page_size': 4})
+        self.assertEqual(ids, [a.id for a in reversed(self.appointments)])
+
+    def test_deep_pages_filter_by_key_not_offset(self):
+        url = reverse('admin-appointment-view')
+        first = self.client.get(url, {'page_size': 2})
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(first.data['next'])
+        sql = ctx.captured_queries[0]['sql']
+        self.assertNotIn('OFFSET', sql)
+        self.assertIn('"appointment_date" >', sql)
+
+    def test_filters(self):
+        url = reverse('admin-appointment-view')
+        response = self.client.get(url, {'date_from': '2030-05-02', 'date_to': '2030-05-03', 'cancelled': 'false'})
+        self.assertEqual(len(response.data['results']), 3)
+        response = self.client.get(url, {'cancelled': 'true'})
+        self.assertEqual(len(response.data['results']), 3)
+        self.assertEqual(self.client.get(url, {'date_from': 'soon'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'cursor': 'garbage'}).status_code, 404)
+
+
+@skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN output is SQLite specific')
+class AppointmentQueryPlanTests(TestCase):
+    """The hot appointment queries must be answered from an index, never a full table scan."""
+
+    day = date(2030, 6, 1)
+
+    def assertIndexed(self, queryset, ordered=False):
+        plan = queryset.explain()
+        self.assertIsNone(re.search(r'SCAN api_appointment(?! USING (COVERING )?INDEX)', plan), plan)
+        self.assertIn('api_appointment USING', plan)
+        if ordered:
+            self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_day_occupancy(self):
+        self.assertIndexed(api_models.Appointment.objects.active_on(self.day).values_list('appointment_time', 'end_time'))
+
+    def test_overlap_check(self):
+        self.assertIndexed(api_models.Appointment.objects.overlapping(self.day, time(10), time(11)))
+
+    def test_client_history_pages(self):
+        user = make_user()
+        pagination = AppointmentHistoryPagination()
+        queryset = api_models.Appointment.objects.filter(user=user).order_by(*pagination.ordering)
+        self.assertIndexed(queryset[:21], ordered=True)
+        after = pagination.after([timezone.now(), 10])
+        self.assertIndexed(queryset.filter(after)[:21], ordered=True)
+
+    def test_staff_schedule_pages(self):
+        pagination = AppointmentSchedulePagination()
+        after = pagination.after([self.day, time(12), 10])
+        for queryset in (api_models.Appointment.objects.all(), api_models.Appointment.objects.filter(is_cancelled=False)):
+            queryset = queryset.order_by(*pagination.ordering)
+            self.assertIndexed(queryset[:21], ordered=True)
+            self.assertIndexed(queryset.filter(after)[:21], ordered=True)
+            ranged = queryset.filter(appointment_date__gte=self.day, appointment_date__lte=self.day + timedelta(days=7))
+            self.assertIndexed(ranged[:21], ordered=True)
+
+    def test_admin_date_filter(self):
+        request = RequestFactory().get('/admin/api/appointment/')
+        queryset = AppointmentAdmin(api_models.Appointment, admin.site).get_queryset(request)
+        ranged = queryset.filter(appointment_date__gte=self.day, appointment_date__lt=self.day + timedelta(days=1))
+        self.assertIndexed(ranged[:100], ordered=True)
+
+
+class OverlapDetectionTests(APITestCase):
+    def setUp(self):
+        self.user = make_user()
+        self.other = make_user('other@example.com')
+        self.service = make_service(minutes=60)
+        self.existing = make_appointment(self.other, [self.service], date(2030, 7, 1), time(10, 0))
+        self.client.force_authenticate(self.user)
+
+    def book(self, start, services=None, day='2030-07-01'):
+        return self.client.post(reverse('appointment-create'), {
+            'services': [s.id for s in services or [self.service]], 'appointment_date': day,
+            'appointment_time': start, 'client_phone': '0123456789',
+        })
+
+    def test_rejects_booking_that_runs_into_an_existing_one(self):
+        response = self.book('09:30')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('overlaps', str(response.data))
+
+    def test_rejects_booking_that_starts_inside_an_existing_one(self):
+        self.assertEqual(self.book('10:59').status_code, 400)
+
+    def test_back_to_back_bookings_are_allowed(self):
+        self.assertEqual(self.book('09:00').status_code, 201)
+        self.assertEqual(self.book('11:00').status_code, 201)
+
+    def test_rejects_a_service_listed_twice(self):
+        response = self.book('13:00', [self.service, self.service])
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('services', response.data)
+
+    def test_own_bookings_also_conflict(self):
+        self.assertEqual(self.book('13:00').status_code, 201)
+        self.assertEqual(self.book('13:30').status_code, 400)
+
+    def test_rescheduling_ignores_the_appointment_being_moved(self):
+        self.client.force_authenticate(self.other)
+        url = reverse('appointment-update', kwargs={'pk': self.existing.pk})
+        response = self.client.patch(url, {'appointment_time': '10:30', 'is_rescheduled': True})
+        self.assertEqual(response.status_code, 200)
+        self.existing.refresh_from_db()
+        self.assertEqual(self.existing.end_time, time(11, 30))
+
+
+class ConcurrentBookingTests(TransactionTestCase):
+    """Hundreds of simultaneous requests for one slot: exactly one may win."""
+
+    attempts = 200
+
+    def test_only_one_concurrent_booking_succeeds(self):
+        service = make_service(minutes=60)
+        users = api_models.User.objects.bulk_create([
+            api_models.User(full_name=f'Client {i}', email=f'client{i}@example.com', password='!')
+            for i in range(self.attempts)
+        ])
+        barrier = threading.Barrier(self.attempts)
+        outcomes = []
+
+        def attempt(user, offset):
+            client = APIClient()
+            client.force_authenticate(user)
+            barrier.wait()
+            try:
+                response = client.post(reverse('appointment-create'), {
+                    'services': [service.id], 'appointment_date': '2030-08-01',
+                    # staggered starts, all inside the same hour, so every pair overlaps
+                    'appointment_time': f'10:{offset % 30:02d}', 'client_phone': '0123456789',
+                })
+                outcomes.append(response.status_code)
+            except Exception as e:  # e.g. "database is locked", recorded so the assertion shows it
+                outcomes.append(repr(e))
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=attempt, args=(user, i)) for i, user in enumerate(users)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(outcomes.count(201), 1, outcomes)
+        self.assertEqual(outcomes.count(400), self.attempts - 1)
+        self.assertEqual(api_models.Appointment.objects.count(), 1)
+
+
+class GatewayClientTests(TestCase):
+    def setUp(self):
+        self.stub = GatewayStub().start()
+        self.addCleanup(self.stub.stop)
+
+    def client_for(self, **kwargs):
+        kwargs.setdefault('backoff', 0)
+        return GatewayClient(self.stub.url, **kwargs)
+
+    def test_connections_are_kept_alive(self):
+        client = self.client_for()
+        for _ in range(3):
+            self.assertEqual(client.get('transaction/verify/abc').status_code, 200)
+        self.assertEqual(self.stub.connections, 1)
+
+    def test_idempotent_calls_retry_server_errors(self):
+        self.stub.fail_with(502, 503)
+        response = self.client_for(retries=2).get('transaction/verify/abc')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(self.stub.requests), 3)
+
+    def test_posts_are_not_retried_after_reaching_the_gateway(self):
+        self.stub.fail_with(502)
+        with self.assertRaises(GatewayError), self.assertLogs('api.payments.client', 'WARNING'):
+            self.client_for(retries=2).post('transaction/initialize', json={})
+        self.assertEqual(len(self.stub.requests), 1)
+
+    def test_read_timeout_bounds_a_stalled_gateway(self):
+        self.stub.latency = 0.5
+        started = clock.monotonic()
+        with self.assertRaises(GatewayError), self.assertLogs('api.payments.client', 'WARNING'):
+            self.client_for(read_timeout=0.1, retries=0).get('transaction/verify/abc')
+        self.assertLess(clock.monotonic() - started, 0.4)
+
+    def test_circuit_opens_and_half_opens(self):
+        now = [0.0]
+        breaker = CircuitBreaker(threshold=2, reset_timeout=10, clock=lambda: now[0])
+        client = self.client_for(retries=0, breaker=breaker)
+        self.stub.fail_with(500, 500)
+        with self.assertLogs('api.payments.client', 'WARNING'):
+            for _ in range(2):
+                with self.assertRaises(GatewayError):
+                    client.get('transaction/verify/abc')
+        with self.assertRaises(CircuitOpenError):
+            client.get('transaction/verify/abc')
+        self.assertEqual(len(self.stub.requests), 2)  # short-circuited, gateway not called
+
+        now[0] = 11
+        self.assertEqual(breaker.state, 'half-open')
+        self.assertEqual(client.get('transaction/verify/abc').status_code, 200)
+        self.assertEqual(breaker.state, 'closed')
+
+    def test_any_outcome_of_a_half_open_trial_releases_it(self):
+        now = [0.0]
+        breaker = CircuitBreaker(threshold=1, reset_timeout=10, clock=lambda: now[0])
+        client = self.client_for(retries=0, breaker=breaker)
+        breaker.record_failure()
+
+        now[0] = 11
+        with mock.patch.object(client.session, 'request', side_effect=requests.exceptions.ChunkedEncodingError('cut')), \
+                self.assertRaises(GatewayError), self.assertLogs('api.payments.client', 'WARNING'):
+            client.get('transaction/verify/abc')
+        self.assertEqual(breaker.state, 'open')  # counted as a failure
+
+        now[0] = 22
+        with mock.patch.object(client.session, 'request', side_effect=KeyboardInterrupt):
+            with self.assertRaises(KeyboardInterrupt):
+                client.get('transaction/verify/abc')
+        self.assertEqual(breaker.state, 'half-open')
+        self.assertEqual(client.get('transaction/verify/abc').status_code, 200)
+        self.assertEqual(breaker.state, 'closed')
+
+    def test_cancelled_async_trial_releases_it(self):
+        now = [0.0]
+        breaker = CircuitBreaker(threshold=1, reset_timeout=10, clock=lambda: now[0])
+        breaker.record_failure()
+        now[0] = 11
+        self.stub.latency = 1
+
+        async def cancel_trial():
+            client = AsyncGatewayClient(self.stub.url, retries=0, breaker=breaker)
+            try:
+                call = asyncio.ensure_future(client.get('transaction/verify/abc'))
+                await asyncio.sleep(0.1)
+                call.cancel()
+                with self.assertRaises(asyncio.CancelledError):
+                    await call
+            finally:
+                await client.aclose()
+
+        async_to_sync(cancel_trial)()
+        self.assertFalse(breaker.trial_in_flight)
+
+
+class PaystackViewTests(APITestCase):
+    SECRET_KEY = 'sk_test_view'
+
+    def setUp(self):
+        self.stub = GatewayStub().start()
+        self.addCleanup(self.stub.stop)
+        overrides = self.settings(
+            PAYSTACK_BASE_URL=self.stub.url, PAYSTACK_SECRET_KEY=self.SECRET_KEY, PAYMENT_GATEWAY_RETRIES=0,
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        paystack.reset_client()
+        self.addCleanup(paystack.reset_client)
+        self.client.force_authenticate(make_user())
+
+    def test_initialize_and_verify(self):
+        response = self.client.post(reverse('paystack-payment'), {'email': 'a@example.com', 'amount': '50.5'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['amount'], 5050)
+        self.assertEqual(self.stub.requests[0]['headers']['Authorization'], f'Bearer {self.SECRET_KEY}')
+
+        response = self.client.get(reverse('verify-paystack-payment'), {'reference': response.data['reference']})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['status'], 'success')
+
+    def test_gateway_outage_is_a_503(self):
+        self.stub.fail_with(500)
+        with self.assertLogs('api.payments.client', 'WARNING'):
+            response = self.client.get(reverse('verify-paystack-payment'), {'reference': 'abc'})
+        self.assertEqual(response.status_code, 503)
+
+
+class AsyncPaymentViewTests(TestCase):
+    def setUp(self):
+        self.stub = GatewayStub().start()
+        self.addCleanup(self.stub.stop)
+        overrides = self.settings(PAYSTACK_BASE_URL=self.stub.url, STRIPE_API_BASE=self.stub.url, PAYMENT_GATEWAY_RETRIES=0)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        for module in (paystack, stripe_checkout):
+            module.reset_client()
+            self.addCleanup(module.reset_client)
+        self.auth = {'Authorization': f"Bearer {make_user().tokens()['access']}"}
+        self.client = AsyncClient()
+
+    async def test_paystack_initialize_and_verify(self):
+        response = await self.client.post(
+            reverse('paystack-payment-async'), {'email': 'a@example.com', 'amount': '50.5'},
+            content_type='application/json', headers=self.auth,
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['amount'], 5050)
+
+        response = await self.client.get(
+            reverse('verify-paystack-payment-async'), {'reference': response.json()['reference']}, headers=self.auth,
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['status'], 'success')
+
+    async def test_failed_paystack_payment(self):
+        response = await self.client.get(reverse('verify-paystack-payment-async'), {'reference': 'failed_1'}, headers=self.auth)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['status'], 'failed')
+
+    async def test_paystack_outage_is_a_503(self):
+        self.stub.fail_with(500)
+        with self.assertLogs('api.payments.client', 'WARNING'):
+            response = await self.client.get(reverse('verify-paystack-payment-async'), {'reference': 'abc'}, headers=self.auth)
+        self.assertEqual(response.status_code, 503)
+
+    async def test_stripe_checkout_and_verify(self):
+        response = await self.client.post(
+            reverse('stripe-payment-async'), {'amount': '20'}, content_type='application/json', headers=self.auth,
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()['checkout_url'].startswith('https://checkout.stripe.test/'))
+
+        response = await self.client.get(reverse('verify-stripe-payment-async'), {'session_id': 'cs_test_1'}, headers=self.auth)
+        self.assertEqual(response.json(), {'status': 'success', 'session_id': 'cs_test_1'})
+        response = await self.client.get(reverse('verify-stripe-payment-async'), {'session_id': 'cs_unpaid_1'}, headers=self.auth)
+        self.assertEqual(response.status_code, 400)
+
+    async def test_requires_a_valid_token(self):
+        response = await self.client.get(reverse('verify-paystack-payment-async'), {'reference': 'abc'})
+        self.assertEqual(response.status_code, 401)
+        response = await self.client.get(
+            reverse('verify-paystack-payment-async'), {'reference': 'abc'}, headers={'Authorization': 'Bearer nope'},
+        )
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(self.stub.requests, [])
+
+
+class StripeViewTests(APITestCase):
+    def setUp(self):
+        self.stub = GatewayStub().start()
+        self.addCleanup(self.stub.stop)
+        overrides = self.settings(STRIPE_API_BASE=self.stub.url)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        stripe_checkout.reset_client()
+        self.addCleanup(stripe_checkout.reset_client)
+        self.client.force_authenticate(make_user())
+
+    def test_checkout_and_verify(self):
+        response = self.client.post(reverse('stripe-payment'), {'amount': '20'})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('/v1/checkout/sessions', self.stub.requests[0]['path'])
+
+        response = self.client.get(reverse('verify-stripe-payment'), {'session_id': 'cs_test_1'})
+        self.assertEqual(response.data, {'status': 'success', 'session_id': 'cs_test_1'})
+
+
+class PaymentVerificationTests(TestCase):
+    def setUp(self):
+        self.stub = GatewayStub().start()
+        self.addCleanup(self.stub.stop)
+        overrides = self.settings(PAYSTACK_BASE_URL=self.stub.url, STRIPE_API_BASE=self.stub.url, PAYMENT_GATEWAY_RETRIES=0)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        for module in (paystack, stripe_checkout):
+            module.reset_client()
+            self.addCleanup(module.reset_client)
+        self.client = APIClient()
+        self.client.force_authenticate(make_user())
+
+    def test_settled_payment_is_served_locally(self):
+        for _ in range(3):
+            response = self.client.get(reverse('verify-paystack-payment'), {'reference': 'ref_1'})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.data['data']['reference'], 'ref_1')
+        self.assertEqual(len(self.stub.requests), 1)
+        self.assertTrue(api_models.VerifiedPayment.objects.filter(provider='paystack', reference='ref_1').exists())
+
+    def test_unsettled_payments_are_checked_again(self):
+        for _ in range(2):
+            self.assertEqual(self.client.get(reverse('verify-paystack-payment'), {'reference': 'failed_1'}).status_code, 400)
+            self.assertEqual(self.client.get(reverse('verify-stripe-payment'), {'session_id': 'cs_unpaid_1'}).status_code, 400)
+        self.assertEqual(len(self.stub.requests), 4)
+        self.assertFalse(api_models.VerifiedPayment.objects.exists())
+
+    def test_stripe_and_async_views_share_the_record(self):
+        self.assertEqual(self.client.get(reverse('verify-stripe-payment'), {'session_id': 'cs_test_1'}).status_code, 200)
+        auth = {'Authorization': f"Bearer {make_user('other@example.com').tokens()['access']}"}
+        response = async_to_sync(AsyncClient().get)(
+            reverse('verify-stripe-payment-async'), {'session_id': 'cs_test_1'}, headers=auth,
+        )
+        self.assertEqual(response.json(), {'status': 'success', 'session_id': 'cs_test_1'})
+        self.assertEqual(len(self.stub.requests), 1)
+
+    def test_concurrent_async_verifications_share_one_call(self):
+        self.stub.latency = 0.2
+
+        async def verify_many():
+            return await asyncio.gather(*(verification.averify_paystack('ref_2') for _ in range(10)))
+
+        payments = async_to_sync(verify_many)()
+        self.assertEqual({p.status for p in payments}, {'success'})
+        self.assertEqual(len(self.stub.requests), 1)
+
+    def test_single_flight_shares_outcome_between_threads(self):
+        flight = verification.SingleFlight()
+        calls = []
+        release = threading.Event()
+
+        def fetch():
+            calls.append(1)
+            release.wait(5)
+            return 'settled'
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(flight.do('ref', fetch))) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        clock.sleep(0.1)
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(calls, [1])
+        self.assertEqual(results, ['settled'] * 8)
+
+    def test_single_flight_propagates_errors_and_forgets_them(self):
+        flight = verification.SingleFlight()
+        with self.assertRaises(GatewayError):
+            flight.do('ref', mock.Mock(side_effect=GatewayError('down')))
+        self.assertEqual(flight.do('ref', lambda: 'ok'), 'ok')
+
+    def test_single_flight_followers_of_an_aborted_leader_get_an_error(self):
+        flight = verification.SingleFlight()
+        started, release = threading.Event(), threading.Event()
+        outcomes = []
+
+        def fetch():
+            started.set()
+            release.wait(5)
+            raise SystemExit
+
+        def run():
+            try:
+                outcomes.append(flight.do('ref', fetch))
+            except BaseException as e:
+                outcomes.append(type(e))
+
+        leader = threading.Thread(target=run)
+        leader.start()
+        started.wait(5)
+        follower = threading.Thread(target=run)
+        follower.start()
+        clock.sleep(0.1)
+        release.set()
+        leader.join()
+        follower.join()
+        self.assertEqual(sorted(outcomes, key=lambda error: error.__name__), [verification.LeaderAborted, SystemExit])
+        self.assertEqual(flight.do('ref', lambda: 'ok'), 'ok')
+
+    def test_async_single_flight_survives_a_cancelled_leader(self):
+        flight = verification.AsyncSingleFlight()
+        calls = []
+
+        async def fetch():
+            calls.append(1)
+            if len(calls) == 1:
+                await asyncio.sleep(10)  # the leader, cancelled while it waits
+            return 'settled'
+
+        async def run():
+            leader = asyncio.ensure_future(flight.do('ref', fetch))
+            await asyncio.sleep(0)
+            follower = asyncio.ensure_future(flight.do('ref', fetch))
+            await asyncio.sleep(0)
+            leader.cancel()
+            result = await asyncio.wait_for(follower, 2)
+            with self.assertRaises(asyncio.CancelledError):
+                await leader
+            return result
+
+        self.assertEqual(async_to_sync(run)(), 'settled')
+        self.assertEqual(calls, [1, 1])
+
+
+STRIPE_WEBHOOK_SECRET = 'whsec_test'
+
+
+def stripe_event(event_id, session_id, event_type='checkout.session.completed', payment_status='paid', status='complete'):
+    return {
+        'id': event_id, 'object': 'event', 'type': event_type,
+        'data': {'object': {
+            'id': session_id, 'object': 'checkout.session', 'payment_status': payment_status,
+            'status': status, 'amount_total': 2000, 'currency': 'gbp',
+        }},
+    }
+
+
+def paystack_event(reference, transaction_id=1, status='success'):
+    return {'event': 'charge.success', 'data': {
+        'id': transaction_id, 'reference': reference, 'status': status, 'amount': 500000, 'currency': 'NGN',
+    }}
+
+
+def stripe_signature(body, timestamp=None, secret=STRIPE_WEBHOOK_SECRET):
+    timestamp = int(clock.time()) if timestamp is None else timestamp
+    digest = hmac.new(secret.encode(), f"{timestamp}.".encode() + body, hashlib.sha256).hexdigest()
+    return f"t={timestamp},v1={digest}"
+
+
+def paystack_signature(body, secret='sk_test'):
+    return hmac.new(secret.encode(), body, hashlib.sha512).hexdigest()
+
+
+class WebhookTests(TestCase):
+    def setUp(self):
+        overrides = self.settings(STRIPE_WEBHOOK_SECRET=STRIPE_WEBHOOK_SECRET, PAYSTACK_SECRET_KEY='sk_test')
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        # the request path must not reach the gateways
+        for target in ('api.payments.paystack.get_client', 'api.payments.stripe_checkout.get_client'):
+            patcher = mock.patch(target, side_effect=AssertionError('outbound call'))
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def post_stripe(self, event, signature=None):
+        body = json.dumps(event).encode()
+        return self.client.post(
+            reverse('stripe-webhook'), body, content_type='application/json',
+            headers={'Stripe-Signature': signature or stripe_signature(body)},
+        )
+
+    def post_paystack(self, event, signature=None):
+        body = json.dumps(event).encode()
+        return self.client.post(
+            reverse('paystack-webhook'), body, content_type='application/json',
+            headers={'X-Paystack-Signature': signature or paystack_signature(body)},
+        )
+
+    def test_signed_events_are_stored_once(self):
+        event = stripe_event('evt_1', 'cs_test_1')
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(self.post_stripe(event).status_code, 200)
+        self.assertEqual(len(ctx.captured_queries), 1)
+        self.assertEqual(self.post_stripe(event).status_code, 200)
+        self.assertEqual(self.post_paystack(paystack_event('ref_1')).status_code, 200)
+        self.assertEqual(self.post_paystack(paystack_event('ref_1')).status_code, 200)
+        self.assertEqual(api_models.WebhookEvent.objects.count(), 2)
+
+    def test_events_without_a_transaction_are_told_apart(self):
+        first = {'event': 'charge.success', 'data': {'amount': 100}}
+        second = {'event': 'charge.success', 'data': {'amount': 200}}
+        for event in (first, second, first, {'event': 'charge.success', 'data': None}):
+            self.assertEqual(self.post_paystack(event).status_code, 200)
+        event_ids = list(api_models.WebhookEvent.objects.values_list('event_id', flat=True))
+        self.assertEqual(len(event_ids), 3)
+        self.assertNotIn('charge.success:None', event_ids)
+
+    def test_bad_signatures_are_rejected(self):
+        event = stripe_event('evt_1', 'cs_test_1')
+        body = json.dumps(event).encode()
+        self.assertEqual(self.post_stripe(event, stripe_signature(body, secret='whsec_other')).status_code, 400)
+        self.assertEqual(self.post_stripe(event, stripe_signature(body, timestamp=int(clock.time()) - 3600)).status_code, 400)
+        self.assertEqual(self.post_stripe(event, 'garbage').status_code, 400)
+        self.assertEqual(self.post_paystack(paystack_event('ref_1'), paystack_signature(b'{}')).status_code, 400)
+        self.assertEqual(self.client.post(reverse('paystack-webhook'), {}, content_type='application/json').status_code, 400)
+        self.assertFalse(api_models.WebhookEvent.objects.exists())
+
+    def test_batch_links_payments_to_appointments(self):
+        user = make_user()
+        service = make_service()
+        paid = make_appointment(user, [service], date(2030, 1, 7), time(10, 0), payment_reference='cs_test_1')
+        paystack_paid = make_appointment(user, [service], date(2030, 1, 7), time(12, 0), payment_reference='ref_1')
+        unpaid = make_appointment(user, [service], date(2030, 1, 7), time(14, 0), payment_reference='cs_unpaid_1')
+
+        self.post_stripe(stripe_event('evt_1', 'cs_test_1'))
+        self.post_stripe(stripe_event('evt_2', 'cs_unpaid_1', payment_status='unpaid', status='open'))
+        self.post_stripe(stripe_event('evt_3', 'cs_test_1', event_type='customer.created'))
+        self.post_paystack(paystack_event('ref_1'))
+
+        # claim (3), then one transaction: insert payments, read them back, link appointments, mark processed
+        with self.assertNumQueries(10):
+            self.assertEqual(webhooks.process_batch(), (4, 0))
+        self.assertEqual(webhooks.process_batch(), (0, 0))
+
+        paid.refresh_from_db()
+        paystack_paid.refresh_from_db()
+        unpaid.refresh_from_db()
+        self.assertEqual(paid.payment.provider, 'stripe')
+        self.assertEqual(paystack_paid.payment.payload['amount'], 500000)
+        self.assertIsNone(unpaid.payment)
+        self.assertEqual(
+            set(api_models.WebhookEvent.objects.values_list('status', flat=True)), {api_models.WebhookEvent.STATUS_PROCESSED}
+        )
+        # the verify endpoint now answers from the stored result
+        api_client = APIClient()
+        api_client.force_authenticate(user)
+        self.assertEqual(api_client.get(reverse('verify-stripe-payment'), {'session_id': 'cs_test_1'}).status_code, 200)
+
+    def test_booking_after_the_webhook_is_linked(self):
+        self.post_paystack(paystack_event('ref_2'))
+        webhooks.process_batch()
+        user = make_user()
+        api_client = APIClient()
+        api_client.force_authenticate(user)
+        response = api_client.post(reverse('appointment-create'), {
+            'services': [make_service().id], 'appointment_date': '2030-01-08', 'appointment_time': '10:00',
+            'client_phone': '0123456789', 'payment_reference': 'ref_2',
+        })
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(api_models.Appointment.objects.get().payment.reference, 'ref_2')
+
+    def test_malformed_events_are_dead_lettered(self):
+        self.post_stripe({'id': 'evt_bad', 'type': 'checkout.session.completed', 'data': {}})
+        with self.assertLogs('api.webhooks', 'ERROR'):
+            self.assertEqual(webhooks.process_batch(), (0, 1))
+        self.assertEqual(api_models.WebhookEvent.objects.get().status, api_models.WebhookEvent.STATUS_DEAD)
+
+    def test_command_drains_events(self):
+        self.post_paystack(paystack_event('ref_3'))
+        call_command('process_webhook_events', stdout=mock.Mock())
+        self.assertTrue(api_models.VerifiedPayment.objects.filter(reference='ref_3').exists())
+
+
+class LoadTestHarnessTests(TransactionTestCase):
+    def test_every_route_is_driven_without_errors(self):
+        self.assertEqual(loadtest.uncovered_routes(), [])
+        with GatewayStub() as stub, self.settings(
+            PAYSTACK_BASE_URL=stub.url, STRIPE_API_BASE=stub.url, STRIPE_WEBHOOK_SECRET=loadtest.STRIPE_WEBHOOK_SECRET,
+        ):
+            paystack.reset_client()
+            stripe_checkout.reset_client()
+            self.addCleanup(paystack.reset_client)
+            self.addCleanup(stripe_checkout.reset_client)
+            fixture = loadtest.Fixture(requests_per_route=2)
+            for name in loadtest.ROUTES:
+                with self.subTest(route=name):
+                    summary = loadtest.run_route(name, fixture, requests=2, concurrency=2)
+                    self.assertEqual(summary['errors'], 0, summary['status_codes'])
+                    self.assertGreater(summary['p99_ms'], 0)
+        summary = loadtest.summarize('x', loadtest.Call('get', '/'), [(0.01 * i, 200, 1) for i in range(1, 101)], 1.0)
+        self.assertEqual((summary['p50_ms'], summary['p95_ms'], summary['p99_ms']), (500.0, 950.0, 990.0))
+
+    def test_query_counter_counts_each_query_once(self):
+        def set_up(sender, connection, **kwargs):
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+
+        def reconnect_and_query():
+            loadtest._query_count.set(queries)
+            for _ in range(3):
+                with connection.cursor() as cursor:
+                    cursor.execute('SELECT 1')
+                connection.close()
+            return connections['default']
+
+        queries = [0]
+        counter = loadtest.QueryCounter()
+        connection_created.connect(set_up)
+        self.addCleanup(connection_created.disconnect, set_up)
+        with counter.installed(), ThreadPoolExecutor(max_workers=1) as pool:
+            opened = pool.submit(reconnect_and_query).result()
+        # neither a wrapper per reconnect nor the queries run by set_up
+        self.assertEqual(queries[0], 3)
+        self.assertNotIn(counter, opened.execute_wrappers)
+
+
+class QueryBudgetMixin:
+    """
+    Checks a request against the ``query_budget`` its view declares, by the
+    count ``PerformanceMiddleware`` logs (the test runner also has it fail any
+    request over budget, in every test).
+    """
+
+    def assertWithinQueryBudget(self, send, *args, **kwargs):
+        with self.assertLogs('api.performance', 'INFO') as logs:
+            response = send(*args, **kwargs)
+        record = json.loads(logs.records[-1].getMessage())
+        self.assertIn('query_budget', record, f"{record['view']} does not declare a query_budget")
+        self.assertLessEqual(
+            record['sql_count'], record['query_budget'],
+            f"{record['view']} ran {record['sql_count']} queries, budget {record['query_budget']}",
+        )
+        return response
+
+
+class QueryBudgetTests(QueryBudgetMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        # enough rows that a per-row query would blow any budget
+        cls.fixture = loadtest.Fixture(requests_per_route=1)
+
+    def setUp(self):
+        self.stub = GatewayStub().start()
+        self.addCleanup(self.stub.stop)
+        overrides = self.settings(
+            PAYSTACK_BASE_URL=self.stub.url, STRIPE_API_BASE=self.stub.url, STRIPE_WEBHOOK_SECRET=loadtest.STRIPE_WEBHOOK_SECRET,
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        for module in (paystack, stripe_checkout):
+            module.reset_client()
+            self.addCleanup(module.reset_client)
+
+    def test_every_view_declares_a_budget(self):
+        for pattern in api_urls.urlpatterns:
+            view_class = pattern.callback.view_class
+            if view_class.__module__ in (api_views.__name__, api_async_views.__name__):
+                with self.subTest(view=view_class.__name__):
+                    self.assertIsInstance(getattr(view_class, 'query_budget', None), int)
+
+    def test_routes_stay_within_budget(self):
+        # each route cold: budgets cover the first request, before the user's state or the catalog is cached
+        client = Client()
+        for name, build in loadtest.ROUTES.items():
+            call = build(self.fixture, 0)
+            if resolve(call.path).func.view_class.__module__ not in (api_views.__name__, api_async_views.__name__):
+                continue
+            with self.subTest(route=name):
+                cache.clear()
+                response = self.assertWithinQueryBudget(loadtest.send, client, call)
+                self.assertLess(response.status_code, 400)
+
+
+class PerformanceMiddlewareTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.stub = GatewayStub().start()
+        self.addCleanup(self.stub.stop)
+        overrides = self.settings(PAYSTACK_BASE_URL=self.stub.url, PAYMENT_GATEWAY_RETRIES=0, SERVER_TIMING_HEADER=True)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        paystack.reset_client()
+        self.addCleanup(paystack.reset_client)
+        self.user = make_user()
+
+    def timings(self, response):
+        entries = {}
+        for entry in response['Server-Timing'].split(', '):
+            name, *params = entry.split(';')
+            entries[name] = dict(param.split('=', 1) for param in params)
+        return entries
+
+    def test_server_timing_and_log_line(self):
+        make_service()
+        with self.assertLogs('api.performance', 'INFO') as logs, CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('category-list'))
+        timings = self.timings(response)
+        self.assertEqual(timings['sql']['desc'], f'"{len(ctx.captured_queries)} queries"')
+        self.assertGreater(float(timings['serializer']['dur']), 0)
+        self.assertEqual(timings['external']['desc'], '"0 calls"')
+
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(record['view'], 'category-list')
+        self.assertEqual(record['sql_count'], len(ctx.captured_queries))
+        self.assertFalse(record['over_budget'])
+
+    def test_external_calls_are_timed(self):
+        self.stub.latency = 0.05
+        api_client = APIClient()
+        api_client.force_authenticate(self.user)
+        response = api_client.get(reverse('verify-paystack-payment'), {'reference': 'ref_1'})
+        timings = self.timings(response)
+        self.assertEqual(timings['external']['desc'], '"1 calls"')
+        self.assertGreaterEqual(float(timings['external']['dur']), 50)
+
+    def test_async_views_are_measured(self):
+        auth = {'Authorization': f"Bearer {self.user.tokens()['access']}"}
+        response = async_to_sync(AsyncClient().get)(reverse('verify-paystack-payment-async'), {'reference': 'ref_2'}, headers=auth)
+        timings = self.timings(response)
+        self.assertEqual(timings['external']['desc'], '"1 calls"')
+        self.assertNotEqual(timings['sql']['desc'], '"0 queries"')
+
+    def test_going_over_budget_is_a_warning(self):
+        with mock.patch.object(api_views.CategoryListAPIView, 'query_budget', 0), \
+                self.settings(QUERY_BUDGET_ENFORCED=False), self.assertLogs('api.performance', 'WARNING') as logs:
+            self.client.get(reverse('category-list'))
+        self.assertTrue(json.loads(logs.records[0].getMessage())['over_budget'])
+
+    def test_going_over_budget_fails_under_the_test_runner(self):
+        self.assertTrue(settings.QUERY_BUDGET_ENFORCED)
+        with mock.patch.object(api_views.CategoryListAPIView, 'query_budget', 0), \
+                self.assertLogs('api.performance', 'WARNING'), self.assertRaises(QueryBudgetExceeded):
+            self.client.get(reverse('category-list'))
+
+    def test_header_is_off_unless_enabled(self):
+        with self.settings(SERVER_TIMING_HEADER=False):
+            self.assertFalse(self.client.get(reverse('service-list')).has_header('Server-Timing'))
+
+
+class ClaimsAuthenticationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = make_user()
+        self.auth = {'HTTP_AUTHORIZATION': f"Bearer {self.user.tokens()['access']}"}
+
+    def authenticate(self, **headers):
+        request = RequestFactory().get('/', **(headers or self.auth))
+        return ClaimsJWTAuthentication().authenticate(request)[0]
+
+    def test_user_is_built_from_claims_without_a_query(self):
+        remember_user_state(self.user)
+        with self.assertNumQueries(0):
+            user = self.authenticate()
+        self.assertIsInstance(user, api_models.ClaimsUser)
+        self.assertEqual((user.pk, user.email, user.full_name), (self.user.pk, self.user.email, self.user.full_name))
+        with self.assertRaises(TypeError):
+            user.save()
+        with self.assertNumQueries(1):
+            self.assertEqual(api_models.Appointment.objects.filter(user=user).count(), 0)
+
+    def test_state_cache_miss_costs_one_query(self):
+        with self.assertNumQueries(1):
+            self.authenticate()
+        with self.assertNumQueries(0):
+            self.authenticate()
+
+    def test_deactivation_locks_out_existing_tokens(self):
+        self.authenticate()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = False
+            self.user.save()
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate()
+
+    def test_staff_flag_follows_the_row_not_the_claim(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_staff = True
+            self.user.save()
+        self.assertTrue(self.authenticate().is_staff)
+        with self.settings(AUTH_USER_STATE_CHECK=False), self.assertNumQueries(0):
+            self.assertFalse(self.authenticate().is_staff)
+
+    def test_tokens_without_claims_fall_back_to_the_database(self):
+        token = RefreshToken.for_user(self.user).access_token
+        user = self.authenticate(HTTP_AUTHORIZATION=f"Bearer {token}")
+        self.assertIs(type(user), api_models.User)
+
+    def test_authenticated_views_skip_the_user_lookup(self):
+        remember_user_state(self.user)
+        make_appointment(self.user, [make_service()], date(2030, 3, 4), time(10, 0))
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('my-appointments'), **self.auth)
+        self.assertEqual(len(response.json()['results']), 1)
+
+
+class TokenRefreshTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = make_user()
+        remember_user_state(self.user)
+        self.refresh = self.user.tokens()['refresh']
+        self.jti = RefreshToken(self.refresh)['jti']
+
+    def post_refresh(self, token):
+        return self.client.post(reverse('token-refresh'), {'refresh': token})
+
+    def test_refresh_rotates_and_keeps_the_claims(self):
+        response = self.post_refresh(self.refresh)
+        self.assertEqual(response.status_code, 200)
+        rotated = RefreshToken(response.json()['refresh'])
+        self.assertEqual(rotated['email'], self.user.email)
+        self.assertTrue(OutstandingToken.objects.filter(jti=rotated['jti'], user=self.user).exists())
+        self.assertEqual(BlacklistedToken.objects.get().token.jti, self.jti)
+
+    def test_used_token_is_refused_from_the_cache(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.post_refresh(self.refresh).status_code, 200)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.post_refresh(self.refresh).status_code, 401)
+
+    def test_used_token_is_refused_without_the_cache(self):
+        self.assertEqual(self.post_refresh(self.refresh).status_code, 200)
+        cache.clear()
+        self.assertEqual(self.post_refresh(self.refresh).status_code, 401)
+        self.assertEqual(BlacklistedToken.objects.count(), 1)
+
+    def test_inactive_user_cannot_refresh(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = False
+            self.user.save()
+        self.assertEqual(self.post_refresh(self.refresh).status_code, 401)
+
+    def test_token_issued_without_an_outstanding_row_is_recorded(self):
+        OutstandingToken.objects.all().delete()
+        self.assertEqual(self.post_refresh(self.refresh).status_code, 200)
+        self.assertTrue(BlacklistedToken.objects.filter(token__jti=self.jti).exists())
+
+    def test_prune_deletes_only_expired_tokens_in_batches(self):
+        self.assertEqual(self.post_refresh(self.refresh).status_code, 200)
+        for _ in range(4):
+            RefreshToken.for_user(self.user)
+        expired = list(OutstandingToken.objects.order_by('id').values_list('id', flat=True)[:4])
+        OutstandingToken.objects.filter(id__in=expired).update(expires_at=timezone.now() - timedelta(seconds=1))
+
+        self.assertEqual(revocation.prune_expired(3), 3)
+        call_command('prune_token_blacklist', batch_size=3, stdout=mock.Mock())
+        self.assertFalse(OutstandingToken.objects.filter(id__in=expired).exists())
+        self.assertEqual(OutstandingToken.objects.count(), 2)
+        self.assertFalse(BlacklistedToken.objects.exists())
+
+
+class PasswordHashingTests(TestCase):
+    def register(self, email='new@example.com'):
+        return self.client.post(reverse('register'), {
+            'full_name': 'New Client', 'email': email, 'password': 'S3cure-pass!', 'password2': 'S3cure-pass!',
+        })
+
+    def login(self, email='new@example.com', password='S3cure-pass!'):
+        return self.client.post(reverse('login'), {'email': email, 'password': password})
+
+    def test_registration_writes_the_user_once(self):
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(self.register().status_code, 201)
+        user_writes = [q['sql'] for q in ctx.captured_queries if re.match(r'(INSERT INTO|UPDATE) "api_user"', q['sql'])]
+        self.assertEqual(len(user_writes), 1)
+        self.assertTrue(api_models.User.objects.get(email='new@example.com').check_password('S3cure-pass!'))
+
+    def test_login_checks_the_password_on_the_pool(self):
+        make_user('new@example.com', is_verified=True)
+        with mock.patch.object(passwords, 'submit', wraps=passwords.submit) as submit:
+            self.assertEqual(self.login().status_code, 200)
+        self.assertEqual(submit.call_count, 1)
+        self.assertEqual(self.login(password='wrong-pass').status_code, 401)
+        self.assertEqual(self.login(email='nobody@example.com').status_code, 401)
+
+    def test_inactive_user_cannot_log_in(self):
+        make_user('new@example.com', is_verified=True, is_active=False)
+        self.assertEqual(self.login().status_code, 401)
+
+    def test_outdated_hash_is_upgraded_on_login(self):
+        user = make_user('new@example.com', is_verified=True)
+        user.password = PBKDF2PasswordHasher().encode('S3cure-pass!', 'oldsalt', iterations=1000)
+        user.save()
+        self.assertEqual(self.login().status_code, 200)
+        user.refresh_from_db()
+        self.assertNotIn('$1000$', user.password)
+        self.assertTrue(user.check_password('S3cure-pass!'))
+
+    def test_full_pool_sheds_login_and_registration(self):
+        make_user('new@example.com', is_verified=True)
+        with mock.patch.object(passwords, 'submit', side_effect=passwords.HashingBusy):
+            admin_login = self.client.post(reverse('admin:login'), {'username': 'new@example.com', 'password': 'x'})
+            for response in (self.login(), self.register('other@example.com'), self.async_login(), admin_login):
+                self.assertEqual(response.status_code, 503)
+                self.assertEqual(response['Retry-After'], '1')
+        self.assertFalse(api_models.User.objects.filter(email='other@example.com').exists())
+
+    def test_submit_refuses_work_past_the_queue(self):
+        pool = ThreadPoolExecutor(max_workers=1)
+        self.addCleanup(pool.shutdown)
+        release = threading.Event()
+        with mock.patch.object(passwords, '_executor', return_value=(pool, threading.BoundedSemaphore(2))):
+            running = passwords.submit(release.wait)
+            queued = passwords.submit(lambda: 'queued')
+            with self.assertRaises(passwords.HashingBusy):
+                passwords.submit(lambda: 'shed')
+            release.set()
+            self.assertEqual(queued.result(), 'queued')
+            running.result()
+            self.assertEqual(passwords.submit(lambda: 'later').result(), 'later')
+
+    def test_async_hashing(self):
+        encoded = async_to_sync(passwords.amake_password)('S3cure-pass!')
+        self.assertEqual(async_to_sync(passwords.averify_password)('S3cure-pass!', encoded), (True, False))
+
+    def test_login_goes_through_the_configured_backends(self):
+        make_user('new@example.com', is_verified=True)
+        failed = []
+        receiver = lambda sender, credentials, **kwargs: failed.append(credentials['email'])
+        user_login_failed.connect(receiver)
+        self.addCleanup(user_login_failed.disconnect, receiver)
+        self.assertEqual(self.login(password='wrong-pass').status_code, 401)
+        self.assertEqual(failed, ['new@example.com'])
+
+        with self.settings(AUTHENTICATION_BACKENDS=['django.contrib.auth.backends.ModelBackend']):
+            with mock.patch.object(passwords, 'submit', wraps=passwords.submit) as submit:
+                self.assertEqual(self.login().status_code, 200)
+        submit.assert_not_called()
+
+    def async_login(self, email='new@example.com', password='S3cure-pass!'):
+        return async_to_sync(AsyncClient().post)(
+            reverse('login-async'), {'email': email, 'password': password}, content_type='application/json',
+        )
+
+    def test_async_login(self):
+        user = make_user('new@example.com', is_verified=True)
+        user.password = PBKDF2PasswordHasher().encode('S3cure-pass!', 'oldsalt', iterations=1000)
+        user.save()
+        with mock.patch.object(passwords, 'submit', wraps=passwords.submit) as submit:
+            response = self.async_login()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['email'], 'new@example.com')
+        self.assertIn('access', response.json()['tokens'])
+        self.assertEqual(submit.call_count, 2)  # the check, and the upgraded hash
+        user.refresh_from_db()
+        self.assertNotIn('$1000$', user.password)
+
+        self.assertEqual(self.async_login(password='wrong-pass').status_code, 401)
+        self.assertEqual(self.async_login(email='nobody@example.com').status_code, 401)
+        self.assertEqual(self.async_login(password='').status_code, 400)
+
+    def test_both_logins_refuse_alike(self):
+        make_user('new@example.com', is_verified=False)
+        make_user('off@example.com', is_verified=True, is_active=False)
+        for email in ('new@example.com', 'off@example.com', 'nobody@example.com'):
+            with self.subTest(email=email):
+                sync, asynchronous = self.login(email), self.async_login(email)
+                self.assertEqual((sync.status_code, asynchronous.status_code), (401, 401))
+                self.assertEqual(sync.json(), asynchronous.json())
+
+
+class AppointmentImportTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.staff = make_user('staff@example.com', is_staff=True)
+        self.client_user = make_user()
+        self.cut = make_service(name='Cut', minutes=60, price='30.00')
+        self.colour = make_service(name='Colour', minutes=90, price='70.00')
+        remember_user_state(self.staff)
+        self.auth = {'HTTP_AUTHORIZATION': f"Bearer {self.staff.tokens()['access']}"}
+
+    def upload(self, name, content, **extra):
+        upload = SimpleUploadedFile(name, content.encode())
+        return self.client.post(reverse('appointment-import'), {'file': upload, **extra}, **self.auth)
+
+    def test_csv_rows_are_imported_and_conflicts_reported(self):
+        make_appointment(self.client_user, [self.cut], date(2030, 5, 6), time(9, 0))
+        rows = '\n'.join([
+            'client_email,client_name,client_phone,appointment_date,appointment_time,services,is_cancelled',
+            f'client@example.com,,0123,2030-05-06,10:00,{self.cut.id};{self.colour.id},',
+            f'new@example.com,New Client,,2030-05-06,09:30,{self.cut.id},',  # overlaps the existing booking
+            f'new@example.com,New Client,,2030-05-06,12:00,{self.cut.id},',  # overlaps row 2 (10:00-12:30)
+            f'new@example.com,New Client,,2030-05-06,12:00,{self.cut.id},true',  # cancelled: no conflict
+            f'new@example.com,New Client,,2030-05-07,09:00,999,',
+            'not-an-email,,,2030-05-07,09:00,,',
+        ])
+        response = self.upload('old-book.csv', rows)
+
+        self.assertEqual(response.status_code, 200)
+        report = response.json()
+        self.assertEqual((report['created'], report['failed'], report['clients_created']), (2, 4, 1))
+        self.assertEqual([error['row'] for error in report['errors']], [3, 4, 6, 7])
+        self.assertEqual(report['errors'][0]['errors'], {'non_field_errors': [booking.OVERLAP_MESSAGE]})
+        self.assertIn('services', report['errors'][2]['errors'])
+        self.assertEqual(set(report['errors'][3]['errors']), {'client_email', 'services'})
+
+        imported = api_models.Appointment.objects.get(appointment_time=time(10, 0))
+        self.assertEqual(imported.user, self.client_user)
+        self.assertEqual(set(imported.services.all()), {self.cut, self.colour})
+        self.assertEqual((imported.total_price, imported.end_time), (Decimal('100.00'), time(12, 30)))
+        new_client = api_models.User.objects.get(email='new@example.com')
+        self.assertEqual(new_client.full_name, 'New Client')
+        self.assertFalse(new_client.has_usable_password())
+        self.assertTrue(new_client.appointments.get().is_cancelled)
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertFalse(api_models.OutboxEmail.objects.exists())
+
+    def test_queries_grow_with_batches_not_rows(self):
+        def import_rows(count, first_day):
+            rows = ['{"client_email": "client@example.com", "appointment_date": "%s", "appointment_time": "09:00", '
+                    '"services": [%d]}' % (first_day + timedelta(days=n), self.cut.id) for n in range(count)]
+            with CaptureQueriesContext(connection) as ctx:
+                report = self.upload('rows.jsonl', '\n'.join(rows)).json()
+            self.assertEqual(report['created'], count)
+            return len(ctx.captured_queries)
+
+        self.assertEqual(import_rows(5, date(2030, 1, 1)), import_rows(50, date(2031, 1, 1)))
+
+    def test_payment_is_linked_by_reference(self):
+        payment = api_models.VerifiedPayment.objects.create(
+            provider=api_models.VerifiedPayment.PROVIDER_PAYSTACK, reference='ref_old_book',
+            status=api_models.VerifiedPayment.STATUS_SUCCESS, payload={},
+        )
+        rows = json.dumps([{
+            'client_email': 'client@example.com', 'appointment_date': '2030-05-06', 'appointment_time': '09:00',
+            'services': [self.cut.id], 'payment_reference': 'ref_old_book',
+        }, 'not a row'])
+        report = self.upload('rows.txt', rows, format='json').json()
+        self.assertEqual((report['created'], report['failed']), (1, 1))
+        self.assertEqual(api_models.Appointment.objects.get().payment, payment)
+
+    def test_only_staff_can_import(self):
+        token = self.client_user.tokens()['access']
+        response = self.client.post(
+            reverse('appointment-import'), {'file': SimpleUploadedFile('rows.csv', b'client_email')},
+            HTTP_AUTHORIZATION=f"Bearer {token}",
+        )
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(self.upload('rows.xlsx', 'x').status_code, 400)
+
+    def test_management_command_imports_in_batches(self):
+        rows = '\n'.join(
+            '{"client_email": "client@example.com", "appointment_date": "2030-06-%02d", "appointment_time": "11:00", '
+            '"services": [%d]}' % (day, self.colour.id) for day in range(1, 8)
+        )
+        with tempfile.NamedTemporaryFile('w', suffix='.jsonl', delete=False) as f:
+            f.write(rows + '\n{broken')
+        self.addCleanup(os.unlink, f.name)
+        out, err = mock.Mock(), mock.Mock()
+        call_command('import_appointments', f.name, batch_size=3, stdout=out, stderr=err)
+        self.assertEqual(api_models.Appointment.objects.count(), 7)
+        self.assertIn('row 8', err.write.call_args.args[0])
+        self.assertIn('Imported 7 appointments', out.write.call_args.args[0])
+
+    def test_management_command_reports_an_unreadable_file(self):
+        header = b'client_email,appointment_date,appointment_time,services\n'
+        for content, message in (
+            (header + b'client@example.com,2030-06-03,11:00,1\n\xff\xfe,2030-06-04,11:00,1\n', 'line 3'),
+            (header + b'client@example.com,2030-06-03,11:00,' + b'1' * (csv.field_size_limit() + 1) + b'\n', 'line 2'),
+        ):
+            with tempfile.NamedTemporaryFile('wb', suffix='.csv', delete=False) as f:
+                f.write(content)
+            self.addCleanup(os.unlink, f.name)
+            with self.assertRaisesMessage(CommandError, f'Unreadable file at {message}'):
+                call_command('import_appointments', f.name, stdout=mock.Mock(), stderr=mock.Mock())
+
+
+@skipUnless(connection.vendor == 'sqlite', "replica is a copy of the SQLite test database")
+class ReplicaRoutingTests(TransactionTestCase):
+    """The replica is a second SQLite file, refreshed from the primary in setUp."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.replica_dir = tempfile.TemporaryDirectory()
+        cls.replica_path = os.path.join(cls.replica_dir.name, 'replica.sqlite3')
+        # added after the test runner has set up its databases, which leaves this one alone
+        default = connections.settings['default']
+        connections.settings[routers.REPLICA] = {
+            **default, 'NAME': cls.replica_path, 'TEST': {**default['TEST'], 'NAME': cls.replica_path},
+        }
+        cls.databases = cls.databases | {routers.REPLICA}
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        connections[routers.REPLICA].close()
+        del connections[routers.REPLICA]
+        del connections.settings[routers.REPLICA]
+        cls.replica_dir.cleanup()
+
+    def setUp(self):
+        cache.clear()
+        self.user = make_user()
+        self.service = make_service()
+        self.booked = make_appointment(self.user, [self.service], date(2030, 5, 6), time(9, 0))
+        self.auth = {'HTTP_AUTHORIZATION': f"Bearer {self.user.tokens()['access']}"}
+
+        connections[routers.REPLICA].close()
+        connection.ensure_connection()
+        replica = sqlite3.connect(self.replica_path)
+        connection.connection.backup(replica)
+        replica.close()
+
+    def test_read_only_views_read_the_replica(self):
+        later = make_appointment(self.user, [self.service], date(2030, 5, 7), time(9, 0))
+
+        listed = self.client.get(reverse('my-appointments'), **self.auth).json()['results']
+        self.assertEqual([appointment['id'] for appointment in listed], [self.booked.pk])
+        # not a read-only view: served from the primary
+        self.assertEqual(self.client.get(reverse('appointment-detail', args=[later.pk]), **self.auth).status_code, 200)
+
+    def test_writes_go_to_the_primary(self):
+        with routers.replica_reads():
+            appointment = api_models.Appointment.objects.get(pk=self.booked.pk)
+            self.assertEqual(appointment._state.db, routers.REPLICA)
+            appointment.client_phone = '0999'
+            appointment.save()
+            appointment.services.add(make_service(name='Trim'))
+        self.assertEqual(api_models.Appointment.objects.using('default').get().client_phone, '0999')
+        self.assertEqual(api_models.Appointment.objects.using('default').get().services.count(), 2)
+        self.assertEqual(api_models.Appointment.objects.using(routers.REPLICA).get().client_phone, '0123456789')
+
+    def test_reads_go_to_the_replica_only_when_asked_and_configured(self):
+        router = routers.ReplicaRouter()
+        self.assertIsNone(router.db_for_read(api_models.Appointment))
+        with routers.replica_reads():
+            self.assertEqual(router.db_for_read(api_models.Appointment), routers.REPLICA)
+            with mock.patch.dict(connections.settings):
+                del connections.settings[routers.REPLICA]
+                self.assertIsNone(router.db_for_read(api_models.Appointment))
+        self.assertFalse(router.allow_migrate(routers.REPLICA, 'api'))
+
+
+class SQLiteSettingsTests(TestCase):
+    @skipUnless(connection.vendor == 'sqlite', "SQLite only")
+    def test_connections_use_wal(self):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode')
+            self.assertEqual(cursor.fetchone()[0], 'wal')
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 1)  # NORMAL
+        self.assertEqual(connection.transaction_mode, 'IMMEDIATE')
+
+
+class OpenAPISchemaTests(TestCase):
+    def setUp(self):
+        openapi.forget()
+        self.addCleanup(openapi.forget)
+
+    def test_stored_schema_is_up_to_date(self):
+        # regenerate with `manage.py build_openapi_schema` after changing a view or serializer
+        call_command('build_openapi_schema', '--check', stdout=io.StringIO())
+
+    def test_schema_is_served_from_the_stored_file(self):
+        with mock.patch.object(openapi, 'generate') as generate, self.assertNumQueries(0):
+            response = self.client.get(reverse('openapi-schema'))
+            not_modified = self.client.get(reverse('openapi-schema'), HTTP_IF_NONE_MATCH=response['ETag'])
+            legacy = self.client.get('/?format=openapi')
+            page = self.client.get('/')
+        generate.assert_not_called()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertEqual(response.json()['info']['title'], openapi.INFO.title)
+        self.assertIn('/appointments/availability/', response.json()['paths'])
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(legacy.content, response.content)
+        self.assertContains(page, reverse('openapi-schema'))
+
+    def test_missing_file_is_generated_once(self):
+        with self.settings(OPENAPI_SCHEMA_PATH=os.path.join(tempfile.gettempdir(), 'no-such-schema.json')), \
+                mock.patch.object(openapi, 'generate', wraps=openapi.generate) as generate, \
+                self.assertLogs('api.openapi', 'WARNING'):
+            first = self.client.get(reverse('openapi-schema'))
+            second = self.client.get(reverse('openapi-schema'))
+        generate.assert_called_once()
+        self.assertEqual(first.content, second.content)
+
+
+class ColdStartTests(TestCase):
+    def test_startup_leaves_the_lazy_modules_unloaded(self):
+        self.assertEqual(coldstart.profile().lazy_modules_loaded(), [])
+
+    def test_check_fails_over_budget(self):
+        with self.settings(COLD_START_BUDGET_MS=0):
+            with self.assertRaisesMessage(CommandError, "Cold start is over budget"):
+                call_command('profile_startup', '--check', stdout=io.StringIO())
+
+
+class AnalyticsRollupTests(APITestCase):
+    def setUp(self):
+        self.staff = make_user('staff@example.com', is_staff=True)
+        self.user = make_user()
+        self.braids = make_service(name='Braids', minutes=90, price='80.00')
+        self.trim = make_service(category=self.braids.category, name='Trim', minutes=30, price='20.00')
+        self.monday = date(2030, 1, 7)
+        self.both = make_appointment(self.user, [self.braids, self.trim], self.monday, time(9, 0))
+        self.trim_only = make_appointment(self.user, [self.trim], self.monday, time(13, 0))
+        call_command('refresh_rollups', stdout=io.StringIO())
+        self.client.force_authenticate(self.staff)
+
+    def day(self, day):
+        row = api_models.DailyRollup.objects.filter(date=day).first()
+        return (row.bookings, row.revenue, row.booked_minutes) if row else None
+
+    def services(self, day):
+        return {
+            row.service_id: (row.bookings, row.revenue, row.booked_minutes)
+            for row in api_models.DailyServiceRollup.objects.filter(date=day)
+        }
+
+    def test_rollups_follow_bookings(self):
+        self.assertEqual(self.day(self.monday), (2, Decimal('120.00'), 150))
+        self.assertEqual(self.services(self.monday), {
+            self.braids.id: (1, Decimal('80.00'), 90), self.trim.id: (2, Decimal('40.00'), 60),
+        })
+        self.assertFalse(api_models.StaleRollupDay.objects.exists())
+
+        self.trim_only.is_cancelled = True
+        self.trim_only.save()
+        self.assertEqual(self.day(self.monday), (2, Decimal('120.00'), 150))
+        self.assertEqual(rollups.refresh_stale(), 1)
+        self.assertEqual(self.day(self.monday), (1, Decimal('100.00'), 120))
+
+        tuesday = self.monday + timedelta(days=1)
+        moved = api_models.Appointment.objects.get(pk=self.both.pk)
+        moved.appointment_date = tuesday
+        moved.save()
+        moved.services.remove(self.trim)
+        self.assertEqual(rollups.refresh_stale(), 2)
+        self.assertIsNone(self.day(self.monday))
+        self.assertEqual(self.services(tuesday), {self.braids.id: (1, Decimal('80.00'), 90)})
+
+        moved.delete()
+        rollups.refresh_stale()
+        self.assertIsNone(self.day(tuesday))
+
+    def test_day_and_service_revenue_agree(self):
+        # the services' prices, not the total stored when the booking was made
+        api_models.Appointment.objects.filter(pk=self.both.pk).update(total_price=Decimal('1.00'))
+        api_models.Service.objects.filter(pk=self.trim.pk).update(price=Decimal('25.00'))
+        rollups.refresh_days([self.monday])
+        self.assertEqual(self.day(self.monday), (2, Decimal('130.00'), 150))
+        self.assertEqual(sum(revenue for _, revenue, _ in self.services(self.monday).values()), Decimal('130.00'))
+
+    def test_a_change_during_a_refresh_stays_marked(self):
+        rollups.mark_stale([self.monday])
+        refresh_days = rollups.refresh_days
+
+        def change_meanwhile(days):
+            refresh_days(days)
+            # what another transaction's mark_stale does to the day
+            api_models.StaleRollupDay.objects.filter(date=self.monday).update(token=uuid.uuid4())
+
+        with mock.patch.object(rollups, 'refresh_days', side_effect=change_meanwhile):
+            self.assertEqual(rollups.refresh_stale(), 1)
+        self.assertTrue(api_models.StaleRollupDay.objects.filter(date=self.monday).exists())
+        self.assertEqual(rollups.refresh_stale(), 1)
+        self.assertEqual(rollups.refresh_stale(), 0)
+
+    def test_marking_days_is_one_upsert(self):
+        rollups.mark_stale([self.monday])
+        with self.assertNumQueries(1):
+            rollups.mark_stale([self.monday, self.monday + timedelta(days=1), None])
+        self.assertEqual(api_models.StaleRollupDay.objects.count(), 2)
+
+    def test_report_reads_only_the_rollups(self):
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('analytics'), {
+                'start': self.monday.isoformat(), 'end': (self.monday + timedelta(days=6)).isoformat(),
+            })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['open_minutes_per_day'], 480)
+        self.assertEqual(len(response.data['days']), 7)
+        self.assertEqual(response.data['days'][0]['utilisation'], round(150 / 480, 4))
+        self.assertEqual(response.data['days'][1]['bookings'], 0)
+        self.assertEqual(response.data['totals']['bookings'], 2)
+        self.assertEqual(response.data['totals']['revenue'], Decimal('120.00'))
+        self.assertEqual(response.data['totals']['utilisation'], round(150 / (480 * 7), 4))
+        self.assertEqual(
+            [(s['name'], s['bookings'], s['revenue']) for s in response.data['services']],
+            [('Braids', 1, Decimal('80.00')), ('Trim', 2, Decimal('40.00'))],
+        )
+
+    def test_staff_only_and_bounded(self):
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.client.get(reverse('analytics')).status_code, 403)
+        self.client.force_authenticate(self.staff)
+        with mock.patch('api.views.timezone.localdate', return_value=self.monday):
+            response = self.client.get(reverse('analytics'))
+        self.assertEqual(response.data['end'], self.monday.isoformat())
+        self.assertEqual(len(response.data['days']), 30)
+        for params in (
+            {'start': 'monday'},
+            {'start': '2030-01-07', 'end': '2030-01-06'},
+            {'start': '2028-12-31', 'end': '2030-01-01'},  # 367 days
+        ):
+            with self.subTest(params=params):
+                self.assertEqual(self.client.get(reverse('analytics'), params).status_code, 400)
+
+    def test_import_and_rebuild(self):
+        wednesday = self.monday + timedelta(days=2)
+        rows = [(1, {
+            'client_email': 'new@example.com', 'appointment_date': wednesday.isoformat(),
+            'appointment_time': '10:00', 'services': [self.braids.id],
+        })]
+        imports.import_appointments(rows)
+        call_command('refresh_rollups', stdout=io.StringIO())
+        self.assertEqual(self.day(wednesday), (1, Decimal('80.00'), 90))
+
+        expected = {day: self.services(day) for day in (self.monday, wednesday)}
+        api_models.DailyServiceRollup.objects.all().delete()
+        api_models.DailyRollup.objects.filter(date=self.monday).update(bookings=99)
+        api_models.DailyRollup.objects.create(date=date(2030, 2, 1), bookings=1)
+        call_command('rebuild_rollups', stdout=io.StringIO())
+        self.assertEqual({day: self.services(day) for day in expected}, expected)
+        self.assertEqual(self.day(self.monday), (2, Decimal('120.00'), 150))
+        self.assertIsNone(self.day(date(2030, 2, 1)))
@@ -1,10 +1,10 @@
 from django.urls import path
 from . import views as api_views
-from rest_framework_simplejwt.views import TokenRefreshView
+from . import async_views as api_async_views
 
 urlpatterns = [
     # authentication
-    path('auth/token/refresh/', TokenRefreshView.as_view(), name="token-refresh"),
+    path('auth/token/refresh/', api_views.RefreshTokenAPIView.as_view(), name="token-refresh"),
     path('auth/register/', api_views.RegisterAPIView.as_view(), name="register"),
     path('auth/email-verify/', api_views.VerifyUser.as_view(), name='email-verify'),
     path('auth/login/', api_views.LoginAPIView.as_view(), name='login'),
@@ -23,10 +23,24 @@ urlpatterns = [
     path('appointments/<int:pk>/update/', api_views.AppointmentUpdateAPIView.as_view(), name='appointment-update'),
     path('appointments/admin/', api_views.AdminAppointmentsAPIView.as_view(), name="admin-appointment-view"),
     path('appointments/booked-slots/', api_views.BookedSlotsAPIView.as_view(), name='booked-slots'),
+    path('appointments/availability/', api_views.AvailabilityAPIView.as_view(), name='availability'),
+    path('appointments/import/', api_views.AppointmentImportAPIView.as_view(), name='appointment-import'),
+    path('analytics/', api_views.AnalyticsAPIView.as_view(), name='analytics'),
 
     # paystack
     path('initialize-payment/', api_views.InitializePaystackAPIView.as_view(), name="paystack-payment"),
     path('verify-payment/', api_views.VerifyPaymentAPIView.as_view(), name="verify-paystack-payment"),
     path("initialize-stripe-payment/", api_views.InitializeStripePaymentAPIView.as_view(), name="stripe-payment"),
     path("verify-stripe-payment/", api_views.VerifyStripePaymentView.as_view(), name="verify-stripe-payment"),
+
+    # gateway webhooks
+    path('webhooks/stripe/', api_views.StripeWebhookAPIView.as_view(), name="stripe-webhook"),
+    path('webhooks/paystack/', api_views.PaystackWebhookAPIView.as_view(), name="paystack-webhook"),
+
+    # async payment and login views, for deployments served over ASGI
+    path('async/login/', api_async_views.AsyncLoginView.as_view(), name="login-async"),
+    path('async/initialize-payment/', api_async_views.AsyncInitializePaystackView.as_view(), name="paystack-payment-async"),
+    path('async/verify-payment/', api_async_views.AsyncVerifyPaymentView.as_view(), name="verify-paystack-payment-async"),
+    path("async/initialize-stripe-payment/", api_async_views.AsyncInitializeStripePaymentView.as_view(), name="stripe-payment-async"),
+    path("async/verify-stripe-payment/", api_async_views.AsyncVerifyStripePaymentView.as_view(), name="verify-stripe-payment-async"),
 ]
\ No newline at end of file
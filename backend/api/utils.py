@@ -1,7 +1,22 @@
 from django.core.mail import EmailMessage
 
+from . import models as api_models
+
+
 class Util:
     @staticmethod
     def send_email(data):
-        email = EmailMessage(subject=data['email_subject'], body=data['email_body'], to=[data['email_to']])
-        email.send()
\ No newline at end of file
+        """
+        Queue an email in the outbox. It is written on the caller's database
+        connection, so it commits or rolls back with the surrounding transaction;
+        the ``send_queued_emails`` command delivers it.
+        """
+        return api_models.OutboxEmail.objects.create(
+            subject=data['email_subject'], body=data['email_body'], to=data['email_to']
+        )
+
+    @staticmethod
+    def build_email(outbox_email, connection=None):
+        return EmailMessage(
+            subject=outbox_email.subject, body=outbox_email.body, to=[outbox_email.to], connection=connection
+        )
@@ -1,39 +1,63 @@
 from django.shortcuts import render
 from rest_framework import generics, status
 from rest_framework.views import APIView
+from rest_framework.parsers import MultiPartParser
 from rest_framework.permissions import AllowAny, IsAuthenticated, IsAdminUser
 from rest_framework.response import Response
 from . import models as api_models
 from . import serializers as api_serializers
-from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.tokens import AccessToken
+from rest_framework_simplejwt.views import TokenRefreshView
 from .utils import Util
+from . import imports, rollups, webhooks
+from .availability import DayAvailability, services_duration
+from .cache import CatalogCacheMixin
+from .catalog import build_catalog
+from .filters import AppointmentFilterBackend
+from .pagination import AppointmentHistoryPagination, AppointmentSchedulePagination
+from .routers import ReplicaReadMixin
+from .payments import paystack, stripe_checkout, verification
+from .payments.client import GatewayError
 from django.contrib.sites.shortcuts import get_current_site
 from django.urls import reverse
 import jwt
 from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
 from decimal import Decimal
-import requests
+import csv
+import datetime
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
 from django.http import JsonResponse
-import stripe
 
 
 
 
 
+def requested_duration(request):
+    """Combined minutes of the ``services`` query parameter (comma separated ids); ValueError if malformed."""
+    service_ids = [s for s in request.query_params.get('services', '').split(',') if s.strip()]
+    return services_duration([int(s) for s in service_ids])
+
+
 # Create your views here.
+# query_budget: the most SQL queries one request to the view may run with cold caches (a token's user state is
+# looked up on a miss); PerformanceMiddleware fails any request over it under the test runner
 class RegisterAPIView(generics.CreateAPIView):
     queryset = api_models.User.objects.all()
     permission_classes = [AllowAny]
     serializer_class = api_serializers.RegisterSerializer
+    query_budget = 5
 
+    @transaction.atomic
     def perform_create(self, serializer):
         user = serializer.save()
 
-        token = RefreshToken.for_user(user).access_token
+        # a bare access token: going through a refresh token would also record it as outstanding
+        token = AccessToken.for_user(user)
         # current_site = get_current_site(self.request).domain
         # relative_link = reverse('email-verify')
         frontend_url = "https://fe819b7542bd.ngrok-free.app"
@@ -57,6 +81,7 @@ class RegisterAPIView(generics.CreateAPIView):
 class VerifyUser(generics.GenericAPIView):
     serializer_class = api_serializers.EmailVerificationSerializer
     permission_classes = [AllowAny]
+    query_budget = 2
 
     token_param_config = openapi.Parameter(
         'token', in_=openapi.IN_QUERY, description="enter token", type=openapi.TYPE_STRING
@@ -78,43 +103,57 @@ class VerifyUser(generics.GenericAPIView):
             return Response({'error': 'Invalid token'}, status=status.HTTP_400_BAD_REQUEST)
 
 
+class RefreshTokenAPIView(TokenRefreshView):
+    serializer_class = api_serializers.RotatingTokenRefreshSerializer
+    query_budget = 6
+
+
 class LoginAPIView(generics.GenericAPIView):
     serializer_class = api_serializers.LoginSerializer
     permission_classes = [AllowAny]
+    # the user, the hash upgraded on the first login after a hasher change, the refresh token
+    query_budget = 3
 
     def post(self, request):
-        serializer = self.serializer_class(data=request.data)
+        serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
 
         return Response(serializer.data, status=status.HTTP_200_OK)
 
 
-class CategoryListAPIView(generics.ListAPIView):
+class CategoryListAPIView(ReplicaReadMixin, CatalogCacheMixin, generics.ListAPIView):
     serializer_class = api_serializers.CategorySerializer
     permission_classes = [AllowAny]
+    query_budget = 2
 
     def get_queryset(self):
         return api_models.Category.objects.all()
 
-class ServiceListAPIView(generics.ListAPIView):
+    def list(self, request, *args, **kwargs):
+        categories_data, _ = build_catalog(self.get_queryset(), self.get_serializer_context())
+        return Response(categories_data)
+
+class ServiceListAPIView(ReplicaReadMixin, CatalogCacheMixin, generics.ListAPIView):
     serializer_class = api_serializers.ServiceSerializer
     permission_classes = [AllowAny]
+    query_budget = 1
 
     def get_queryset(self):
-        return api_models.Service.objects.all()
+        return api_models.Service.objects.select_related('category')
     
 
-class CategoryDetailAPIView(generics.RetrieveAPIView):
+class CategoryDetailAPIView(ReplicaReadMixin, CatalogCacheMixin, generics.RetrieveAPIView):
     queryset = api_models.Category.objects.all()
     serializer_class = api_serializers.CategorySerializer
     permission_classes = [AllowAny]
     lookup_field = 'slug'
+    query_budget = 2
 
     def retrieve(self, request, *args, **kwargs):
         category = self.get_object()
-        category_data = self.get_serializer(category).data
-        services = api_models.Service.objects.filter(category=category)
-        services_data = api_serializers.ServiceSerializer(services, many=True).data
+        categories_data, services_by_category = build_catalog([category], self.get_serializer_context())
+        category_data = categories_data[0]
+        services_data = services_by_category.get(category.id, [])
 
         return Response({"category": category_data, "services": services_data}, status=status.HTTP_200_OK)
 
@@ -122,7 +161,9 @@ class CategoryDetailAPIView(generics.RetrieveAPIView):
 class AppointmentCreateAPIView(generics.CreateAPIView):
     serializer_class = api_serializers.AppointmentSerializer
     permission_classes = [IsAuthenticated]
+    query_budget = 20
 
+    @transaction.atomic
     def perform_create(self, serializer):
         appointment = serializer.save()
         
@@ -132,7 +173,7 @@ class AppointmentCreateAPIView(generics.CreateAPIView):
         service_summary = "\n".join([
             f"- {service.name} (£{service.price})" for service in services
         ])
-        total_price = appointment.total_price()
+        total_price = appointment.total_price
         appointment_time = f"{appointment.appointment_date} at {appointment.appointment_time}"
 
 
@@ -159,43 +200,94 @@ class AppointmentCreateAPIView(generics.CreateAPIView):
         })
 
 
-class BookedSlotsAPIView(APIView):
+class BookedSlotsAPIView(ReplicaReadMixin, APIView):
     permission_classes = [IsAuthenticated]  
+    query_budget = 3
 
     def get(self, request, *args, **kwargs):
         date = request.query_params.get('date')
         if not date:
             return Response({"error": "Date is required"}, status=400)
 
-        appointments = api_models.Appointment.objects.filter(appointment_date=date, is_cancelled=False)
-        booked_times = [str(appt.appointment_time) for appt in appointments]
-        return Response({"booked": booked_times})
+        try:
+            date = datetime.date.fromisoformat(date)
+        except ValueError:
+            return Response({"error": "Date must be in YYYY-MM-DD format"}, status=400)
+
+        try:
+            duration = requested_duration(request)
+        except ValueError:
+            return Response({"error": "Services must be a comma separated list of distinct ids"}, status=400)
+
+        day = DayAvailability.for_date(date)
+        return Response({"booked": day.booked, "duration": duration, **day.as_dict(duration)})
+
+
+class AvailabilityAPIView(ReplicaReadMixin, APIView):
+    """Busy and free windows for each day from ``start`` to ``end`` (inclusive, a week if omitted)."""
+    permission_classes = [IsAuthenticated]
+    query_budget = 3
+
+    def get(self, request, *args, **kwargs):
+        try:
+            start = datetime.date.fromisoformat(request.query_params.get('start', ''))
+            end = request.query_params.get('end')
+            end = datetime.date.fromisoformat(end) if end else start + datetime.timedelta(days=6)
+        except ValueError:
+            return Response({"error": "start and end must be dates in YYYY-MM-DD format"}, status=400)
+        if end < start:
+            return Response({"error": "end must not be before start"}, status=400)
+        if (end - start).days >= settings.AVAILABILITY_MAX_DAYS:
+            return Response({"error": f"At most {settings.AVAILABILITY_MAX_DAYS} days at a time"}, status=400)
+
+        try:
+            duration = requested_duration(request)
+        except ValueError:
+            return Response({"error": "Services must be a comma separated list of distinct ids"}, status=400)
+
+        days = DayAvailability.for_range(start, end)
+        return Response({
+            "start": start.isoformat(),
+            "end": end.isoformat(),
+            "duration": duration,
+            "days": [{"date": day.isoformat(), **occupancy.as_dict(duration)} for day, occupancy in days.items()],
+        })
 
 
 class AppointmentRetrieveUpdateDestroyAPIView(generics.RetrieveUpdateDestroyAPIView):
     queryset = api_models.Appointment.objects.all()
     serializer_class = api_serializers.AppointmentSerializer
     permission_classes = [IsAuthenticated]
+    query_budget = 3
 
     def get_queryset(self):
+        if getattr(self, 'swagger_fake_view', False):
+            # the schema is built without a request (api/openapi.py)
+            return api_models.Appointment.objects.none()
         # Users can only access their own appointments unless admin
         user = self.request.user
+        appointments = api_models.Appointment.objects.with_related()
         if user.is_staff:
-            return api_models.Appointment.objects.all()
-        return api_models.Appointment.objects.filter(user=user)
+            return appointments
+        return appointments.filter(user=user)
 
 
 class AppointmentUpdateAPIView(generics.UpdateAPIView):
     queryset = api_models.Appointment.objects.all()
     serializer_class = api_serializers.AppointmentSerializer
     permisison_classes = [IsAuthenticated]
+    query_budget = 15
 
     def get_queryset(self):
+        if getattr(self, 'swagger_fake_view', False):
+            return api_models.Appointment.objects.none()
         user = self.request.user
+        appointments = api_models.Appointment.objects.with_related()
         if user.is_staff:
-            return api_models.Appointment.objects.all()
-        return api_models.Appointment.objects.filter(user=user)
+            return appointments
+        return appointments.filter(user=user)
     
+    @transaction.atomic
     def perform_update(self, serializer):
         appointment = serializer.save()
         user = self.request.user
@@ -225,22 +317,74 @@ class AppointmentUpdateAPIView(generics.UpdateAPIView):
         })
 
 
-class UserAppointmentsAPIView(generics.ListAPIView):
+class UserAppointmentsAPIView(ReplicaReadMixin, generics.ListAPIView):
     serializer_class = api_serializers.AppointmentSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = AppointmentHistoryPagination
+    filter_backends = [AppointmentFilterBackend]
+    query_budget = 3
 
     def get_queryset(self):
-        return api_models.Appointment.objects.filter(user=self.request.user).order_by('-created_at')
+        return api_models.Appointment.objects.with_related().filter(user=self.request.user)
 
-class AdminAppointmentsAPIView(generics.ListAPIView):
+class AdminAppointmentsAPIView(ReplicaReadMixin, generics.ListAPIView):
     serializer_class = api_serializers.AppointmentSerializer
     permission_classes = [IsAdminUser]
+    pagination_class = AppointmentSchedulePagination
+    filter_backends = [AppointmentFilterBackend]
+    query_budget = 3
 
     def get_queryset(self):
-        return api_models.Appointment.objects.all()
+        return api_models.Appointment.objects.with_related()
+
+
+class AppointmentImportAPIView(APIView):
+    """Staff bulk import (api/imports.py) of a CSV or JSON ``file``; answers with the per-row outcome."""
+    permission_classes = [IsAdminUser]
+    parser_classes = [MultiPartParser]
+    # one batch (APPOINTMENT_IMPORT_BATCH_SIZE rows); every further batch costs about as many again
+    query_budget = 11
+
+    def post(self, request):
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({"error": "Upload the rows as 'file'"}, status=400)
+        fmt = (request.data.get('format') or upload.name.rpartition('.')[2]).lower()
+        fmt = 'json' if fmt == 'jsonl' else fmt
+        if fmt not in imports.FORMATS:
+            return Response({"error": f"format must be one of {', '.join(imports.FORMATS)}"}, status=400)
+
+        try:
+            report = imports.import_appointments(imports.read_rows(imports.decode_lines(upload), fmt))
+        except (UnicodeDecodeError, csv.Error) as e:
+            # chunks before the unreadable line are already imported
+            return Response({"error": f"Unreadable file: {e}"}, status=400)
+        return Response(report.as_dict(), status=status.HTTP_200_OK)
+
+
+class AnalyticsAPIView(ReplicaReadMixin, APIView):
+    """Staff dashboard figures per day and per service from ``start`` to ``end`` (the last 30 days if omitted)."""
+    permission_classes = [IsAdminUser]
+    query_budget = 3
+
+    def get(self, request, *args, **kwargs):
+        try:
+            end = request.query_params.get('end')
+            end = datetime.date.fromisoformat(end) if end else timezone.localdate()
+            start = request.query_params.get('start')
+            start = datetime.date.fromisoformat(start) if start else end - datetime.timedelta(days=29)
+        except ValueError:
+            return Response({"error": "start and end must be dates in YYYY-MM-DD format"}, status=400)
+        if end < start:
+            return Response({"error": "end must not be before start"}, status=400)
+        if (end - start).days >= settings.ANALYTICS_MAX_DAYS:
+            return Response({"error": f"At most {settings.ANALYTICS_MAX_DAYS} days at a time"}, status=400)
+        return Response(rollups.report(start, end))
 
 
 class InitializePaystackAPIView(APIView):
+    query_budget = 1
+
     def post(self, request):
         email = request.data.get('email')
         amount = request.data.get('amount') # Naira
@@ -248,17 +392,12 @@ class InitializePaystackAPIView(APIView):
         if not email or not amount:
             return Response({"error": "Email and amount required"}, status=400)
         
-        headers = {
-            "Authorization": f"Bearer {settings.PAYSTACK_SECRET_KEY}",
-            "Content-Type": "application/json",
-        }
-        data = {
-            "email": email,
-            "amount": int(float(amount) * 100),  # Paystack uses Kobo
-            "callback_url": f"{frontend_url}/verify-payment/"
-        }
-
-        response = requests.post("https://api.paystack.co/transaction/initialize", json=data, headers=headers)
+        try:
+            response = paystack.initialize_transaction(email, amount, f"{frontend_url}/verify-payment/")
+        except ValueError:
+            return Response({"error": "Amount must be a number"}, status=400)
+        except GatewayError:
+            return Response({"error": "Payment provider unavailable, please try again"}, status=503)
         res_data = response.json()
 
         if response.status_code == 200:
@@ -268,27 +407,27 @@ class InitializePaystackAPIView(APIView):
         
 
 class VerifyPaymentAPIView(APIView):
+    query_budget = 7
+
     def get(self, request):
         reference = request.query_params.get('reference')
         if not reference:
             return Response({"error": "No reference provided"}, status=400)
 
-        headers = {
-            "Authorization": f"Bearer {settings.PAYSTACK_SECRET_KEY}"
-        }
-
-        response = requests.get(f"https://api.paystack.co/transaction/verify/{reference}", headers=headers)
-        res_data = response.json()
+        try:
+            payment = verification.verify_paystack(reference)
+        except GatewayError:
+            return Response({"error": "Payment provider unavailable, please try again"}, status=503)
 
-        if res_data['data']['status'] == 'success':
-            return Response({"status": "success", "data": res_data['data']})
-        return Response({"status": "failed", "data": res_data['data']}, status=400)
+        if payment.status == api_models.VerifiedPayment.STATUS_SUCCESS:
+            return Response({"status": "success", "data": payment.payload})
+        return Response({"status": "failed", "data": payment.payload}, status=400)
 
 
 
-stripe.api_key = settings.STRIPE_SECRET_KEY
 class InitializeStripePaymentAPIView(APIView):
     permission_classes = [IsAuthenticated]
+    query_budget = 1
 
     def post(self, request):
         user = request.user
@@ -300,41 +439,64 @@ class InitializeStripePaymentAPIView(APIView):
             return Response({"error": "Amount is required."}, status=400)
         
         try:
-            checkout_session = stripe.checkout.Session.create(
-                payment_method_types=["card", "klarna"],
-                line_items=[{
-                    'price_data': {
-                        'currency': 'gbp',
-                        'product_data': {
-                            'name': 'Appointment Booking',
-                        },
-                        'unit_amount': int(float(amount) * 100),
-                    },
-                    'quantity': 1,
-                }],
-                mode='payment',
-                success_url=f'{frontend_url}/stripe-payment-success?session_id={{CHECKOUT_SESSION_ID}}',
-                cancel_url=f"{frontend_url}/payment-cancelled",
-                metadata={
-                    "user_id": user.id,
-                    "email": user.email
-                }
-            )
+            checkout_session = stripe_checkout.create_checkout_session(user, amount, frontend_url)
             return Response({"checkout_url": checkout_session.url})
         except Exception as e:
             return Response({"error": str(e)}, status=500)
 
 
 class VerifyStripePaymentView(APIView):
+    query_budget = 7
+
     def get(self, request):
         session_id = request.query_params.get('session_id')
 
         try:
-            session = stripe.checkout.Session.retrieve(session_id)
+            payment = verification.verify_stripe(session_id)
 
-            if session.payment_status == 'paid':
-                return Response({'status': 'success', 'session_id': session.id})
+            if payment.status == api_models.VerifiedPayment.STATUS_SUCCESS:
+                return Response({'status': 'success', 'session_id': payment.reference})
             else:
                 return Response({'status': 'failed'}, status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
-            return Response({'status': 'error', 'message': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
\ No newline at end of file
+            return Response({'status': 'error', 'message': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+class PaymentWebhookAPIView(APIView):
+    """
+    Receives signed gateway events. Only the signature is checked and the
+    event stored here; ``manage.py process_webhook_events`` applies them.
+    """
+    authentication_classes = []
+    permission_classes = [AllowAny]
+    provider = None
+    signature_header = None
+
+    def parse_event(self, body, signature):
+        raise NotImplementedError
+
+    @swagger_auto_schema(auto_schema=None)
+    def post(self, request):
+        try:
+            event = self.parse_event(request.body, request.headers.get(self.signature_header))
+        except webhooks.InvalidSignature as e:
+            return Response({"error": str(e)}, status=400)
+        webhooks.enqueue(self.provider, event)
+        return Response({"received": True})
+
+
+class StripeWebhookAPIView(PaymentWebhookAPIView):
+    provider = api_models.VerifiedPayment.PROVIDER_STRIPE
+    signature_header = 'Stripe-Signature'
+    query_budget = 3
+
+    def parse_event(self, body, signature):
+        return webhooks.parse_stripe_event(body, signature)
+
+
+class PaystackWebhookAPIView(PaymentWebhookAPIView):
+    provider = api_models.VerifiedPayment.PROVIDER_PAYSTACK
+    signature_header = 'X-Paystack-Signature'
+    query_budget = 3
+
+    def parse_event(self, body, signature):
+        return webhooks.parse_paystack_event(body, signature)
@@ -0,0 +1,178 @@
+"""
+Payment webhooks.
+
+The endpoints only check the signature and store the event (one INSERT,
+duplicates ignored by the unique event id), so a delivery is acknowledged
+without any outbound call. ``process_batch`` applies stored events later:
+settled payments become ``VerifiedPayment`` rows and are linked to the
+appointments booked with their reference.
+"""
+import hashlib
+import hmac
+import json
+import logging
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from . import leases
+from . import models as api_models
+from .payments import verification
+
+logger = logging.getLogger(__name__)
+
+PAYSTACK = api_models.VerifiedPayment.PROVIDER_PAYSTACK
+STRIPE = api_models.VerifiedPayment.PROVIDER_STRIPE
+
+STRIPE_SESSION_EVENTS = {
+    'checkout.session.completed',
+    'checkout.session.async_payment_succeeded',
+    'checkout.session.async_payment_failed',
+    'checkout.session.expired',
+}
+PAYSTACK_CHARGE_EVENTS = {'charge.success'}
+
+
+class InvalidSignature(Exception):
+    pass
+
+
+def parse_stripe_event(body, signature_header):
+    """Check a ``Stripe-Signature`` header (``t=<ts>,v1=<hmac-sha256 of "<ts>.<body>">``) and return the event."""
+    secret = settings.STRIPE_WEBHOOK_SECRET
+    if not secret or not signature_header:
+        raise InvalidSignature("Missing signature")
+
+    parts = {}
+    for item in signature_header.split(','):
+        key, _, value = item.partition('=')
+        parts.setdefault(key.strip(), []).append(value.strip())
+    try:
+        timestamp = int(parts['t'][0])
+    except (KeyError, ValueError):
+        raise InvalidSignature("Malformed signature header")
+    if abs(timezone.now().timestamp() - timestamp) > settings.WEBHOOK_TOLERANCE_SECONDS:
+        raise InvalidSignature("Timestamp outside the tolerance window")
+
+    expected = hmac.new(secret.encode(), f"{timestamp}.".encode() + body, hashlib.sha256).hexdigest()
+    if not any(hmac.compare_digest(expected, candidate) for candidate in parts.get('v1', [])):
+        raise InvalidSignature("Signature mismatch")
+    return load_event(body)
+
+
+def parse_paystack_event(body, signature_header):
+    """Check an ``x-paystack-signature`` header (hmac-sha512 of the body with the secret key) and return the event."""
+    if not signature_header:
+        raise InvalidSignature("Missing signature")
+    expected = hmac.new(settings.PAYSTACK_SECRET_KEY.encode(), body, hashlib.sha512).hexdigest()
+    if not hmac.compare_digest(expected, signature_header):
+        raise InvalidSignature("Signature mismatch")
+    return load_event(body)
+
+
+def load_event(body):
+    try:
+        event = json.loads(body)
+    except ValueError:
+        raise InvalidSignature("Body is not JSON")
+    if not isinstance(event, dict):
+        raise InvalidSignature("Body is not an event")
+    return event
+
+
+def event_identity(provider, event):
+    """
+    ``(event_id, event_type)``. Paystack events carry no id, so the event name
+    and transaction id stand in. An event without either is known by the hash
+    of its content: a redelivery is still recognised, another event is not
+    taken for it.
+    """
+    event_type = str(event.get('event' if provider == PAYSTACK else 'type') or '')
+    if provider == STRIPE:
+        event_id = event.get('id')
+    else:
+        data = event.get('data')
+        transaction_id = (data.get('id') or data.get('reference')) if isinstance(data, dict) else None
+        event_id = f"{event_type}:{transaction_id}" if transaction_id else None
+    if not event_id:
+        content = json.dumps(event, sort_keys=True, separators=(',', ':')).encode()
+        event_id = f"sha256:{hashlib.sha256(content).hexdigest()}"
+    return str(event_id), event_type
+
+
+def enqueue(provider, event):
+    """Store an event for processing; a redelivery of an event already stored is ignored."""
+    event_id, event_type = event_identity(provider, event)
+    api_models.WebhookEvent.objects.bulk_create(
+        [api_models.WebhookEvent(provider=provider, event_id=event_id, event_type=event_type, payload=event)],
+        ignore_conflicts=True,
+    )
+
+
+def claim_batch(batch_size):
+    """Lease up to ``batch_size`` due events to this worker (see ``leases.claim_batch``)."""
+    return leases.claim_batch(api_models.WebhookEvent, batch_size, settings.WEBHOOK_LEASE_SECONDS)
+
+
+def payment_from_event(event):
+    """The ``(VerifiedPayment, settled)`` an event reports, or None for events we don't act on."""
+    payload = event.payload
+    if event.provider == STRIPE and event.event_type in STRIPE_SESSION_EVENTS:
+        payment, settled = verification.stripe_result(payload['data']['object'])
+        # an asynchronous payment (e.g. bank debit) that failed is final even though the session is 'complete'
+        return payment, settled or event.event_type == 'checkout.session.async_payment_failed'
+    if event.provider == PAYSTACK and event.event_type in PAYSTACK_CHARGE_EVENTS:
+        data = payload['data']
+        return verification.paystack_payment(data['reference'], data)
+    return None
+
+
+def process_batch(batch_size=None):
+    """
+    Apply one batch of due events. Returns ``(processed, dead)``.
+
+    Payments are written with one bulk insert (a reference already stored is
+    left alone: settled results don't change), then linked to appointments.
+    """
+    batch = claim_batch(batch_size or settings.WEBHOOK_BATCH_SIZE)
+    if not batch:
+        return 0, 0
+
+    payments = {}
+    dead = []
+    for event in batch:
+        try:
+            result = payment_from_event(event)
+        except Exception as e:
+            # a malformed payload won't improve on retry
+            dead.append((event, e))
+            continue
+        if result is not None and result[1]:
+            payment = result[0]
+            current = payments.get((payment.provider, payment.reference))
+            # within a batch a success outranks an earlier expiry for the same reference
+            if current is None or payment.status == api_models.VerifiedPayment.STATUS_SUCCESS:
+                payments[(payment.provider, payment.reference)] = payment
+
+    dead_ids = {event.id for event, _ in dead}
+    done = [event.id for event in batch if event.id not in dead_ids]
+    with transaction.atomic():
+        if payments:
+            api_models.VerifiedPayment.objects.bulk_create(payments.values(), ignore_conflicts=True)
+            stored = api_models.VerifiedPayment.objects.filter(reference__in={ref for _, ref in payments})
+            verification.link_appointments([p for p in stored if (p.provider, p.reference) in payments])
+        api_models.WebhookEvent.objects.filter(id__in=done).update(
+            status=api_models.WebhookEvent.STATUS_PROCESSED, processed_at=timezone.now(), claim_token=None,
+        )
+    for event, error in dead:
+        mark_dead(event, error)
+    return len(done), len(dead)
+
+
+def mark_dead(event, error):
+    event.status = api_models.WebhookEvent.STATUS_DEAD
+    event.last_error = f"{type(error).__name__}: {error}"
+    event.claim_token = None
+    event.save(update_fields=['status', 'last_error', 'claim_token'])
+    logger.error("Webhook event %s (%s %s) could not be applied: %s", event.pk, event.provider, event.event_type, event.last_error)
@@ -39,7 +39,7 @@ ALLOWED_HOSTS = []
 
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": (
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
+        "api.authentication.ClaimsJWTAuthentication",
     ),
     "DEFAULT_PERMISSION_CLASSES": [
         "rest_framework.permissions.IsAuthenticated",
@@ -78,6 +78,18 @@ SIMPLE_JWT = {
     'SLIDING_TOKEN_REFRESH_LIFETIME': timedelta(days=1),
 }
 
+# ClaimsJWTAuthentication (api/authentication.py): confirm is_active/is_staff against a cached copy
+# of the user row, refreshed on every save; the TTL bounds staleness from writes that skip signals
+AUTH_USER_STATE_CHECK = env.bool("AUTH_USER_STATE_CHECK", True)
+AUTH_USER_STATE_TTL = env.int("AUTH_USER_STATE_TTL", 60)
+# Password hashing pool (api/passwords.py): hashes running at once, requests allowed to wait for one,
+# and the Retry-After (seconds) sent with the 503 when both are full
+PASSWORD_HASHING_WORKERS = env.int("PASSWORD_HASHING_WORKERS", 2)
+PASSWORD_HASHING_QUEUE = env.int("PASSWORD_HASHING_QUEUE", 8)
+PASSWORD_HASHING_RETRY_AFTER = env.int("PASSWORD_HASHING_RETRY_AFTER", 1)
+# Expired outstanding/blacklisted refresh tokens deleted per batch by `manage.py prune_token_blacklist`
+TOKEN_PRUNE_BATCH_SIZE = env.int("TOKEN_PRUNE_BATCH_SIZE", 1000)
+
 
 
 INSTALLED_APPS = [
@@ -98,11 +110,11 @@ INSTALLED_APPS = [
     'rest_framework',
     'rest_framework_simplejwt.token_blacklist',
     'drf_yasg',
-    'anymail',
-    'django_ckeditor_5'
 ]
 
 MIDDLEWARE = [
+    'api.middleware.PerformanceMiddleware',
+    'api.middleware.HashingBusyMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -136,12 +148,86 @@ WSGI_APPLICATION = 'backend.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# SQLite by default; DB_ENGINE=postgresql uses DB_NAME, DB_USER, DB_PASSWORD, DB_HOST and DB_PORT.
+# A read replica (DB_REPLICA_NAME for an SQLite copy, DB_REPLICA_HOST for PostgreSQL) adds the
+# "replica" alias, which the read-only views read from (api/routers.py).
+DB_ENGINE = env.str("DB_ENGINE", "sqlite")
+# seconds a connection is kept for later requests (0 closes it after each one)
+DB_CONN_MAX_AGE = env.int("DB_CONN_MAX_AGE", 60)
+
+if DB_ENGINE == "postgresql":
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': env.str("DB_NAME"),
+            'USER': env.str("DB_USER", ""),
+            'PASSWORD': env.str("DB_PASSWORD", ""),
+            'HOST': env.str("DB_HOST", ""),
+            'PORT': env.str("DB_PORT", ""),
+        }
     }
-}
+    DB_REPLICA_HOST = env.str("DB_REPLICA_HOST", "")
+    DB_REPLICA = {'HOST': DB_REPLICA_HOST, 'PORT': env.str("DB_REPLICA_PORT", env.str("DB_PORT", ""))} if DB_REPLICA_HOST else None
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': env.str("DB_NAME", str(BASE_DIR / 'db.sqlite3')),
+            'OPTIONS': {
+                # seconds a writer waits for the database lock before "database is locked"
+                'timeout': 20,
+                # take the write lock when a transaction begins: a deferred transaction that reads first
+                # fails its lock upgrade outright when another writer is active, without waiting
+                'transaction_mode': env.str("SQLITE_TRANSACTION_MODE", "IMMEDIATE"),
+                # WAL lets readers run alongside the writer; synchronous=NORMAL is durable enough under WAL
+                'init_command': env.str(
+                    "SQLITE_INIT_COMMAND",
+                    "PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL; PRAGMA cache_size=-20000; "
+                    "PRAGMA temp_store=MEMORY; PRAGMA mmap_size=134217728",
+                ),
+            },
+            'TEST': {
+                # file backed so concurrent booking tests get real, separate connections
+                'NAME': BASE_DIR / 'test_db.sqlite3',
+            },
+        }
+    }
+    DB_REPLICA_NAME = env.str("DB_REPLICA_NAME", "")
+    DB_REPLICA = {'NAME': DB_REPLICA_NAME} if DB_REPLICA_NAME else None
+
+DATABASES['default']['CONN_MAX_AGE'] = DB_CONN_MAX_AGE
+DATABASES['default']['CONN_HEALTH_CHECKS'] = True
+
+if DB_REPLICA:
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        **DB_REPLICA,
+        # tests run against the primary only
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['api.routers.ReplicaRouter']
+
+
+# Cache
+# Point REDIS_URL at a shared server when running more than one worker process,
+# the catalog version used for response caching must be visible to all of them.
+
+if env.str("REDIS_URL", ""):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': env.str("REDIS_URL"),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+CATALOG_CACHE_TIMEOUT = env.int("CATALOG_CACHE_TIMEOUT", 60 * 60 * 24)
 
 
 # Password validation
@@ -182,6 +268,8 @@ STATIC_URL = 'static/'
 
 MEDIA_URL = 'media/'
 MEDIA_ROOT = BASE_DIR / 'media'
+# WebP quality of the resized service images (api/images.py); changing it gives the derivatives new names
+SERVICE_IMAGE_QUALITY = env.int("SERVICE_IMAGE_QUALITY", 80)
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
@@ -193,19 +281,86 @@ CORS_ALLOW_ALL_ORIGINS = True
 CORS_ALLOWS_CREDENTIALS = True
 
 AUTH_USER_MODEL =  "api.User"
+# ModelBackend with the password hashing on the pool of api/passwords.py
+AUTHENTICATION_BACKENDS = ['api.passwords.PooledHashingBackend']
 
 EMAIL_USE_TLS = True
 EMAIL_HOST = 'smtp.gmail.com'
 EMAIL_PORT = 587
 EMAIL_HOST_USER = env.str("EMAIL")
 EMAIL_HOST_PASSWORD = env.str("PASSWORD")
+EMAIL_TIMEOUT = env.int("EMAIL_TIMEOUT", 10)
+
+# Email outbox, drained by `python manage.py send_queued_emails`
+EMAIL_OUTBOX_BATCH_SIZE = env.int("EMAIL_OUTBOX_BATCH_SIZE", 50)
+EMAIL_OUTBOX_MAX_ATTEMPTS = env.int("EMAIL_OUTBOX_MAX_ATTEMPTS", 8)
+EMAIL_OUTBOX_BACKOFF_SECONDS = env.int("EMAIL_OUTBOX_BACKOFF_SECONDS", 30)
+EMAIL_OUTBOX_MAX_BACKOFF = env.int("EMAIL_OUTBOX_MAX_BACKOFF", 3600)
+EMAIL_OUTBOX_LEASE_SECONDS = env.int("EMAIL_OUTBOX_LEASE_SECONDS", 300)
 
 
 PAYSTACK_SECRET_KEY = env.str("PAYSTACK_SECRET_KEY")
 PAYSTACK_PUBLIC_KEY = env.str("PAYSTACK_PUBLIC_KEY")
 
+PAYSTACK_BASE_URL = env.str("PAYSTACK_BASE_URL", "https://api.paystack.co")
+
+# Outbound payment gateway calls (api/payments/client.py)
+PAYMENT_GATEWAY_CONNECT_TIMEOUT = env.float("PAYMENT_GATEWAY_CONNECT_TIMEOUT", 3.05)
+PAYMENT_GATEWAY_READ_TIMEOUT = env.float("PAYMENT_GATEWAY_READ_TIMEOUT", 10.0)
+PAYMENT_GATEWAY_RETRIES = env.int("PAYMENT_GATEWAY_RETRIES", 2)
+PAYMENT_GATEWAY_POOL_SIZE = env.int("PAYMENT_GATEWAY_POOL_SIZE", 10)
+PAYMENT_GATEWAY_BREAKER_THRESHOLD = env.int("PAYMENT_GATEWAY_BREAKER_THRESHOLD", 5)
+PAYMENT_GATEWAY_BREAKER_RESET = env.float("PAYMENT_GATEWAY_BREAKER_RESET", 30.0)
+
 STRIPE_SECRET_KEY = env.str("STRIPE_SECRET_KEY")
 STRIPE_PUB_KEY = env.str("STRIPE_PUB_KEY")
+STRIPE_API_BASE = env.str("STRIPE_API_BASE", "https://api.stripe.com")
+STRIPE_WEBHOOK_SECRET = env.str("STRIPE_WEBHOOK_SECRET", "")
+
+# Payment webhooks (api/webhooks.py), processed by `manage.py process_webhook_events`
+WEBHOOK_TOLERANCE_SECONDS = env.int("WEBHOOK_TOLERANCE_SECONDS", 300)
+WEBHOOK_BATCH_SIZE = env.int("WEBHOOK_BATCH_SIZE", 100)
+WEBHOOK_LEASE_SECONDS = env.int("WEBHOOK_LEASE_SECONDS", 300)
+
+# Booking hours used by the availability engine
+SALON_OPENING_TIME = env.str("SALON_OPENING_TIME", "09:00")
+SALON_CLOSING_TIME = env.str("SALON_CLOSING_TIME", "17:00")
+BOOKING_SLOT_MINUTES = env.int("BOOKING_SLOT_MINUTES", 30)
+# longest range, in days, the availability calendar answers in one request
+AVAILABILITY_MAX_DAYS = env.int("AVAILABILITY_MAX_DAYS", 60)
+
+# Rows validated and written together by the bulk appointment import (api/imports.py)
+APPOINTMENT_IMPORT_BATCH_SIZE = env.int("APPOINTMENT_IMPORT_BATCH_SIZE", 1000)
+
+# Staff analytics (api/rollups.py): longest range one request reports on, and days recomputed per transaction
+# by `manage.py refresh_rollups` and `manage.py rebuild_rollups`
+ANALYTICS_MAX_DAYS = env.int("ANALYTICS_MAX_DAYS", 366)
+ROLLUP_REBUILD_BATCH_DAYS = env.int("ROLLUP_REBUILD_BATCH_DAYS", 31)
+
+# Import time a new worker may spend loading the app (`manage.py profile_startup --check` fails past it)
+COLD_START_BUDGET_MS = env.int("COLD_START_BUDGET_MS", 1000)
+
+# Request instrumentation (api/middleware.py): Server-Timing exposes internals, so it is off unless DEBUG
+SERVER_TIMING_HEADER = env.bool("SERVER_TIMING_HEADER", DEBUG)
+PERFORMANCE_LOG_LEVEL = env.str("PERFORMANCE_LOG_LEVEL", "INFO")
+# Raise instead of logging a warning when a request goes over its view's query_budget; the test runner turns it on
+QUERY_BUDGET_ENFORCED = env.bool("QUERY_BUDGET_ENFORCED", False)
+TEST_RUNNER = 'api.testing.QueryBudgetTestRunner'
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "formatters": {
+        "plain": {"format": "%(asctime)s %(levelname)s %(name)s %(message)s"},
+    },
+    "handlers": {
+        "console": {"class": "logging.StreamHandler", "formatter": "plain"},
+    },
+    "loggers": {
+        # one JSON line per request
+        "api.performance": {"handlers": ["console"], "level": PERFORMANCE_LOG_LEVEL, "propagate": False},
+    },
+}
 
 # Custom Admin Settings
 JAZZMIN_SETTINGS = {
@@ -305,4 +460,8 @@ SWAGGER_SETTINGS = {
         }
     },
     'USE_SESSION_AUTH': False,  # hides the login form
-}
\ No newline at end of file
+    'SPEC_URL': 'openapi-schema',  # the prebuilt schema (api/openapi.py)
+}
+
+# Generated by `manage.py build_openapi_schema`; the docs at / serve this file instead of introspecting the API
+OPENAPI_SCHEMA_PATH = env.str("OPENAPI_SCHEMA_PATH", str(BASE_DIR / 'openapi.json'))
\ No newline at end of file
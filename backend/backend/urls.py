@@ -17,29 +17,14 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 
-from drf_yasg.views import get_schema_view
-from drf_yasg import openapi
-from rest_framework import permissions
-from rest_framework_simplejwt.authentication import JWTAuthentication
 from django.conf import settings
 from django.conf.urls.static import static
 
-schema_view = get_schema_view(
-    openapi.Info(
-        title="Booking Backend APIs",
-        default_version="v1",
-        description="This is the documentation for the booking backend API",
-        terms_of_service="http://mywbsite.com/policies/",
-        contact=openapi.Contact(email="ahalomzymike@gmail.com"),
-        license=openapi.License(name="BSD Licence"),
-    ),
-    public=True,
-    permission_classes=(permissions.AllowAny, ),
-    authentication_classes=(JWTAuthentication,),
-)
+from api import openapi
 
 urlpatterns = [
-    path("", schema_view.with_ui('swagger', cache_timeout=0), name="schema-swagger-ui"),
+    path("", openapi.swagger_ui, name="schema-swagger-ui"),
+    path("openapi.json", openapi.schema_json, name="openapi-schema"),
     path('admin/', admin.site.urls),
     path('api/v1/', include('api.urls')),
 ]
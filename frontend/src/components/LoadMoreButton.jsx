@@ -0,0 +1,19 @@
+import React from 'react';
+
+const LoadMoreButton = ({ hasMore, isLoading, onClick }) => {
+  if (!hasMore) return null;
+
+  return (
+    <div className="flex justify-center">
+      <button
+        onClick={onClick}
+        disabled={isLoading}
+        className="bg-gray-200 text-gray-700 py-2 px-6 rounded-md font-medium hover:bg-gray-300 transition-colors disabled:opacity-50"
+      >
+        {isLoading ? 'Loading...' : 'Load more'}
+      </button>
+    </div>
+  );
+};
+
+export default LoadMoreButton;
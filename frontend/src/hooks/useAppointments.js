@@ -4,12 +4,20 @@ import useAuth from './useAuth';
 
 export const useAppointments = () => {
   const [appointments, setAppointments] = useState([]);
+  // appointment lists are cursor paginated: the first page is shown, `next` is followed when more are asked for
+  const [nextPage, setNextPage] = useState(null);
+  const [isLoadingMore, setIsLoadingMore] = useState(false);
   const { user, isAdmin } = useAuth();
 
+  const fetchFirstPage = async (url) => {
+    const res = await api.get(url);
+    setAppointments(res.data.results);
+    setNextPage(res.data.next);
+  };
+
   const fetchAppointments = async () => {
     try {
-      const res = await api.get('appointments/my/');
-      setAppointments(res.data);
+      await fetchFirstPage('appointments/my/');
     } catch (err) {
       console.error('Error fetching appointments', err);
     }
@@ -17,13 +25,26 @@ export const useAppointments = () => {
 
   const fetchAdminAppointments = async () => {
     try {
-      const res = await api.get('appointments/admin');
-      setAppointments(res.data);
+      await fetchFirstPage('appointments/admin/');
     } catch (err) {
       console.error("Error fetching appointments", err)
     }
   };
 
+  const loadMoreAppointments = async () => {
+    if (!nextPage || isLoadingMore) return;
+    setIsLoadingMore(true);
+    try {
+      const res = await api.get(nextPage);
+      setAppointments((loaded) => [...loaded, ...res.data.results]);
+      setNextPage(res.data.next);
+    } catch (err) {
+      console.error('Error loading more appointments', err);
+    } finally {
+      setIsLoadingMore(false);
+    }
+  };
+
 
   useEffect(() => {
     if (isAdmin) {
@@ -88,5 +109,8 @@ export const useAppointments = () => {
     updateAppointment,
     deleteAppointment,
     fetchAppointments,
+    hasMoreAppointments: Boolean(nextPage),
+    isLoadingMore,
+    loadMoreAppointments,
   };
 };
@@ -3,10 +3,18 @@ import { useNavigate } from 'react-router-dom';
 import { format } from 'date-fns';
 import { Calendar, Clock, User, Phone, Mail, X, CheckCircle, AlertCircle, Edit, Trash2 } from 'lucide-react';
 import { useAppointments } from '../hooks/useAppointments';
+import LoadMoreButton from '../components/LoadMoreButton';
 
 const AdminPage = () => {
   const navigate = useNavigate();
-  const { appointments, updateAppointment, deleteAppointment } = useAppointments();
+  const {
+    appointments,
+    updateAppointment,
+    deleteAppointment,
+    hasMoreAppointments,
+    isLoadingMore,
+    loadMoreAppointments,
+  } = useAppointments();
   const [selectedStatus, setSelectedStatus] = useState('all');
   const [selectedAppointment, setSelectedAppointment] = useState(null);
 
@@ -248,6 +256,12 @@ const AdminPage = () => {
               <p className="text-gray-500">There are no appointments matching your current filter.</p>
             </div>
           )}
+
+          <LoadMoreButton
+            hasMore={hasMoreAppointments}
+            isLoading={isLoadingMore}
+            onClick={loadMoreAppointments}
+          />
         </div>
 
         {/* Appointment Details Modal */}
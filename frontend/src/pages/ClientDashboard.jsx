@@ -3,6 +3,7 @@ import { useLocation, useNavigate } from 'react-router-dom';
 import { format, isFuture, isPast } from 'date-fns';
 import { Calendar, Clock, User, Phone, Mail, CreditCard, Edit, Trash2, Plus } from 'lucide-react';
 import { useAppointments } from '../hooks/useAppointments';
+import LoadMoreButton from '../components/LoadMoreButton';
 import { useAuth } from '../hooks/useAuth';
 import ConfirmationModal from '../components/ConfirmationModal';
 import Toast from '../components/Toast';
@@ -10,7 +11,14 @@ import Toast from '../components/Toast';
 const ClientDashboard = () => {
   const location = useLocation();
   const navigate = useNavigate();
-  const { appointments, updateAppointment, deleteAppointment } = useAppointments();
+  const {
+    appointments,
+    updateAppointment,
+    deleteAppointment,
+    hasMoreAppointments,
+    isLoadingMore,
+    loadMoreAppointments,
+  } = useAppointments();
   const { user, isLoading } = useAuth();
   const [selectedTab, setSelectedTab] = useState('upcoming');
   const [confirmModal, setConfirmModal] = useState({ isOpen: false, type: '', appointmentId: null });
@@ -285,6 +293,12 @@ const ClientDashboard = () => {
               )}
             </>
           )}
+
+          <LoadMoreButton
+            hasMore={hasMoreAppointments}
+            isLoading={isLoadingMore}
+            onClick={loadMoreAppointments}
+          />
         </div>
 
         {/* Confirmation Modal */}